@@ -25,8 +25,16 @@
 The nicos package contains all standard NICOS commands and devices.
 """
 
+import importlib.util
+import os
 import sys
-from logging import getLogger
+
+if os.environ.get('NICOS_STARTUP_PROFILE'):
+    # must come first, to record all following imports
+    from nicos import startupprofile  # isort:skip
+    startupprofile.install(os.environ['NICOS_STARTUP_PROFILE'])
+
+from logging import getLogger  # isort:skip
 
 # Provide the config object.
 from nicos.configmod import config
@@ -56,9 +64,35 @@ def get_custom_version():
         return None
 
 
-try:
-    # numpy 1.14+ compat
-    import numpy
-    numpy.set_printoptions(sign=' ')
-except Exception:
-    pass
+class _NumpySetup:
+    """Import hook that sets the numpy print options as soon as numpy is
+    imported, without importing numpy here.
+    """
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname != 'numpy':
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(fullname)
+        if spec is not None and spec.loader is not None:
+            exec_module = spec.loader.exec_module
+
+            def exec_and_setup(module):
+                exec_module(module)
+                _setup_numpy(module)
+            spec.loader.exec_module = exec_and_setup
+        return spec
+
+
+def _setup_numpy(numpy):
+    try:
+        # numpy 1.14+ compat
+        numpy.set_printoptions(sign=' ')
+    except Exception:
+        pass
+
+
+if 'numpy' in sys.modules:
+    _setup_numpy(sys.modules['numpy'])
+else:
+    sys.meta_path.insert(0, _NumpySetup())
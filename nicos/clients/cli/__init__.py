@@ -111,6 +111,9 @@ class NicosCmdClient(NicosClient):
         self.in_question = False
         self.in_editing = False
         self.tip_shown = False
+        # time and sequence number of the oldest message printed from the
+        # daemon's history
+        self.log_totime = None
         # number of automatic reconnect tries before giving up
         self.reconnect_count = 0
         self.reconnect_time = 0
@@ -291,6 +294,8 @@ class NicosCmdClient(NicosClient):
                 'Replaying output (enter "/log" to see more)...' %
                 (self.host, self.port, self.conndata.user))
             output = self.ask('getmessages', str(self.tsize[1] - 3), default=[])
+            if output:
+                self.log_totime = [output[0][1]] + output[0][6:]
             for msg in output:
                 self.put_message(msg)
             if not self.tip_shown:
@@ -866,15 +871,34 @@ class NicosCmdClient(NicosClient):
         elif cmd in ('h', 'help', '?'):
             self.help(arg)
         elif cmd == 'log':
-            if arg:
-                n = str(int(arg))  # make sure it's an integer
+            args = arg.split()
+            more = args[:1] == ['more']
+            if more:
+                args = args[1:]
+                if self.compat_proto and self.compat_proto < 24:
+                    self.put_error('The daemon does not support paging '
+                                   'through the message history.')
+                    return
+            if args:
+                n = str(int(args[0]))  # make sure it's an integer
+            elif more:
+                n = str(self.tsize[1] - 3)
             else:
                 n = '*'  # as a slice index, this means "unlimited"
             # this can take a while to transfer, but we don't want to cache
             # messages in this client just for this command
-            messages = self.ask('getmessages', n)
+            if more:
+                # page back from the oldest message printed so far
+                messages = self.ask('getmessages', n, None, self.log_totime)
+            else:
+                messages = self.ask('getmessages', n)
             if messages is None:
                 return
+            if messages:
+                self.log_totime = [messages[0][1]] + messages[0][6:]
+            elif more:
+                self.put_client('No older messages.')
+                return
             self.put_client('Printing %s previous messages.' %
                             (n if n != '*' else 'all'))
             for msg in messages:
@@ -1051,6 +1075,7 @@ This client supports "meta-commands" beginning with a slash:
 
   /w(here)            -- print current script and location in it
   /log (n)            -- print more past output, n lines or everything
+  /log more (n)       -- print n lines of output before the last printed
   /break              -- pause script after next scan step or script command
   /cont(inue)         -- continue paused script
   /pause              -- pause script immediately
@@ -46,7 +46,7 @@ from nicos.guisupport.qt import QActionGroup, QByteArray, QDialog, \
     QToolBar, QWidget, pyqtSignal, pyqtSlot
 from nicos.guisupport.qtgr import MouseEvent
 from nicos.protocols.cache import cache_load
-from nicos.utils import BoundedOrderedDict, ReaderRegistry, safeName
+from nicos.utils import LRUCache, ReaderRegistry, safeName
 
 try:
     from nicos.utils.gammafilter import gam_rem_adp_log
@@ -74,11 +74,26 @@ DEFAULTS = dict(
 )
 
 
-def readDataFromFile(filename, filetype):
+def cachedDataSize(entry):
+    """Return the memory used by the arrays of a live data cache entry."""
+    return sum(getattr(array, 'nbytes', 0)
+               for array in entry.get('dataarrays', ()))
+
+
+def readDataFromFile(filename, filetype, mapped=False):
+    """Read the data array of a file.
+
+    Readers of binary formats return a memory map of the file.  Since the
+    files of a running measurement are rewritten in place, the data is copied
+    unless *mapped* is true, which is only safe for files that are complete.
+    """
     try:
-        return ReaderRegistry.getReaderCls(filetype).fromfile(filename)
+        array = ReaderRegistry.getReaderCls(filetype).fromfile(filename)
     except KeyError:
         raise NicosError('Unsupported file format %r' % filetype) from None
+    if not mapped and isinstance(array, numpy.memmap):
+        return numpy.array(array)
+    return array
 
 
 class LiveDataPanel(PlotPanel):
@@ -96,6 +111,9 @@ class LiveDataPanel(PlotPanel):
       shown.
     * ``cachesize`` (default 20) - Number of entries in the live data cache.
       The live data cache allows displaying of previously measured data.
+    * ``cachememory`` (default 1024) - Memory in MiB that the arrays in the
+      live data cache may use.  The least recently shown entries are dropped
+      from the cache first, and read from their files again when needed.
     * ``liveonlyindex`` (default None) - Enable live only view. This disables
       interaction with the liveDataPanel and only displays the dataset of the
       set index.
@@ -189,7 +207,10 @@ class LiveDataPanel(PlotPanel):
         self._allowed_detectors = set()
         self._range_active = False
         self._cachesize = 20
+        self._cachememory = 1024
         self._livewidgets = {}  # livewidgets for rois: roi_key -> widget
+        # files of the last file event, which may still be written
+        self._lastfiles = set()
         self._fileopen_filter = None
         self.widget = None
         self.menu = None
@@ -289,7 +310,10 @@ class LiveDataPanel(PlotPanel):
         self._cachesize = options.get('cachesize', self._cachesize)
         if self._cachesize < 1 or self._liveOnlyIndex is not None:
             self._cachesize = 1  # always cache the last live image
-        self._datacache = BoundedOrderedDict(maxlen=self._cachesize)
+        self._cachememory = options.get('cachememory', self._cachememory)
+        self._datacache = LRUCache(maxlen=self._cachesize,
+                                   maxbytes=self._cachememory * 1024 * 1024,
+                                   sizeof=cachedDataSize)
 
         self._initControlsGUI()
 
@@ -710,6 +734,8 @@ class LiveDataPanel(PlotPanel):
         # TODO: allow multiple fileformats?
         #       would need to modify input from DemonSession.notifyDataFile
 
+        self._lastfiles = {filedesc['filename']
+                           for filedesc in params['filedescs']}
         for i, filedesc in enumerate(params['filedescs']):
             # uids must match with uids in live events (_process_livedata)
             uid = self.getIndexedUID(params, i)
@@ -781,6 +807,8 @@ class LiveDataPanel(PlotPanel):
                 self.log.debug('add to cache: %s', uid)
                 self._datacache[uid] = {}
             self._datacache[uid]['dataarrays'] = arrays
+            self._datacache.touch(uid)
+            self._datacache.shrink()
         if display:
             if uid:
                 if titles is None:
@@ -792,11 +820,15 @@ class LiveDataPanel(PlotPanel):
                 widget.setData(arrays, labels)
                 widget.setTitles(titles)
 
-    def setDataFromFile(self, filename, filetype, uid=None, display=True):
+    def setDataFromFile(self, filename, filetype, uid=None, display=True,
+                        mapped=False):
         """Load data array from file and dispatch to live widgets using
         ``setData``. Do not use caching if uid is ``None``.
+
+        The file is only kept mapped if *mapped* is true, see
+        `readDataFromFile`.
         """
-        array = readDataFromFile(filename, filetype)
+        array = readDataFromFile(filename, filetype, mapped)
         if array is not None:
             self.setData([array], uid=uid, display=display)
             return array.shape
@@ -896,14 +928,16 @@ class LiveDataPanel(PlotPanel):
         uid = item.data(FILEUID)
         # data is cached
         if uid and hasattr(self, '_datacache') and uid in self._datacache:
+            self._datacache.touch(uid)
             return self._datacache[uid]
         # cache has cleared data or data has not been cached in the first place
-        elif uid is None and item.data(FILETAG) == FILE:
+        elif item.data(FILETAG) == FILE:
             filename = item.data(FILENAME)
             filetype = item.data(FILETYPE)
 
             if path.isfile(filename):
-                rawdata = readDataFromFile(filename, filetype)
+                rawdata = readDataFromFile(filename, filetype,
+                                           filename not in self._lastfiles)
                 labels = {}
                 titles = {}
                 for axis, entry in zip(AXES, reversed(rawdata.shape)):
@@ -914,6 +948,12 @@ class LiveDataPanel(PlotPanel):
                     'titles': titles,
                     'dataarrays': [rawdata]
                 }
+                if hasattr(self, '_datacache'):
+                    # cache again, possibly dropping other entries
+                    uid = uuid4()
+                    self._datacache[uid] = data
+                    item.setData(FILEUID, uid)
+                    self.remove_obsolete_cached_files()
                 return data
             # else:
             # TODO: mark for deletion on item changed?
@@ -1033,7 +1073,8 @@ class LiveDataPanel(PlotPanel):
             # setDataFromFile may raise an `NicosException`, e.g.
             # if the file cannot be opened.
             try:
-                self.setDataFromFile(fn, filetype, uid, display=False)
+                self.setDataFromFile(fn, filetype, uid, display=False,
+                                     mapped=True)
             except Exception as err:
                 errors.append('%s: %s' % (fn, err))
             else:
@@ -29,6 +29,7 @@ from nicos.clients.gui.panels import Panel, PanelDialog
 from nicos.clients.gui.utils import dialogFromUi, loadUi
 from nicos.core import ConfigurationError
 from nicos.core.params import mailaddress, vec3
+from nicos.core.sessions.setups import SetupGraph
 from nicos.devices.sxtal.xtal.sxtalcell import SXTalCell
 from nicos.guisupport import typedvalue
 from nicos.guisupport.qt import QComboBox, QDialog, QDialogButtonBox, QFrame, \
@@ -446,6 +447,7 @@ class SetupsPanel(Panel):
         self._aliasWidgets = {}
         self._alias_config = None
         self._setupinfo = {}
+        self._setupgraph = SetupGraph({})
         self._loaded = set()
         self._loaded_basic = None
         self._prev_aliases = {}
@@ -465,6 +467,7 @@ class SetupsPanel(Panel):
     def on_client_connected(self):
         # fill setups
         self._setupinfo = self.client.eval('session.readSetupInfo()', {})
+        self._setupgraph = SetupGraph(self._setupinfo or {})
         all_loaded = self.client.eval('session.loaded_setups', set())
         self._prev_aliases = self.client.eval(
             '{d.name: d.alias for d in session.devices.values() '
@@ -603,18 +606,8 @@ class SetupsPanel(Panel):
     def updateAliasList(self):
         setups, _ = self._calculateSetups()
         # get includes as well
-        seen = set()
-
-        def add_includes(s):
-            if s in seen or s not in self._setupinfo:
-                return
-            seen.add(s)
-            for inc in self._setupinfo[s]['includes']:
-                add_includes(inc)
-                setups.add(inc)
-
-        for setup in setups.copy():
-            add_includes(setup)
+        setups = {setup for setup in self._setupgraph.closure(setups)
+                  if self._setupinfo.get(setup)}
         # now collect alias config
         alias_config = {}
         for setup in setups:
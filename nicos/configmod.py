@@ -31,8 +31,6 @@ import sys
 from os import path
 from re import compile as regexcompile, escape as regexescape
 
-import toml
-
 
 class config:
     """Singleton for settings potentially overwritten later."""
@@ -51,6 +49,8 @@ class config:
     setup_subdirs = []  # setup groups to be used, as a list
     pid_path = 'pid'
     logging_path = 'log'
+    setup_cache_path = None
+    device_create_threads = 0  # create devices in parallel if > 1
     systemd_props = []  # additional systemd Service properties
 
     simple_mode = False
@@ -123,6 +123,7 @@ def readToml(filename):
     """Read a single TOML configuration file, or return an empty dict
     if it doesn't exist.
     """
+    import toml
     try:
         with open(filename, encoding='utf-8') as fp:
             return toml.load(fp)
@@ -27,8 +27,6 @@ import inspect
 import re
 from time import time as currenttime
 
-import numpy
-
 from nicos import session
 from nicos.core import status
 from nicos.core.constants import MASTER, POLLER, SIMULATION, SLAVE
@@ -311,6 +309,10 @@ class Device(metaclass=DeviceMeta):
     # should have their actions simulated.
     hardware_access = True
 
+    # Set this to False on devices that update the cache themselves, so that
+    # the poller does not need to poll them.
+    needs_polling = True
+
     # This is set by NICOS to indicate that do-methods should be intercepted
     # and their result simulated.  Combines hardware_access and device mode
     # at runtime.
@@ -2087,6 +2089,7 @@ class Measurable(Waitable):
         FINAL, or INTERRUPTED.
         """
         if self._sim_intercept:
+            import numpy
             arrtypes = self.arrayInfo()
             return [numpy.zeros(arrtype.shape) for arrtype in arrtypes]
         result = self.doReadArrays(quality)
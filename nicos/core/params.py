@@ -25,10 +25,9 @@
 
 import copy
 import re
+import sys
 from os import path
 
-import numpy as np
-
 from nicos.core.errors import ConfigurationError, ProgrammingError
 from nicos.utils import decodeAny, parseHostPort, readonlydict, readonlylist
 
@@ -479,7 +478,7 @@ class ArrayDesc:
         """
         self.name = name
         self.shape = shape
-        self.dtype = np.dtype(dtype)
+        self.dtype = _numpy().dtype(dtype)
         if dimnames is None:
             dimnames = ['X', 'Y', 'Z', 'T', 'E', 'U', 'V', 'W'][:len(shape)]
         self.dimnames = dimnames
@@ -497,6 +496,22 @@ class ArrayDesc:
 _notset = object()
 
 
+def _numpy():
+    """Return the numpy module, which is imported on first use to keep it
+    out of the import of nicos.core.
+    """
+    import numpy
+    return numpy
+
+
+def _is_sequence(val):
+    """Check for a list, tuple or numpy array, without importing numpy."""
+    if isinstance(val, (list, tuple)):
+        return True
+    np = sys.modules.get('numpy')
+    return np is not None and isinstance(val, np.ndarray)
+
+
 def convdoc(conv):
     if isinstance(conv, type):
         return conv.__name__
@@ -544,7 +559,7 @@ class listof:
 
     def __call__(self, val=None):
         val = val if val is not None else []
-        if not isinstance(val, (list, tuple, np.ndarray)):
+        if not _is_sequence(val):
             raise ValueError('value needs to be a list')
         return readonlylist(map(self.conv, val))
 
@@ -558,7 +573,7 @@ class nonemptylistof:
     def __call__(self, val=None):
         if val is None:
             return readonlylist([self.conv()])
-        if not isinstance(val, (list, tuple, np.ndarray)) or len(val) < 1:
+        if not _is_sequence(val) or len(val) < 1:
             raise ValueError('value needs to be a nonempty list')
         return readonlylist(map(self.conv, val))
 
@@ -584,7 +599,7 @@ class tupleof:
     def __call__(self, val=None):
         if val is None:
             return tuple(type() for type in self.types)
-        if not isinstance(val, (list, tuple, np.ndarray)) or \
+        if not _is_sequence(val) or \
            not len(self.types) == len(val):
             raise ValueError('value needs to be a %d-tuple' % len(self.types))
         return tuple(t(v) for (t, v) in zip(self.types, val))
@@ -593,7 +608,7 @@ class tupleof:
 def limits(val=None):
     """a tuple of lower and upper limit"""
     val = val if val is not None else (0, 0)
-    if not isinstance(val, (list, tuple, np.ndarray)) or len(val) != 2:
+    if not _is_sequence(val) or len(val) != 2:
         raise ValueError('value must be a list or tuple and have 2 elements')
     ll = float(val[0])
     ul = float(val[1])
@@ -27,8 +27,6 @@
 from contextlib import contextmanager
 from time import time as currenttime
 
-from numpy import array_equal, ndarray
-
 from nicos import session
 from nicos.core import status
 from nicos.core.acquire import CountResult, DevStatistics, acquire, \
@@ -136,6 +134,8 @@ class Scan:
         self._xindex = 0
         if len(self._startpositions) <= self._mscount:
             return
+        from numpy import array_equal, ndarray
+
         # iterate over devices (only primary scan devices)
         for j, dev in enumerate(self._devices[:self._primary_devicesindex]):
             valueInfo = dev.valueInfo()
@@ -36,20 +36,22 @@ import logging
 import os
 import stat
 import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from os import path
 from shutil import which
 from time import sleep, time as currenttime
 
 import numpy
 
-from nicos import config, get_custom_version, nicos_version
+from nicos import config, get_custom_version, nicos_version, startupprofile
 from nicos.core.acquire import stop_acquire_thread
 from nicos.core.constants import MAIN
 from nicos.core.data import DataSink
 from nicos.core.device import Device, DeviceAlias, DeviceMeta
 from nicos.core.errors import AccessError, CacheError, ConfigurationError, \
     ModeError, NicosError, UsageError
-from nicos.core.sessions.setups import readSetups
+from nicos.core.sessions.setups import SetupGraph, readSetups
 from nicos.core.sessions.utils import EXECUTIONMODES, MAINTENANCE, MASTER, \
     SIMULATION, SLAVE, AttributeRaiser, NicosNamespace, SimClock, \
     guessCorrectCommand, makeSessionId, sessionInfo
@@ -132,8 +134,18 @@ class Session:
         self._failed_devices = None
         self._success_devices = None
         self._multi_level = 0
+        # while devices are created in parallel: maps names of devices being
+        # created to the (thread ident, event) of their creation
+        self._creating = None
+        # marks the threads creating devices in parallel
+        self._creation_thread = threading.local()
+        # device classes resolved while autocreating the devices of a setup:
+        # device name -> (class, configuration)
+        self._device_classes = {}
         # info about all loadable setups
         self._setup_info = {}
+        # relations between the setups, computed from the setup info
+        self._setup_graph = None
         # namespace to place user-accessible items in
         self.namespace = NicosNamespace()
         # contains all NICOS-exported names
@@ -455,9 +467,15 @@ class Session:
         """Read information of all existing setups, and validate them.
 
         Setup modules are looked for in subdirectories of the configured
-        "setup_package".
+        "setup_package".  If a "setup_cache_path" is configured, the
+        information is cached there, so that only changed setups are read
+        again.
         """
-        return readSetups(self._setup_paths, self.log)
+        cachefile = None
+        if config.setup_cache_path:
+            cachefile = path.join(config.nicos_root, config.setup_cache_path,
+                                  'setups.pickle')
+        return readSetups(self._setup_paths, self.log, cachefile)
 
     def getSetupInfo(self):
         """Return information about all existing setups.
@@ -487,6 +505,16 @@ class Session:
         """Refresh the session's setup info."""
         self._setup_info = self.readSetupInfo()
 
+    def getSetupGraph(self):
+        """Return the `.SetupGraph` with the relations between all setups.
+
+        It is computed only once for each setup info read.
+        """
+        if self._setup_graph is None or \
+           self._setup_graph.info is not self._setup_info:
+            self._setup_graph = SetupGraph(self._setup_info)
+        return self._setup_graph
+
     def _nicos_import(self, modname, member='*'):
         mod = __import__(modname, None, None, [member])
         if member == '*':
@@ -502,36 +530,22 @@ class Session:
         """
         if not self._setup_info:
             self.readSetups()
+        graph = self.getSetupGraph()
 
-        def add_setup(name, include_chain):
-            if name not in self._setup_info:
-                msg = "Setup '%s' does not exist" % name
-                if include_chain:
-                    msg += ' (included by %s)' % '->'.join(include_chain)
-                raise ConfigurationError(msg)
-            all_setups.add(name)
-            include_chain.append(name)
-            for include in self._setup_info[name]['includes']:
-                if include not in all_setups:
-                    add_setup(include, include_chain)
-            include_chain.pop()
-
-        # generate a set of *all* setups loaded after adding new setups
-        all_setups = loaded_setups.copy()
         for name in new_setups:
-            add_setup(name, [])
-
-        # generate a list of exclusions
-        excluded_setups = {}
-        for name in all_setups:
-            for exclude in self._setup_info[name]['excludes']:
-                excluded_setups.setdefault(exclude, set()).add(name)
+            if name not in graph:
+                raise ConfigurationError("Setup '%s' does not exist" % name)
+            missing = graph.missing([name])
+            if missing:
+                missing = min(missing)
+                chain = graph.includeChain(name, missing)[:-1]
+                raise ConfigurationError(
+                    "Setup '%s' does not exist (included by %s)" %
+                    (missing, '->'.join(chain)))
 
-        conflicts = set()
-        for name in all_setups:
-            if name in excluded_setups:
-                for excl in excluded_setups[name]:
-                    conflicts.add((name, excl))
+        # generate a set of *all* setups loaded after adding new setups
+        all_setups = set(loaded_setups) | graph.closure(new_setups)
+        conflicts = graph.conflicts(all_setups)
 
         if conflicts:
             self.log.error('Setup conflicts:')
@@ -708,19 +722,33 @@ class Session:
             autocreate_devices = self.autocreate_devices
         if autocreate_devices:
             self.log.debug('autocreating devices...')
-            for devname, (_, devconfig) in sorted(devlist.items()):
-                try:
-                    explicit = 'namespace' in devconfig.get('visibility',
-                                                            set())
-                    dev = self.createDevice(devname, explicit=explicit)
-                    if not explicit and ('namespace' in dev.visibility):
-                        self.explicit_devices.add(devname)
-                        self.export(devname, dev)
-                except Exception:
-                    if raise_failed:
-                        raise
-                    self.log.exception("device '%s' failed to create", devname)
-                    failed_devs.append(devname)
+            # create independent devices in parallel first, and the rest
+            # (including exporting) in the usual order
+            parallel_failed = {}
+            try:
+                if self._mode != SIMULATION and len(devlist) > 1:
+                    self._preconnectDevices(sorted(devlist))
+                if config.device_create_threads > 1 and len(devlist) > 1:
+                    parallel_failed = self._createDevicesParallel(
+                        sorted(devlist), config.device_create_threads)
+                for devname, (_, devconfig) in sorted(devlist.items()):
+                    try:
+                        if devname in parallel_failed:
+                            raise parallel_failed[devname]
+                        explicit = 'namespace' in devconfig.get('visibility',
+                                                                set())
+                        dev = self.createDevice(devname, explicit=explicit)
+                        if not explicit and ('namespace' in dev.visibility):
+                            self.explicit_devices.add(devname)
+                            self.export(devname, dev)
+                    except Exception:
+                        if raise_failed:
+                            raise
+                        self.log.exception("device '%s' failed to create",
+                                           devname)
+                        failed_devs.append(devname)
+            finally:
+                self._device_classes.clear()
 
         # validate and try to attach sysconfig devices
         self.log.debug('creating sysconfig devices...')
@@ -782,6 +810,7 @@ class Session:
                            list(self.explicit_setups))
         if setupnames:
             self.log.info('setups loaded: %s', ', '.join(setupnames))
+        startupprofile.write_report()
 
         self.help_topics = self.readHelpTopics()
 
@@ -1079,10 +1108,15 @@ class Session:
         If given, it is a tuple of ``(old_class, new_class, new_devconfig)``.
         """
         if isinstance(dev, str):
+            if self._creating:
+                # devices being initialized by other threads are only
+                # handed out when complete
+                self._waitCreated(dev)
             if dev in self.devices:
                 dev = self.devices[dev]
             elif dev in self.configured_devices:
-                if self.checkParallel():
+                if self.checkParallel() and \
+                   not getattr(self._creation_thread, 'active', False):
                     raise NicosError('cannot create devices in parallel '
                                      'threads')
                 dev = self.createDevice(dev, replace_classes=replace_classes)
@@ -1100,6 +1134,148 @@ class Session:
                              'device must be a %s' % (cls or Device).__name__)
         return dev
 
+    def _waitCreated(self, devname, timeout=60):
+        """Wait until a device being created by another thread is
+        initialized (or has failed).
+        """
+        ident, event = (self._creating or {}).get(devname, (None, None))
+        if event is None or ident == threading.get_ident():
+            return
+        if not event.wait(timeout):
+            # probably a dependency cycle between devices of different
+            # threads that does not go through attached devices
+            raise NicosError("timeout waiting for creation of device '%s' "
+                             'in another thread' % devname)
+
+    def _attachedDeviceNames(self, devname):
+        """Return the configured names of the devices attached to *devname*.
+        """
+        devcls, devconfig = self.importDevice(devname)
+        config = {key.lower(): value for (key, value) in devconfig.items()}
+        result = set()
+        for aname in devcls.attached_devices:
+            value = config.get(aname.lower())
+            for name in value if isinstance(value, (list, tuple)) \
+                    else [value]:
+                if isinstance(name, str) and name in self.configured_devices:
+                    result.add(name)
+        return result
+
+    def _createDevicesParallel(self, devnames, nthreads):
+        """Create the given devices and their attached devices using a pool
+        of *nthreads* threads.
+
+        A device is created only after all its attached devices have been
+        created.  Devices that are not created here (because they or their
+        attached devices failed, or because of cyclic dependencies) are left
+        to be created in the normal way.
+
+        Returns a dictionary of device names to creation errors.
+        """
+        # determine the dependencies of all devices that need to be created
+        deps = {}
+        todo = [name for name in devnames if name not in self.devices]
+        while todo:
+            name = todo.pop()
+            if name in deps or name in self.devices:
+                continue
+            try:
+                deps[name] = self._attachedDeviceNames(name)
+            except Exception:
+                # will fail again and be reported when creating it
+                deps[name] = set()
+            deps[name].difference_update(self.devices)
+            todo.extend(deps[name])
+        if not deps:
+            return {}
+        dependents = {name: set() for name in deps}
+        for (name, adevs) in deps.items():
+            for adev in adevs:
+                dependents[adev].add(name)
+
+        def create(name):
+            started = currenttime()
+            self.createDevice(name)
+            return currenttime() - started
+
+        def init_thread():
+            self._creation_thread.active = True
+
+        self.log.debug('creating %d devices with %d threads', len(deps),
+                       nthreads)
+        failed = {}
+        times = {}
+        started = currenttime()
+        self._creating = {}
+        try:
+            with ThreadPoolExecutor(nthreads, 'device creation',
+                                    initializer=init_thread) as pool:
+                running = {pool.submit(create, name): name
+                           for (name, adevs) in sorted(deps.items())
+                           if not adevs}
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        try:
+                            times[name] = future.result()
+                        except Exception as err:
+                            failed[name] = err
+                            continue
+                        for dependent in sorted(dependents[name]):
+                            deps[dependent].discard(name)
+                            if not deps[dependent]:
+                                running[pool.submit(create, dependent)] = \
+                                    dependent
+        finally:
+            self._creating = None
+        slowest = sorted(times, key=times.get, reverse=True)[:5]
+        self.log.info('created %d devices in %.2f s using %d threads; '
+                      'slowest: %s', len(times), currenttime() - started,
+                      nthreads, ', '.join('%s (%.2f s)' % (name, times[name])
+                                          for name in slowest))
+        return failed
+
+    def _preconnectDevices(self, devnames):
+        """Let the classes of the given devices connect to their hardware
+        for all devices at once, before the devices are created one by one.
+
+        Device classes can provide a ``preconnectDevices`` classmethod, which
+        is called with a list of (class, configuration) pairs of all devices
+        that share the same implementation of the method, if there are at
+        least two of them.  Errors are only logged, since they will be
+        reported again when creating the devices.
+
+        The resolved classes are kept for creating the devices.
+        """
+        groups = {}
+        for name in devnames:
+            if name in self.devices:
+                continue
+            try:
+                devcls, devconfig = self.importDevice(name)
+            except Exception:
+                continue
+            self._device_classes[name] = (devcls, devconfig)
+            method = getattr(devcls, 'preconnectDevices', None)
+            if method is not None:
+                groups.setdefault(method.__func__, (method, []))[1].append(
+                    (devcls, devconfig))
+        for method, devices in groups.values():
+            if len(devices) < 2:
+                continue
+            started = currenttime()
+            try:
+                method(devices)
+            except Exception:
+                self.log.warning('could not preconnect %d devices using %s',
+                                 len(devices), method.__qualname__,
+                                 exc=True)
+                continue
+            self.log.debug('preconnected %d devices using %s in %.2f s',
+                           len(devices), method.__qualname__,
+                           currenttime() - started)
+
     def _deviceNotFound(self, devname, source=None):
         """Called when a required device was not found in the currently
         configured devices.  Normally this raises ConfigurationError, but can
@@ -1113,6 +1289,8 @@ class Session:
 
         The device must exist in the `configured_devices` dict.
         """
+        if replace_classes is None and devname in self._device_classes:
+            return self._device_classes[devname]
         devclsname, devconfig = self.configured_devices[devname]
         self.log.debug('importing device class %s for device %r',
                        devclsname, devname)
@@ -1144,12 +1322,7 @@ class Session:
         if self._failed_devices and devname in self._failed_devices:
             raise self._failed_devices[devname]
         if devname not in self.configured_devices:
-            found_in = []
-            for sname, info in self._setup_info.items():
-                if info is None:
-                    continue
-                if devname in info['devices']:
-                    found_in.append(sname)
+            found_in = sorted(self.getSetupGraph().deviceSetups(devname))
             if found_in:
                 raise ConfigurationError(
                     "device '%s' not found in configuration, but you can load "
@@ -1157,6 +1330,31 @@ class Session:
                     (devname, ', '.join(map(repr, found_in))))
             raise ConfigurationError("device '%s' not found in configuration"
                                      % devname)
+        creating = self._creating
+        if creating is None:
+            return self._createDevice(devname, recreate, explicit,
+                                      replace_classes)
+        # while creating in parallel, make sure that only one thread creates
+        # the device, and that other threads wait until it is initialized
+        entry = (threading.get_ident(), threading.Event())
+        while True:
+            creator = creating.setdefault(devname, entry)
+            if creator is entry:
+                break
+            if creator[0] == entry[0]:
+                # needed again while being created by this thread, e.g. by
+                # a cycle of attached devices: the same as without threads
+                return self._createDevice(devname, recreate, explicit,
+                                          replace_classes)
+            self._waitCreated(devname)
+        try:
+            return self._createDevice(devname, recreate, explicit,
+                                      replace_classes)
+        finally:
+            creating.pop(devname)
+            entry[1].set()
+
+    def _createDevice(self, devname, recreate, explicit, replace_classes):
         if devname in self.devices:
             if not recreate:
                 if explicit:
@@ -1165,6 +1363,10 @@ class Session:
                 return self.devices[devname]
             self.destroyDevice(devname)
 
+        profile = startupprofile.profile
+        if profile:
+            started = profile.begin()
+        tstart = currenttime()
         try:
             devcls, devconfig = self.importDevice(devname, replace_classes)
             if 'description' in devconfig:
@@ -1174,7 +1376,8 @@ class Session:
                 self.log.info("creating device '%s'... ", devname)
 
             dev = devcls(devname, **devconfig)
-            self.log.debug("device '%s' created", devname)
+            self.log.debug("device '%s' created in %.3f s", devname,
+                           currenttime() - tstart)
         except Exception as err:
             if self._failed_devices is not None:
                 self._failed_devices[devname] = err
@@ -1182,6 +1385,9 @@ class Session:
                 self.deviceCallback('failed', {devname: str(err)})
             self.device_failures[devname] = str(err)
             raise
+        finally:
+            if profile:
+                profile.device_created(devname, started)
         self.device_failures.pop(devname, None)
         if self._success_devices is not None:
             self._success_devices.append(devname)
@@ -23,6 +23,12 @@
 
 """Setup file handling."""
 
+import copy
+import hashlib
+import os
+import pickle
+from os import path
+
 from nicos.core.params import nicosdev_re
 from nicos.utils import Device
 from nicos.utils.files import iterSetups
@@ -31,6 +37,13 @@ SETUP_GROUPS = {
     'basic', 'optional', 'plugplay', 'lowlevel', 'special', 'configdata'
 }
 
+# increase when the format of the cached setup info changes
+SETUP_CACHE_VERSION = 1
+
+# setup info keys that are only overridden by a setup in a parent directory
+# if they are given explicitly
+OVERRIDE_KEYS = ('description', 'group', 'display_order')
+
 
 class MonitorElement:
     pass
@@ -125,12 +138,120 @@ class SetupBlock(MonitorElement):
         return 'SetupBlock<%s:%s>' % (self._setupname, self._blockname)
 
 
-def readSetups(paths, logger):
-    """Read all setups on the given paths."""
+def _fileStamp(filepath):
+    st = os.stat(filepath)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _fileHash(filepath):
+    with open(filepath, 'rb') as fp:
+        return hashlib.sha1(fp.read()).hexdigest()
+
+
+class SetupCache:
+    """Persistent cache of the information read from setup files.
+
+    The entries are keyed by setup file, and are valid as long as the file
+    and all files consulted via configdata() are unchanged.  Files are first
+    compared by modification time and size, and if these differ, by a hash of
+    their contents.  Therefore, only changed setups and the setups depending
+    on them via configdata() are executed again.
+    """
+
+    def __init__(self, filename, logger):
+        self.filename = filename
+        self.log = logger
+        # maps setup file -> (setupname, {file: (stamp, hash)}, pickled info)
+        self._entries = {}
+        self._dirty = False
+        try:
+            with open(filename, 'rb') as fp:
+                version, entries = pickle.load(fp)
+            if version == SETUP_CACHE_VERSION:
+                self._entries = entries
+        except FileNotFoundError:
+            pass
+        except Exception as err:
+            logger.warning('could not read setup cache %s: %s', filename, err)
+
+    def lookup(self, setupname, filepath, all_setups):
+        """Return the cached (info, defined keys) for the setup file, or None
+        if it has to be read again.
+        """
+        entry = self._entries.get(filepath)
+        if entry is None or entry[0] != setupname:
+            return None
+        for (filename, (stamp, digest)) in entry[1].items():
+            try:
+                if _fileStamp(filename) != stamp:
+                    if _fileHash(filename) != digest:
+                        return None
+                    # only touched: remember the new stamp
+                    entry[1][filename] = (_fileStamp(filename), digest)
+                    self._dirty = True
+            except OSError:
+                return None
+            if filename != filepath:
+                # configdata() must still find the same file
+                name = path.splitext(path.basename(filename))[0]
+                if all_setups.get(name) != filename:
+                    return None
+        try:
+            return pickle.loads(entry[2])
+        except Exception:
+            return None
+
+    def store(self, setupname, filepath, stamps, result):
+        """Store the (info, defined keys) read from the setup file.
+
+        *stamps* maps all files that were read to their (stamp, hash).
+        """
+        try:
+            data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # setups may contain arbitrary objects; just read them every time
+            return
+        self._entries[filepath] = (setupname, stamps, data)
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        for filepath in list(self._entries):
+            if not path.isfile(filepath):
+                del self._entries[filepath]
+        tmpname = '%s.%d' % (self.filename, os.getpid())
+        try:
+            os.makedirs(path.dirname(self.filename), exist_ok=True)
+            with open(tmpname, 'wb') as fp:
+                pickle.dump((SETUP_CACHE_VERSION, self._entries), fp,
+                            pickle.HIGHEST_PROTOCOL)
+            # atomic replace, since other processes may read it concurrently
+            os.replace(tmpname, self.filename)
+        except OSError as err:
+            self.log.warning('could not write setup cache %s: %s',
+                             self.filename, err)
+            try:
+                os.unlink(tmpname)
+            except OSError:
+                pass
+        else:
+            self._dirty = False
+
+
+def readSetups(paths, logger, cachefile=None):
+    """Read all setups on the given paths.
+
+    If *cachefile* is given, it is used to cache the information read from
+    the setup files across calls and processes.
+    """
     infodict = {}
+    cache = SetupCache(cachefile, logger) if cachefile else None
     all_setups = dict(iterSetups(paths))
     for (setupname, filename) in all_setups.items():
-        readSetup(infodict, setupname, filename, all_setups, logger)
+        readSetup(infodict, setupname, filename, all_setups, logger, cache)
+    if cache:
+        cache.save()
     # check if all includes exist
     for name, info in infodict.items():
         if info is None:
@@ -143,6 +264,122 @@ def readSetups(paths, logger):
     return infodict
 
 
+class SetupGraph:
+    """Relations between all setups, computed once from a setup info dict.
+
+    The graph contains the transitive includes of every setup, an index of
+    which setups exclude each other and which setups define a device, so that
+    checking a combination of setups does not need to walk the includes
+    again and again.  Setups that could not be read (info ``None``) are known
+    by name, but have no relations.
+    """
+
+    def __init__(self, infodict):
+        self.info = infodict
+        # setup name -> setups that it includes directly
+        self._direct = {}
+        # setup name -> setups that it excludes
+        self._excludes = {}
+        # setup name -> setups that exclude it
+        self._excluded_by = {}
+        # device name -> setups defining the device
+        self._owners = {}
+        for (name, info) in infodict.items():
+            if info is None:
+                continue
+            self._direct[name] = tuple(info.get('includes', ()))
+            self._excludes[name] = frozenset(info.get('excludes', ()))
+            for excl in self._excludes[name]:
+                self._excluded_by.setdefault(excl, set()).add(name)
+            for devname in info.get('devices', ()):
+                self._owners.setdefault(devname, []).append(name)
+        # setup name -> all setups included by it (directly and indirectly)
+        self._includes = {}
+        for name in self._direct:
+            self._includes[name] = self._collectIncludes(name)
+
+    def _collectIncludes(self, name):
+        # breadth-first search, reusing the complete results for setups
+        # that have already been processed
+        result = set()
+        todo = list(self._direct[name])
+        while todo:
+            include = todo.pop()
+            if include in result:
+                continue
+            result.add(include)
+            if include in self._includes:
+                result.update(self._includes[include])
+            else:
+                todo.extend(self._direct.get(include, ()))
+        result.discard(name)
+        return frozenset(result)
+
+    def __contains__(self, name):
+        return name in self.info
+
+    def includes(self, name):
+        """Return all setups that are included by setup *name*."""
+        return self._includes.get(name, frozenset())
+
+    def closure(self, names):
+        """Return the given setups together with all their includes."""
+        result = set(names)
+        for name in names:
+            result.update(self._includes.get(name, ()))
+        return result
+
+    def missing(self, names):
+        """Return the setups that are needed for *names*, but do not exist."""
+        return {name for name in self.closure(names) if name not in self.info}
+
+    def includeChain(self, start, target):
+        """Return a list of setups, beginning with *start*, through which
+        *target* is included, or None if it is not included.
+        """
+        parents = {start: None}
+        todo = [start]
+        while todo:
+            name = todo.pop(0)
+            for include in self._direct.get(name, ()):
+                if include in parents:
+                    continue
+                parents[include] = name
+                if include == target:
+                    chain = []
+                    while include is not None:
+                        chain.append(include)
+                        include = parents[include]
+                    return chain[::-1]
+                todo.append(include)
+        return None
+
+    def excludes(self, name):
+        """Return the setups excluded by setup *name*."""
+        return self._excludes.get(name, frozenset())
+
+    def excludedBy(self, name):
+        """Return the setups that exclude setup *name*."""
+        return self._excluded_by.get(name, frozenset())
+
+    def exclusive(self, name1, name2):
+        """Return true if one of the two setups excludes the other."""
+        return name2 in self._excludes.get(name1, ()) or \
+            name1 in self._excludes.get(name2, ())
+
+    def conflicts(self, names):
+        """Return the conflicts between the given setups, as a set of
+        (excluded setup, excluding setup) tuples.
+        """
+        names = set(names)
+        return {(name, excl) for name in names
+                for excl in self._excluded_by.get(name, ()) if excl in names}
+
+    def deviceSetups(self, devname):
+        """Return the names of all setups that define device *devname*."""
+        return list(self._owners.get(devname, ()))
+
+
 def prepareNamespace(setupname, filepath, all_setups):
     """Return a namespace prepared for reading setup "setupname"."""
     # set of all files consulted via configdata()
@@ -172,18 +409,33 @@ def make_configdata(filepath, all_setups, dep_files):
             raise ConfigurationError('config setup "%s" not found' % setupname)
         else:
             fullname = all_setups[setupname]
-        ns = {}
-        with open(fullname, encoding='utf-8') as fp:
-            exec(fp.read(), ns)
+        ns = _readConfigdata(fullname)
         dep_files.add(fullname)
         try:
-            return ns[element]
+            # copy, since the setup may modify the value
+            return copy.deepcopy(ns[element])
         except KeyError:
             raise ConfigurationError('value named %s not found in config setup'
                                      ' "%s"' % (element, setupname)) from None
     return configdata
 
 
+# maps file name -> (stamp, namespace) of files read by configdata()
+_configdata_cache = {}
+
+
+def _readConfigdata(fullname):
+    stamp = _fileStamp(fullname)
+    cached = _configdata_cache.get(fullname)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    ns = {}
+    with open(fullname, encoding='utf-8') as fp:
+        exec(fp.read(), ns)
+    _configdata_cache[fullname] = (stamp, ns)
+    return ns
+
+
 def fixup_stacked_devices(logger, devdict):
     """
     Replace <adevname> = Device(..) entries in devices dict with a proper
@@ -227,28 +479,65 @@ def fixup_stacked_devices(logger, devdict):
     return devdict
 
 
-def readSetup(infodict, modname, filepath, all_setups, logger):
+def readSetup(infodict, modname, filepath, all_setups, logger, cache=None):
+    result = cache and cache.lookup(modname, filepath, all_setups)
+    if result is None:
+        result = _execSetup(modname, filepath, all_setups, logger, cache)
+        if result is None:
+            return
+    info, defined = result
+    if modname in infodict:
+        # setup already exists; override/extend with new values
+        oldinfo = infodict[modname] or {}
+        for key in OVERRIDE_KEYS:
+            if key in defined:
+                oldinfo[key] = info[key]
+        oldinfo['sysconfig'].update(info['sysconfig'])
+        oldinfo['includes'].extend(info['includes'])
+        oldinfo['excludes'].extend(info['excludes'])
+        oldinfo['modules'].extend(info['modules'])
+        oldinfo['devices'].update(info['devices'])
+        # remove devices overridden by "None" entries completely
+        for devname, value in list(oldinfo['devices'].items()):
+            if value is None:
+                del oldinfo['devices'][devname]
+        oldinfo['startupcode'] += '\n' + info['startupcode']
+        oldinfo['alias_config'].update(info['alias_config'])
+        oldinfo['extended'].update(info['extended'])
+        oldinfo['monitor_blocks'].update(info['monitor_blocks'])
+        oldinfo['watch_conditions'].extend(info['watch_conditions'])
+        oldinfo['help_topics'].update(info['help_topics'])
+        oldinfo['_filenames_'].extend(info['_filenames_'])
+        logger.debug('%r setup partially merged with version '
+                     'from parent directory', modname)
+    else:
+        infodict[modname] = info
+
+
+def _execSetup(modname, filepath, all_setups, logger, cache):
+    """Execute a setup file and return its (info, defined keys)."""
     try:
         with open(filepath, 'rb') as modfile:
+            stamp = os.fstat(modfile.fileno())
             code = modfile.read()
     except OSError as err:
         logger.exception('Could not read setup '
                          'module %r: %s', filepath, err)
-        return
+        return None
     ns = prepareNamespace(modname, filepath, all_setups)
     try:
         exec(code, ns)
     except Exception as err:
         logger.exception('An error occurred while processing '
                          'setup %r: %s', filepath, err)
-        return
+        return None
     devices = fixup_stacked_devices(logger, ns.get('devices', {}))
     for devname in devices:
         if not nicosdev_re.match(devname):
             logger.exception('While processing setup %r: device name %r is '
                              'invalid, names must be Python identifiers',
                              filepath, devname)
-            return
+            return None
     info = {
         'description': ns.get('description', modname),
         'group': ns.get('group', 'optional'),
@@ -271,31 +560,14 @@ def readSetup(infodict, modname, filepath, all_setups, logger):
         logger.warning('Setup %s has an invalid group (valid groups '
                        'are: %s)', modname, ', '.join(SETUP_GROUPS))
         info['group'] = 'optional'
-    if modname in infodict:
-        # setup already exists; override/extend with new values
-        oldinfo = infodict[modname] or {}
-        oldinfo['description'] = ns.get('description',
-                                        oldinfo['description'])
-        oldinfo['group'] = ns.get('group', oldinfo['group'])
-        oldinfo['sysconfig'].update(info['sysconfig'])
-        oldinfo['includes'].extend(info['includes'])
-        oldinfo['excludes'].extend(info['excludes'])
-        oldinfo['modules'].extend(info['modules'])
-        oldinfo['devices'].update(info['devices'])
-        # remove devices overridden by "None" entries completely
-        for devname, value in list(oldinfo['devices'].items()):
-            if value is None:
-                del oldinfo['devices'][devname]
-        oldinfo['startupcode'] += '\n' + info['startupcode']
-        oldinfo['alias_config'].update(info['alias_config'])
-        oldinfo['display_order'] = ns.get('display_order',
-                                          oldinfo['display_order'])
-        oldinfo['extended'].update(info['extended'])
-        oldinfo['monitor_blocks'].update(info['monitor_blocks'])
-        oldinfo['watch_conditions'].extend(info['watch_conditions'])
-        oldinfo['help_topics'].update(info['help_topics'])
-        oldinfo['_filenames_'].extend(info['_filenames_'])
-        logger.debug('%r setup partially merged with version '
-                     'from parent directory', modname)
-    else:
-        infodict[modname] = info
+    result = (info, {key for key in OVERRIDE_KEYS if key in ns})
+    if cache:
+        stamps = {filepath: ((stamp.st_mtime_ns, stamp.st_size),
+                             hashlib.sha1(code).hexdigest())}
+        try:
+            for filename in ns['_dep_files']:
+                stamps[filename] = (_fileStamp(filename), _fileHash(filename))
+        except OSError:
+            return result
+        cache.store(modname, filepath, stamps, result)
+    return result
@@ -107,7 +107,7 @@ class NicosCompleter:
     """
 
     attr_hidden = {'attached_devices', 'parameters', 'hardware_access',
-                   'temporary', 'log', 'valuetype', 'mro'}
+                   'needs_polling', 'temporary', 'log', 'valuetype', 'mro'}
     global_hidden = {'ascii', 'breakpoint', 'bytearray', 'bytes', 'callable',
                      'classmethod', 'compile', 'delattr', 'eval', 'exec',
                      'filter', 'format', 'frozenset', 'getattr', 'globals',
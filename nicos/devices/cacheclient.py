@@ -140,11 +140,45 @@ class BaseCacheClient(Device):
     def _wait_data(self):
         pass
 
+    def _subscription_keys(self):
+        """Return the keys to request and subscribe to on connection.
+
+        The return value is an Optional list: None (the default) means all
+        keys with our prefix, otherwise a list of keys.  The cache server
+        matches subscriptions as substrings of the full keys.  The values are
+        requested with the op returned by `_request_op`.
+        """
+        return None
+
+    # how to request the values of the keys from _subscription_keys()
+    _subscription_op = OP_WILDCARD
+
+    def _request_op(self, key):
+        """Return the op to request the values of a subscription key: with
+        OP_WILDCARD for all keys containing the given one, with OP_ASK only
+        for exactly this key.
+        """
+        return self._subscription_op
+
+    def _add_subscriptions(self, keys):
+        """Request and subscribe to additional keys while connected."""
+        for key in keys:
+            op = self._request_op(key)
+            self._queue.put(f'@{key}{op}\n@{key}{OP_SUBSCRIBE}\n')
+
     def _connect_action(self):
         # send request for all keys and updates....
         # (send a single request for a nonexisting key afterwards to
         # determine the end of data)
-        msg = f'@{self._prefix}{OP_WILDCARD}\n{END_MARKER}{OP_ASK}\n'
+        # subclasses return a list here, only the default returns None
+        # pylint: disable=assignment-from-none
+        keys = self._subscription_keys()
+        if keys is None:
+            keys = [self._prefix]
+            msg = f'@{self._prefix}{OP_WILDCARD}\n'
+        else:
+            msg = ''.join(f'@{key}{self._request_op(key)}\n' for key in keys)
+        msg += f'{END_MARKER}{OP_ASK}\n'
         self._socket.sendall(msg.encode())
 
         # read response
@@ -155,7 +189,7 @@ class BaseCacheClient(Device):
             n += 1
 
         # send request for all updates
-        msg = f'@{self._prefix}{OP_SUBSCRIBE}\n'
+        msg = ''.join(f'@{key}{OP_SUBSCRIBE}\n' for key in keys)
         self._socket.sendall(msg.encode())
         for prefix in self._prefixcallbacks:
             msg = f'@{prefix}{OP_SUBSCRIBE}\n'
@@ -521,11 +555,15 @@ class CacheClient(BaseCacheClient):
         if op not in (OP_TELL, OP_TELLOLD):
             return
         if not key.startswith(self._prefix):
+            decoded = False
             for cbkey, callback in self._prefixcallbacks.items():
                 if key.startswith(cbkey):
-                    if value is not None:
-                        value = cache_load(value)
-                    time = time and float(time)
+                    # decode only if someone is interested, and only once
+                    if not decoded:
+                        if value is not None:
+                            value = cache_load(value)
+                        time = time and float(time)
+                        decoded = True
                     try:
                         callback(key, value, time, op != OP_TELL)
                     except Exception:
@@ -133,5 +133,6 @@ class FITSFileReader(ImageFileReader):
 
     @classmethod
     def fromfile(cls, filename):
-        hdu_list = pyfits.open(filename)
-        return numpy.flipud(hdu_list[0].data)
+        # the data stays mapped after closing the file
+        with pyfits.open(filename, memmap=True) as hdu_list:
+            return numpy.flipud(hdu_list[0].data)
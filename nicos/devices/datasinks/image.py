@@ -23,6 +23,11 @@
 
 """Base Image data sink classes for NICOS."""
 
+import os
+import zlib
+
+import numpy
+
 from nicos import session
 from nicos.core import FINAL, INTERRUPTED, LIVE, Override
 from nicos.core.constants import POINT
@@ -54,6 +59,48 @@ class ImageSink(FileSink):
         return False
 
 
+def array_fingerprint(array):
+    """Return a fingerprint of the array's shape, type and content, to detect
+    arrays that have not changed since they were last written.
+    """
+    array = numpy.ascontiguousarray(array)
+    return array.shape, array.dtype.str, zlib.crc32(array)
+
+
+class MappedArray:
+    """An array stored at *offset* in a file and updated in place through a
+    memory map.
+
+    The file is enlarged to hold the array if necessary; other contents of
+    the file are not touched.
+    """
+
+    def __init__(self, filepath, shape, dtype, offset=0):
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        self.offset = offset
+        self.nbytes = int(numpy.prod(shape)) * self.dtype.itemsize
+        if not self.nbytes:
+            # empty files cannot be mapped
+            self.array = numpy.empty(shape, dtype)
+            return
+        if os.path.getsize(filepath) < offset + self.nbytes:
+            os.truncate(filepath, offset + self.nbytes)
+        self.array = numpy.memmap(filepath, self.dtype, 'r+', offset,
+                                  self.shape)
+
+    def fits(self, array):
+        return array.shape == self.shape and array.dtype == self.dtype
+
+    def write(self, array):
+        self.array[...] = array
+
+    def close(self):
+        if isinstance(self.array, numpy.memmap):
+            self.array.flush()
+        self.array = None
+
+
 class SingleFileSinkHandler(DataSinkHandler):
     """Provide a convenient base class for writing a single data file.
 
@@ -75,6 +122,8 @@ class SingleFileSinkHandler(DataSinkHandler):
     def __init__(self, sink, dataset, detector):
         DataSinkHandler.__init__(self, sink, dataset, detector)
         self._file = None
+        # fingerprints of the last written arrays
+        self._written = {}
         self._processArrayInfo(self.detector.arrayInfo())
 
     def _processArrayInfo(self, arrayinfo):
@@ -111,15 +160,30 @@ class SingleFileSinkHandler(DataSinkHandler):
     def writeData(self, fp, image):
         """Write the image data part of the file (second part)."""
 
+    def _writeKey(self, index, quality, image):
+        """Return the key that marks the image as written with the given
+        quality (final or not), or None if it has already been written so.
+
+        The key is stored in ``_written`` once the image has been written.
+        """
+        key = (array_fingerprint(image), quality in (FINAL, INTERRUPTED))
+        if self._written.get(index) == key:
+            return None
+        return key
+
     def _putResult(self, quality, result):
         image = result[1][0]
         if image is None:
             return
+        key = self._writeKey(0, quality, image)
+        if key is None:
+            return
         if self.defer_file_creation:
             self._createFile()
             self.writeHeader(self._file, self.dataset.metainfo, image)
         self.writeData(self._file, image)
         syncFile(self._file)
+        self._written[0] = key
         session.notifyDataFile(self.filetype, self.dataset.uid,
                                self.detector.name, self._file.filepath)
 
@@ -145,6 +209,64 @@ class SingleFileSinkHandler(DataSinkHandler):
             self._file.close()
 
 
+class MappedImageSinkHandler(SingleFileSinkHandler):
+    """Base class for writing files that contain the raw image data at a fixed
+    offset, given by `dataOffset`.
+
+    The data is written in place into a memory map of the file.  The header,
+    which must not overlap with the data, is written with the first result
+    and then only again for the final result.
+    """
+
+    defer_file_creation = True
+
+    def __init__(self, sink, dataset, detector):
+        SingleFileSinkHandler.__init__(self, sink, dataset, detector)
+        self._mapped = None
+        self._header_written = False
+
+    def dataOffset(self, image):
+        """Return the offset of the image data in the file."""
+        return 0
+
+    def writeData(self, fp, image):
+        image = numpy.asarray(image)
+        if self._mapped is None or not self._mapped.fits(image):
+            if self._mapped is not None:
+                self._mapped.close()
+            fp.flush()
+            self._mapped = MappedArray(fp.filepath, image.shape, image.dtype,
+                                       self.dataOffset(image))
+        self._mapped.write(image)
+
+    def _putResult(self, quality, result):
+        image = result[1][0]
+        if image is None:
+            return
+        key = self._writeKey(0, quality, image)
+        if key is None:
+            return
+        self._createFile()
+        final = quality in (FINAL, INTERRUPTED)
+        self.writeData(self._file, image)
+        if final or not self._header_written:
+            self.writeHeader(self._file, self.dataset.metainfo, image)
+            self._header_written = True
+            if final:
+                self._mapped.close()
+                self._mapped = None
+                syncFile(self._file)
+        self._written[0] = key
+        session.notifyDataFile(self.filetype, self.dataset.uid,
+                               self.detector.name, self._file.filepath)
+
+    def end(self):
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+        SingleFileSinkHandler.end(self)
+
+
 class MultipleFileSinkHandler(SingleFileSinkHandler):
     """Provide a convenient base class for writing multiple data files.
 
@@ -164,13 +286,21 @@ class MultipleFileSinkHandler(SingleFileSinkHandler):
     def _putResult(self, quality, result):
         if result[1][0] is None:
             return
+        keys = [self._writeKey(i, quality, image)
+                for (i, image) in enumerate(result[1])]
+        if all(key is None for key in keys):
+            return
         if self.defer_file_creation:
             self._createFile()
         for i, image in enumerate(result[1]):
+            # only the files of changed images are written again
+            if keys[i] is None:
+                continue
             fp = self._files[i]
             self.writeHeader(fp, self.dataset.metainfo, image)
             self.writeData(fp, image)
             syncFile(fp)
+            self._written[i] = keys[i]
         session.notifyDataFile(self.filetype, self.dataset.uid,
                                self.detector.name,
                                [fp.filepath for fp in self._files])
@@ -227,6 +357,11 @@ class ImageFileReader(metaclass=ReaderMeta):
         """Reads an Image from `filename` and returns a numpy array with
         correct shape.
 
+        For binary formats, the array should be a read-only memory map of the
+        file, so that only the parts actually used are read.  Image sinks
+        rewrite their files in place during a measurement, so callers must
+        copy the array if the file may still be written.
+
         Can raise an error in case the file is unreadable.
         """
         raise NotImplementedError('implement classmethod fromfile')
@@ -23,17 +23,19 @@
 
 """Raw image formats."""
 
+import mmap
 from io import TextIOWrapper
 from os import path
 
 import numpy as np
 
 from nicos import session
-from nicos.core import LIVE, ConfigurationError, DataSinkHandler, NicosError, \
-    Override
+from nicos.core import FINAL, INTERRUPTED, LIVE, ConfigurationError, \
+    DataSinkHandler, NicosError, Override
 from nicos.core.data.sink import NicosMetaWriterMixin
 from nicos.devices.datasinks.image import ImageFileReader, ImageSink, \
-    SingleFileSinkHandler
+    MappedArray, MappedImageSinkHandler, SingleFileSinkHandler, \
+    array_fingerprint
 
 
 class SingleTextImageSinkHandler(NicosMetaWriterMixin, SingleFileSinkHandler):
@@ -66,17 +68,17 @@ class SingleTextImageSink(ImageSink):
     handlerclass = SingleTextImageSinkHandler
 
 
-class SingleRawImageSinkHandler(NicosMetaWriterMixin, SingleFileSinkHandler):
+class SingleRawImageSinkHandler(NicosMetaWriterMixin, MappedImageSinkHandler):
 
-    defer_file_creation = True
     update_headerinfo = True
     filetype = 'singleraw'
 
     def writeHeader(self, fp, metainfo, image):
-        fp.seek(0)
-        fp.write(np.asarray(image).tobytes())
+        # the header follows the image data
+        fp.seek(np.asarray(image).nbytes)
         fp.write(b'\n')
         self.writeMetaInformation(fp)
+        fp.truncate()
         fp.flush()
 
 
@@ -100,6 +102,8 @@ class RawImageSinkHandler(NicosMetaWriterMixin, DataSinkHandler):
     def __init__(self, sink, dataset, detector):
         DataSinkHandler.__init__(self, sink, dataset, detector)
         self._datafile = self._headerfile = None
+        self._mapped = None
+        self._written = None
         self._subdir = sink.subdir
         self._template = sink.filenametemplate
         self._headertemplate = self._template[0].replace('.raw', '.header')
@@ -140,9 +144,16 @@ class RawImageSinkHandler(NicosMetaWriterMixin, DataSinkHandler):
         self._logfile.flush()
 
     def _writeData(self, fp, data):
-        fp.seek(0)
-        fp.write(np.asarray(data).tobytes())
-        fp.flush()
+        # the data is updated in place, the file only contains the array
+        data = np.asarray(data)
+        if self._mapped is None or not self._mapped.fits(data):
+            if self._mapped is not None:
+                self._mapped.close()
+            # resize the file in place, so that readers never see it empty
+            fp.flush()
+            fp.truncate(data.nbytes)
+            self._mapped = MappedArray(fp.filepath, data.shape, data.dtype)
+        self._mapped.write(data)
 
     def putResults(self, quality, results):
         if quality == LIVE:
@@ -153,8 +164,15 @@ class RawImageSinkHandler(NicosMetaWriterMixin, DataSinkHandler):
                 return
             data = result[1][0]
             if data is not None:
+                final = quality in (FINAL, INTERRUPTED)
+                key = (array_fingerprint(data), final)
+                if key == self._written:
+                    return
                 self._writeData(self._datafile, data)
-                self._writeHeader()
+                # the header is written with the first and the final data
+                if self._written is None or final:
+                    self._writeHeader()
+                self._written = key
                 session.notifyDataFile('raw', self.dataset.uid,
                                        self.detector.name,
                                        self._datafile.filepath)
@@ -166,6 +184,9 @@ class RawImageSinkHandler(NicosMetaWriterMixin, DataSinkHandler):
         self._writeLogs()
         if self.update_headerinfo:
             self._writeHeader()
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
         if self._datafile:
             self._datafile.close()
         if self._headerfile:
@@ -218,15 +239,15 @@ class RawImageFileReader(ImageFileReader):
                 for line in fd:
                     if line.startswith('ArrayDesc('):
                         shape, dtype = get_array_desc(line)
-                        return np.fromfile(filename, dtype).reshape(shape)
+                        return np.memmap(filename, dtype, 'r', shape=shape)
         else:
-            with open(filename, 'rb') as f:
-                content = f.read()
-                hs = content.find(b'\n### NICOS Device snapshot')
+            with open(filename, 'rb') as f, \
+                 mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                # the header follows the data
+                hs = content.rfind(b'\n### NICOS Device snapshot')
                 header = content[hs:].decode('utf-8', errors='replace')
                 for line in header.split('\n'):
                     if line.startswith('ArrayDesc'):
                         shape, dtype = get_array_desc(line)
-                        return np.frombuffer(content, dtype,
-                                             np.prod(shape)).reshape(shape)
+                        return np.memmap(filename, dtype, 'r', shape=shape)
         raise NicosError('no ArrayDesc line found')
@@ -21,6 +21,7 @@
 #
 # *****************************************************************************
 from functools import partial
+from time import monotonic
 
 import numpy as np
 from caproto import CaprotoTimeoutError, ChannelType
@@ -29,6 +30,7 @@ from caproto.threading.client import Context
 
 from nicos.commands import helparglist, hiddenusercommand
 from nicos.core import CommunicationError, anytype, status
+from nicos.devices.epics.pva.monitorcache import MetadataCache, MonitorCache
 from nicos.devices.epics.status import SEVERITY_TO_STATUS
 
 FTYPE_TO_TYPE = {
@@ -85,6 +87,11 @@ STATUS_TO_MESSAGE = {
 # Same context can be shared across all devices.
 _Context = Context()
 
+# Results of full reads of the PVs, which are used for their metadata (units,
+# limits and enum choices)
+_METADATA = MetadataCache()
+
+
 @hiddenusercommand
 @helparglist('name[, timeout]')
 def caget(name, timeout=3.0):
@@ -116,11 +123,36 @@ class CaprotoWrapper:
     (CA) support.
     """
 
-    def __init__(self, timeout=3.0):
+    def __init__(self, timeout=3.0, monitormaxage=None):
         self._pvs = {}
         self._choices = {}
         self._callbacks = set()
         self._timeout = timeout
+        self._monitors = MonitorCache(monitormaxage)
+        # set to False by the device once it is initialized
+        self.initializing = True
+
+    @staticmethod
+    def connect_pvs(pvnames, timeout=3.0):
+        """Connect to all given PVs concurrently and keep their metadata.
+
+        Returns the names of the PVs that could not be reached.
+        """
+        pvnames = list(pvnames)
+        # searching and connecting is done in the background for all PVs
+        pvs = _Context.get_pvs(*pvnames, timeout=timeout)
+        deadline = monotonic() + timeout
+        failed = []
+        for pvname, pv in zip(pvnames, pvs):
+            try:
+                pv.wait_for_connection(
+                    timeout=max(deadline - monotonic(), 0.01))
+                response = pv.read(timeout=timeout, data_type='control')
+            except CaprotoTimeoutError:
+                failed.append(pvname)
+                continue
+            _METADATA.put(pvname, response)
+        return failed
 
     def connect_pv(self, pvname):
         if pvname in self._pvs:
@@ -139,19 +171,37 @@ class CaprotoWrapper:
                 timeout=self._timeout
             )
             self._pvs[pvname] = pv
-            # Do a read to force a connection
-            return pv.read(timeout=self._timeout, data_type='control')
+            result = _METADATA.get(pvname) if self.initializing else None
+            if result is None:
+                # Do a read to force a connection
+                result = pv.read(timeout=self._timeout, data_type='control')
+                _METADATA.put(pvname, result)
+            return result
         except CaprotoTimeoutError:
             raise CommunicationError(
                 f'could not connect to PV {pvname}') from None
 
     def get_pv_value(self, pvname, as_string=False):
-        try:
-            result = self._pvs[pvname].read(timeout=self._timeout,
-                                            data_type='control')
-            return self._convert_value(pvname, result, as_string)
-        except CaprotoTimeoutError:
-            raise TimeoutError(f"getting {pvname} timed out") from None
+        result = self._monitors.get(pvname)
+        if result is None:
+            try:
+                result = self._read_and_refresh(pvname)
+            except CaprotoTimeoutError:
+                raise TimeoutError(f"getting {pvname} timed out") from None
+        return self._convert_value(pvname, result, as_string)
+
+    def _read_and_refresh(self, pvname):
+        # the result of the read is used for subscribed PVs until the next
+        # monitor update arrives
+        since = monotonic()
+        result = self._pvs[pvname].read(timeout=self._timeout,
+                                        data_type='control')
+        _METADATA.put(pvname, result)
+        self._monitors.refresh(pvname, result, since)
+        return result
+
+    def monitor_hit_ratio(self):
+        return self._monitors.hit_ratio()
 
     def _convert_value(self, pvname, raw_value, as_string=False):
         if len(raw_value.data) == 1:
@@ -171,6 +221,7 @@ class CaprotoWrapper:
         return str(raw_value.data) if as_string else raw_value.data
 
     def put_pv_value(self, pvname, value, wait=False):
+        self._monitors.invalidate(pvname)
         if pvname in self._choices:
             value = self._choices[pvname].index(value)
         try:
@@ -179,6 +230,7 @@ class CaprotoWrapper:
             raise TimeoutError(f"setting {pvname} timed out") from None
 
     def put_pv_value_blocking(self, pvname, value, block_timeout=60):
+        self._monitors.invalidate(pvname)
         if pvname in self._choices:
             value = self._choices[pvname].index(value)
         try:
@@ -195,7 +247,7 @@ class CaprotoWrapper:
         return self._extract_alarm_info(values)
 
     def get_units(self, pvname, default=''):
-        values = self.get_control_values(pvname)
+        values = self._get_metadata(pvname)
         return self._get_units(values, default)
 
     def _get_units(self, values, default):
@@ -204,24 +256,35 @@ class CaprotoWrapper:
         return default
 
     def get_limits(self, pvname, default_low=-1e308, default_high=1e308):
-        values = self.get_control_values(pvname)
+        values = self._get_metadata(pvname)
         if hasattr(values, 'lower_ctrl_limit'):
             default_low = values.lower_ctrl_limit
             default_high = values.upper_ctrl_limit
         return default_low, default_high
 
     def get_control_values(self, pvname):
-        try:
-            result = self._pvs[pvname].read(timeout=self._timeout,
-                                            data_type='control')
+        result = self._monitors.get(pvname, count=False)
+        if result is not None:
             return result.metadata
+        try:
+            return self._read_and_refresh(pvname).metadata
         except CaprotoTimeoutError:
             raise TimeoutError(
                 f"getting control values for {pvname} timed out") from None
 
+    def _get_metadata(self, pvname):
+        # the shared results are only used while the device is initialized
+        # (e.g. those of connect_pvs); for PVs with a connected monitor, the
+        # last update is used
+        if self.initializing:
+            result = _METADATA.get(pvname)
+            if result is not None:
+                return result.metadata
+        return self.get_control_values(pvname)
+
     def get_value_choices(self, pvname):
         # Only works for enum types like MBBI and MBBO
-        value = self.get_control_values(pvname)
+        value = self._get_metadata(pvname)
         return self._extract_choices(value)
 
     def _extract_choices(self, value):
@@ -272,12 +335,17 @@ class CaprotoWrapper:
 
     def _callback(self, pvname, pvparam, change_callback, as_string, sub,
                   response):
+        self._monitors.update(pvname, response)
+        _METADATA.put(pvname, response)
         value = self._convert_value(pvname, response, as_string)
         units = self._get_units(response.metadata, '')
         severity, message = self._extract_alarm_info(response)
         change_callback(pvname, pvparam, value, units, severity, message)
 
     def _conn_callback(self, pvname, pvparam, connection_callback, pv, state):
+        if state != 'connected':
+            self._monitors.disconnected(pvname)
+            _METADATA.discard(pvname)
         connection_callback(pvname, pvparam, state == 'connected')
 
     def _extract_alarm_info(self, values):
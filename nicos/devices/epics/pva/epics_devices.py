@@ -34,6 +34,7 @@ from nicos.core import POLLER, SIMULATION, ConfigurationError, \
     DeviceMixinBase, HasLimits, HasPrecision, Moveable, Override, Param, \
     Readable, anytype, dictof, floatrange, none_or, pvname, status
 from nicos.devices.abstract import MappedMoveable, MappedReadable
+from nicos.devices.epics.utils import get_config_pv_names
 from nicos.utils import HardwareStub
 
 __all__ = [
@@ -52,6 +53,19 @@ class EpicsDevice(DeviceMixinBase):
                               type=none_or(floatrange(0.1, 60)),
                               userparam=False, mandatory=False, default=3.0),
         'monitor': Param('Use a PV monitor', type=bool, default=False),
+        'monitormaxage': Param('Maximum age of the last monitor update that '
+                               'is used instead of getting the PV',
+                               type=none_or(floatrange(0)), unit='s',
+                               default=60, userparam=False,
+                               ext_desc='With ``monitor``, reads of the '
+                               'subscribed PVs are served from the monitor '
+                               'updates while the subscription is connected. '
+                               'If the PV has not changed for longer than '
+                               'this, it is read again. ``None`` means no '
+                               'limit.'),
+        'monitorhitratio': Param('Fraction of reads served from monitor '
+                                 'updates', type=float, volatile=True,
+                                 internal=True, fmtstr='%.3f'),
         'pva': Param('Use pva', type=bool,
                      default=DEFAULT_EPICS_PROTOCOL == 'pva'),
     }
@@ -65,16 +79,56 @@ class EpicsDevice(DeviceMixinBase):
     _epics_subscriptions = []
     _cache_relations = {'readpv': 'value'}
 
+    @classmethod
+    def preconnectDevices(cls, devices):
+        """Connect to the PVs of several devices that are going to be
+        created at once.
+
+        *devices* is a list of (device class, configuration) pairs.  The PVs
+        are fetched concurrently, and the devices then use the metadata
+        of the PVs instead of getting each PV in turn.
+        """
+        pvnames = {False: set(), True: set()}
+        timeout = 0
+        for devcls, config in devices:
+            pva = config.get('pva', DEFAULT_EPICS_PROTOCOL == 'pva')
+            pvnames[pva].update(devcls._get_config_pv_names(config))
+            timeout = max(timeout, config.get('epicstimeout') or 3.0)
+        if pvnames[True]:
+            from nicos.devices.epics.pva.p4p import P4pWrapper
+            P4pWrapper.connect_pvs(sorted(pvnames[True]), timeout)
+        if pvnames[False]:
+            from nicos.devices.epics.pva.caproto import CaprotoWrapper
+            CaprotoWrapper.connect_pvs(sorted(pvnames[False]), timeout)
+
+    @classmethod
+    def _get_config_pv_names(cls, config):
+        """Return the names of the PVs used by a device with the given
+        configuration, as far as they are known without creating it.
+        """
+        return get_config_pv_names(cls, config)
+
+    def init(self):
+        try:
+            super().init()
+        finally:
+            # from now on, the metadata of the PVs is fetched again (unless
+            # kept current by a monitor)
+            if self._epics_wrapper:
+                self._epics_wrapper.initializing = False
+
     def doPreinit(self, mode):
         self._param_to_pv = {}
         self._pvs = {}
 
         if self.pva:
             from nicos.devices.epics.pva.p4p import P4pWrapper
-            self._epics_wrapper = P4pWrapper(self.epicstimeout)
+            self._epics_wrapper = P4pWrapper(self.epicstimeout,
+                                             self.monitormaxage)
         else:
             from nicos.devices.epics.pva.caproto import CaprotoWrapper
-            self._epics_wrapper = CaprotoWrapper(self.epicstimeout)
+            self._epics_wrapper = CaprotoWrapper(self.epicstimeout,
+                                                 self.monitormaxage)
 
         if mode != SIMULATION:
             for pvparam in self._get_pv_parameters():
@@ -150,9 +204,15 @@ class EpicsDevice(DeviceMixinBase):
         # Returns the parameters which indicate "status".
         return set()
 
+    def doReadMonitorhitratio(self):
+        return self._epics_wrapper.monitor_hit_ratio()
+
     def doShutdown(self):
         for sub in self._epics_subscriptions:
             self._epics_wrapper.close_subscription(sub)
+        if self._epics_subscriptions:
+            self.log.debug('%.1f%% of reads served from monitor updates',
+                           self._epics_wrapper.monitor_hit_ratio() * 100)
 
     def _get_pv_parameters(self):
         return set(self._record_fields.keys())
@@ -0,0 +1,136 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Serving PV reads from monitor updates and caching PV metadata."""
+
+from threading import Lock
+from time import monotonic
+
+# Age after which the metadata of a PV is fetched again, since its type,
+# units, limits and enum choices might change at runtime
+METADATA_MAXAGE = 60
+
+
+class MonitorCache:
+    """Keeps the latest data received for subscribed PVs.
+
+    The data of a PV is used instead of getting the PV from the IOC as long
+    as its subscription is connected and the data is not older than *maxage*
+    seconds (None means no limit).  Since monitors only send changes, the
+    result of a get that had to be done for a connected PV is stored as well,
+    so that at most one get per *maxage* is done for a PV that doesn't
+    change.
+    """
+
+    def __init__(self, maxage=None):
+        self.maxage = maxage
+        self.hits = 0
+        self.gets = 0
+        self._lock = Lock()
+        self._connected = set()
+        self._data = {}
+
+    def update(self, pvname, data):
+        """Store data received through the subscription of the PV."""
+        with self._lock:
+            self._connected.add(pvname)
+            self._data[pvname] = (monotonic(), data)
+
+    def refresh(self, pvname, data, since):
+        """Store the result of a get started at *since* (a monotonic time).
+
+        This is ignored if the PV is not subscribed, or if a newer monitor
+        update has arrived in the meantime.  Returns whether the data was
+        stored.
+        """
+        with self._lock:
+            if pvname not in self._connected:
+                return False
+            entry = self._data.get(pvname)
+            if entry is not None and entry[0] > since:
+                return False
+            self._data[pvname] = (monotonic(), data)
+            return True
+
+    def invalidate(self, pvname):
+        """Don't use the current data, e.g. after writing to the PV."""
+        with self._lock:
+            self._data.pop(pvname, None)
+
+    def disconnected(self, pvname):
+        with self._lock:
+            self._connected.discard(pvname)
+            self._data.pop(pvname, None)
+
+    def get(self, pvname, count=True):
+        """Return the current data of the PV, or None if a get is needed.
+
+        With *count*, the call is included in the hit ratio.
+        """
+        with self._lock:
+            entry = self._data.get(pvname)
+            if entry is not None and (self.maxage is None or
+                                      monotonic() - entry[0] <= self.maxage):
+                if count:
+                    self.hits += 1
+                return entry[1]
+            if count:
+                self.gets += 1
+            return None
+
+    def hit_ratio(self):
+        """Return the fraction of reads that were served from the cache."""
+        total = self.hits + self.gets
+        return self.hits / total if total else 0.
+
+
+class MetadataCache:
+    """Keeps the results of full reads of PVs, which are used for their
+    metadata (type, units, limits and enum choices).
+
+    The cache is shared by all devices using the same protocol, so that PVs
+    connected for several devices at once are not read again by each device.
+    Results older than *maxage* seconds are not used.
+    """
+
+    def __init__(self, maxage=METADATA_MAXAGE):
+        self.maxage = maxage
+        self._lock = Lock()
+        self._data = {}
+
+    def put(self, pvname, result):
+        with self._lock:
+            self._data[pvname] = (monotonic(), result)
+
+    def get(self, pvname):
+        """Return the last result for the PV, or None if a read is needed."""
+        with self._lock:
+            entry = self._data.get(pvname)
+            if entry is not None and monotonic() - entry[0] <= self.maxage:
+                return entry[1]
+            return None
+
+    def discard(self, pvname):
+        """Forget the result, e.g. when the PV is disconnected."""
+        with self._lock:
+            self._data.pop(pvname, None)
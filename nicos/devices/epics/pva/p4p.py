@@ -23,12 +23,14 @@
 from collections.abc import Iterable
 from functools import partial
 from threading import Lock
+from time import monotonic
 
 import numpy as np
 from p4p.client.thread import Context
 
 from nicos.commands import helparglist, hiddenusercommand
 from nicos.core import CommunicationError, status
+from nicos.devices.epics.pva.monitorcache import MetadataCache, MonitorCache
 from nicos.devices.epics.status import SEVERITY_TO_STATUS
 
 # Same context can be shared across all devices.
@@ -36,6 +38,11 @@ from nicos.devices.epics.status import SEVERITY_TO_STATUS
 # we want to do this manually to avoid information loss
 _CONTEXT = Context('pva', nt=False)
 
+# Results of full gets of the PVs, which are used for their metadata (type,
+# units, limits and enum choices)
+_METADATA = MetadataCache()
+
+
 @hiddenusercommand
 @helparglist('name[, timeout]')
 def pvget(name, timeout=3.0):
@@ -67,7 +74,7 @@ class P4pWrapper:
     support.
     """
 
-    def __init__(self, timeout=3.0):
+    def __init__(self, timeout=3.0, monitormaxage=None):
         self.disconnected = set()
         self.lock = Lock()
         self._timeout = timeout
@@ -75,18 +82,64 @@ class P4pWrapper:
         self._values = {}
         self._alarms = {}
         self._choices = {}
+        self._monitors = MonitorCache(monitormaxage)
+        # set to False by the device once it is initialized
+        self.initializing = True
+
+    @staticmethod
+    def connect_pvs(pvnames, timeout=3.0):
+        """Get all given PVs concurrently and keep their metadata.
+
+        Returns the names of the PVs that could not be reached.
+        """
+        pvnames = list(pvnames)
+        results = _CONTEXT.get(pvnames, timeout=timeout, throw=False)
+        failed = []
+        for pvname, result in zip(pvnames, results):
+            if isinstance(result, Exception):
+                failed.append(pvname)
+            else:
+                _METADATA.put(pvname, result)
+        return failed
 
     def connect_pv(self, pvname):
         # Check pv is available
         try:
-            _CONTEXT.get(pvname, timeout=self._timeout)
+            self._get_metadata(pvname)
         except TimeoutError:
             raise CommunicationError(
                 f'could not connect to PV {pvname}') from None
 
+    def _get_metadata(self, pvname):
+        # the shared results are only used while the device is initialized
+        # (e.g. those of connect_pvs), and for PVs with a connected monitor,
+        # whose updates of the metadata discard them
+        if self.initializing or \
+           self._monitors.get(pvname, count=False) is not None:
+            result = _METADATA.get(pvname)
+            if result is not None:
+                return result
+        result = _CONTEXT.get(pvname, timeout=self._timeout)
+        _METADATA.put(pvname, result)
+        return result
+
     def get_pv_value(self, pvname, as_string=False):
+        value = self._monitors.get(pvname)
+        if value is None:
+            value = self._get_and_refresh(pvname)['value']
+        return self._convert_value(pvname, value, as_string)
+
+    def _get_and_refresh(self, pvname):
+        # the result of the get is used for subscribed PVs until the next
+        # monitor update arrives
+        since = monotonic()
         result = _CONTEXT.get(pvname, timeout=self._timeout)
-        return self._convert_value(pvname, result['value'], as_string)
+        if self._monitors.refresh(pvname, result['value'], since):
+            self._alarms[pvname] = self._extract_alarm_info(result)
+        return result
+
+    def monitor_hit_ratio(self):
+        return self._monitors.hit_ratio()
 
     def _convert_value(self, pvname, value, as_string=False):
         try:
@@ -112,13 +165,15 @@ class P4pWrapper:
         return value
 
     def put_pv_value(self, pvname, value, wait=False):
+        self._monitors.invalidate(pvname)
         pvput(pvname, value, timeout=self._timeout, wait=wait)
 
     def put_pv_value_blocking(self, pvname, value, block_timeout=60):
+        self._monitors.invalidate(pvname)
         pvput(pvname, value, timeout=block_timeout, wait=True)
 
     def get_pv_type(self, pvname):
-        result = _CONTEXT.get(pvname, timeout=self._timeout)
+        result = self._get_metadata(pvname)
         try:
             if result['value'].getID() == 'enum_t':
                 # Treat enums as ints
@@ -131,11 +186,13 @@ class P4pWrapper:
         return type(result["value"])
 
     def get_alarm_status(self, pvname):
-        result = _CONTEXT.get(pvname, timeout=self._timeout)
-        return self._extract_alarm_info(result)
+        if self._monitors.get(pvname, count=False) is not None and \
+           pvname in self._alarms:
+            return self._alarms[pvname]
+        return self._extract_alarm_info(self._get_and_refresh(pvname))
 
     def get_units(self, pvname, default=''):
-        result = _CONTEXT.get(pvname, timeout=self._timeout)
+        result = self._get_metadata(pvname)
         return self._get_units(result, default)
 
     def _get_units(self, result, default):
@@ -145,7 +202,7 @@ class P4pWrapper:
             return default
 
     def get_limits(self, pvname, default_low=-1e308, default_high=1e308):
-        result = _CONTEXT.get(pvname, timeout=self._timeout)
+        result = self._get_metadata(pvname)
         try:
             default_low = result['display']['limitLow']
             default_high = result['display']['limitHigh']
@@ -154,13 +211,13 @@ class P4pWrapper:
         return default_low, default_high
 
     def get_control_values(self, pvname):
-        raw_result = _CONTEXT.get(pvname, timeout=self._timeout)
+        raw_result = self._get_metadata(pvname)
         if 'display' in raw_result:
             return raw_result['display']
         return raw_result['control'] if 'control' in raw_result else {}
 
     def get_value_choices(self, pvname):
-        value = _CONTEXT.get(pvname, timeout=self._timeout)['value']
+        value = self._get_metadata(pvname)['value']
         if isinstance(value, bool):
             return [False, True]
         if not isinstance(value, Iterable):
@@ -187,7 +244,7 @@ class P4pWrapper:
         with self.lock:
             self.disconnected.add(pvname)
 
-        request = _CONTEXT.makeRequest(
+        request = Context.makeRequest(
             "field(value,timeStamp,alarm,control,display)")
 
         callback = partial(self._callback, pvname, pvparam, change_callback,
@@ -204,8 +261,17 @@ class P4pWrapper:
                 connection_callback(pvname, pvparam, False)
                 with self.lock:
                     self.disconnected.add(pvname)
+            self._monitors.disconnected(pvname)
+            # the metadata might have changed when it comes back
+            _METADATA.discard(pvname)
             return
 
+        if pvname not in self.disconnected and \
+           any(name.startswith(('display', 'control', 'value.choices'))
+               for name in result.changedSet()):
+            # the metadata has changed
+            _METADATA.discard(pvname)
+
         if pvname in self.disconnected:
             # Only callback if it is a new connection
             if connection_callback:
@@ -235,6 +301,8 @@ class P4pWrapper:
                 self._units[pvname] = self._get_units(result, '')
             if 'alarm.status' in change_set or 'alarm.severity' in change_set:
                 self._alarms[pvname] = self._extract_alarm_info(result)
+            if 'value' in change_set or 'value.index' in change_set:
+                self._monitors.update(pvname, result['value'])
 
             if pvname in self._values:
                 severity, msg = self._alarms.get(pvname, (status.UNKNOWN, ''))
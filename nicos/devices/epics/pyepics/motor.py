@@ -144,6 +144,17 @@ class EpicsMotor(CanDisable, CanReference, HasOffset, EpicsAnalogMoveable,
 
         return pvs
 
+    @classmethod
+    def _get_config_pv_names(cls, config):
+        pvnames = super()._get_config_pv_names(config)
+        motor_record_prefix = config.get('motorpv')
+        if motor_record_prefix:
+            # the record itself is only used with its fields
+            pvnames.discard(motor_record_prefix)
+            pvnames.update('.'.join((motor_record_prefix, field))
+                           for field in cls._record_fields.values())
+        return pvnames
+
     def _get_pv_name(self, pvparam):
         """
         Implementation of inherited method that translates between PV aliases
@@ -36,6 +36,7 @@ from nicos.core import SIMULATION, CommunicationError, ConfigurationError, \
     floatrange, none_or, pvname, status
 from nicos.core.mixins import HasWindowTimeout
 from nicos.devices.epics.status import SEVERITY_TO_STATUS, STAT_TO_STATUS
+from nicos.devices.epics.utils import get_config_pv_names
 from nicos.utils import HardwareStub
 
 # ca.clear_cache() only works from the main thread
@@ -122,6 +123,39 @@ class EpicsDevice(DeviceMixinBase):
     _pvs = {}
     _pvctrls = {}
 
+    @classmethod
+    def preconnectDevices(cls, devices):
+        """Connect to the PVs of several devices that are going to be
+        created at once.
+
+        *devices* is a list of (device class, configuration) pairs.  The
+        channels are connected concurrently; since pyepics keeps one channel
+        per PV name, the PV objects of the devices then use the connected
+        channels.
+        """
+        pvnames = set()
+        timeout = 0
+        for devcls, config in devices:
+            pvnames.update(devcls._get_config_pv_names(config))
+            timeout = max(timeout, config.get('epicstimeout') or 3.0)
+        if not pvnames:
+            return
+        if epics.ca.current_context() is None:
+            epics.ca.use_initial_context()
+        chids = [epics.ca.create_channel(name, connect=False)
+                 for name in sorted(pvnames)]
+        deadline = monotonic() + timeout
+        for chid in chids:
+            epics.ca.connect_channel(
+                chid, timeout=max(deadline - monotonic(), 0.01))
+
+    @classmethod
+    def _get_config_pv_names(cls, config):
+        """Return the names of the PVs used by a device with the given
+        configuration, as far as they are known without creating it.
+        """
+        return get_config_pv_names(cls, config)
+
     def doPreinit(self, mode):
         # Don't create PVs in simulation mode
         self._pvs = {}
@@ -0,0 +1,43 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Helpers shared by the EPICS device implementations."""
+
+from nicos.core import pvname
+
+
+def get_config_pv_names(devcls, config):
+    """Return the names of the PVs used by a device of class *devcls* with
+    the given configuration, as far as they are known without creating it.
+
+    These are the values of all parameters of type `pvname` (or a type
+    converting with it, such as ``none_or(pvname)``).
+    """
+    pvnames = set()
+    for param, value in config.items():
+        paraminfo = devcls.parameters.get(param)
+        if paraminfo is not None and value and (
+                paraminfo.type is pvname or
+                getattr(paraminfo.type, 'conv', None) is pvname):
+            pvnames.add(value)
+    return pvnames
@@ -27,8 +27,6 @@ Class for magnets powered by unipolar power supplies.
 
 import math
 
-from scipy.optimize import fsolve
-
 from nicos import session
 from nicos.core import Attach, HasLimits, LimitError, Moveable, NicosError, \
     status, usermethod
@@ -101,6 +99,8 @@ class CalibratedMagnet(HasLimits, Moveable):
                              'requested field %g %s out of range %g..%g %s' %
                              (field, self.unit, minfield, maxfield, self.unit))
 
+        # scipy takes long to import, only do it when needed
+        from scipy.optimize import fsolve
         res = fsolve(lambda cur: self._current2field(cur) - field, 0)[0]
         self.log.debug('current for %g %s is %g', field, self.unit, res)
         return res
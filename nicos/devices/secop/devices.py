@@ -45,9 +45,11 @@ SecopMoveable, and the following parameters:
   Attributes given in the cfg dict may overwrite above attributes.
 """
 
+import queue
 import re
 import time
 from collections import defaultdict
+from functools import partial
 from math import floor, log10
 from threading import Event, RLock
 
@@ -58,12 +60,12 @@ from nicos import session
 from nicos.core import POLLER, SIMULATION, Attach, DeviceAlias, HasLimits, \
     HasOffset, NicosError, Override, Param, status, usermethod
 from nicos.core.device import Device, DeviceMeta, Moveable, Readable
-from nicos.core.errors import ConfigurationError, CommunicationError
+from nicos.core.errors import CommunicationError, ConfigurationError
 from nicos.core.params import anytype, dictof, floatrange, intrange, listof
 from nicos.core.utils import formatStatus
 from nicos.devices.secop.validators import get_validator
 from nicos.protocols.cache import cache_dump
-from nicos.utils import importString, printTable
+from nicos.utils import createThread, importString, printTable
 
 SECOP_ERROR = 400
 
@@ -199,7 +201,11 @@ class SecNodeDevice(Readable):
                                   default=1, userparam=False),
         'async_only':  Param('True: inhibit SECoP reads on created devices, '
                              'use events only', type=bool, prefercache=False,
-                             default=False, userparam=False),
+                             default=False, userparam=False,
+                             ext_desc='The SEC node sends updates for all '
+                             'parameters, so with True, values and status '
+                             'are taken from these updates only, also for '
+                             '``read(0)``.  ``hwread()`` always reads.'),
         'allow_list':  Param('list of device names to allow creating',
                              ext_desc='The original names found on the'
                              ' SecNode are looked at. If the allow_list is'
@@ -255,15 +261,21 @@ class SecNodeDevice(Readable):
         'pollinterval': Override(default=None, userparam=False),
     }
 
+    # the devices are updated by the SEC node
+    needs_polling = False
+
     valuetype = str
     _secnode = None
     _value = ''
     _status = status.OK, 'unconnected'   # the nicos status
     _devices = {}
     _custom_callbacks = defaultdict(list)
+    _update_thread = None
 
     def doPreinit(self, mode):
         self._devices = {}
+        self._update_callbacks = {}
+        self._updates = queue.Queue()
 
     def doInit(self, mode):
         if mode == SIMULATION:
@@ -273,6 +285,8 @@ class SecNodeDevice(Readable):
             else:
                 self._setROParam('setup_info', setup_info)
         elif session.sessiontype != POLLER:
+            self._update_thread = createThread('SECoP updates %s' % self,
+                                               self._update_loop)
             if self.uri:
                 try:
                     self._connect()
@@ -381,6 +395,29 @@ class SecNodeDevice(Readable):
         self._disconnect()
         if self._devices:
             self.log.error('can not remove devices %s', list(self._devices))
+        if self._update_thread:
+            self._updates.put(None)
+            self._update_thread.join()
+
+    def _queue_update(self, updatefunc, module, parameter, item):
+        """Called by the SECoP client for every update of a parameter.
+
+        The updates are handed to the devices in order by the update thread,
+        so that the client is not held up by putting them into the cache.
+        """
+        self._updates.put((updatefunc, module, parameter, item))
+
+    def _update_loop(self):
+        while True:
+            update = self._updates.get()
+            if update is None:
+                return
+            updatefunc, module, parameter, item = update
+            try:
+                updatefunc(module, parameter, item)
+            except Exception:
+                self.log.exception('error handling update of %s:%s',
+                                   module, parameter)
 
     def _get_prefix(self):
         if not self._secnode:
@@ -427,8 +464,10 @@ class SecNodeDevice(Readable):
         for parameter in self._secnode.modules[module]['parameters']:
             updatefunc = getattr(device, '_update_' + parameter,
                                  device._update)
+            callback = partial(self._queue_update, updatefunc)
+            self._update_callbacks[device.name, parameter] = callback
             self._secnode.register_callback((module, parameter),
-                                            updateItem=updatefunc)
+                                            updateItem=callback)
             try:
                 data = self._secnode.cache[module, parameter]
                 if data:
@@ -449,10 +488,11 @@ class SecNodeDevice(Readable):
         except KeyError:  # do not complain again about missing module
             return
         for parameter in moddesc['parameters']:
-            updatefunc = getattr(device, '_update_' + parameter,
-                                 device._update)
-            self._secnode.unregister_callback((module, parameter),
-                                              updateItem=updatefunc)
+            callback = self._update_callbacks.pop((device.name, parameter),
+                                                  None)
+            if callback is not None:
+                self._secnode.unregister_callback((module, parameter),
+                                                  updateItem=callback)
             for custom_callback in self._custom_callbacks.pop((module, parameter), []):
                 self._secnode.unregister_callback((module, parameter),
                                                   updateItem=custom_callback)
@@ -709,6 +749,9 @@ class SecopDevice(Device):
         3: status.BUSY,
         4: status.ERROR,
     }
+    # values are pushed into the cache by the SEC node
+    needs_polling = False
+
     _defunct = False
     _cache = None
     _inside_read = False
@@ -27,13 +27,16 @@ This module contains the NICOS - TANGO integration.
 
 import os
 import re
+import threading
+from contextlib import nullcontext
+from urllib.parse import urlsplit
 
 import tango
 
 from nicos import session
 from nicos.core import SIMULATION, CommunicationError, ConfigurationError, \
     HardwareError, HasCommunication, InvalidValueError, NicosError, Override, \
-    Param, ProgrammingError, floatrange, status, tangodev
+    Param, ProgrammingError, floatrange, intrange, oneof, status, tangodev
 from nicos.utils import HardwareStub, tcpSocketContext
 
 EXC_MAPPING = {
@@ -137,6 +140,55 @@ def describe_dev_error(exc):
     return fulldesc
 
 
+# semaphores limiting the concurrent requests per Tango host
+_host_limiters = {}
+_host_limiters_lock = threading.Lock()
+
+# attributes read in advance while polling a device, per thread
+_prefetched = threading.local()
+
+
+def host_limiter(address, limit):
+    """Return a context manager that limits the concurrent requests to the
+    Tango host of *address* to *limit*.
+
+    Devices with the same host and limit share the same limiter.  A limit of
+    0 means no limit.
+    """
+    if not limit:
+        return nullcontext()
+    host = urlsplit(address).netloc or \
+        os.environ.get('TANGO_HOST', 'localhost:10000')
+    with _host_limiters_lock:
+        if (host, limit) not in _host_limiters:
+            _host_limiters[host, limit] = threading.BoundedSemaphore(limit)
+        return _host_limiters[host, limit]
+
+
+class AttributePrefetch:
+    """Attributes of a device read with one request.
+
+    Attributes that could not be read are left to be read the normal way.
+    """
+
+    def __init__(self, proxy, names, limiter, log):
+        self.proxy = proxy
+        try:
+            with limiter:
+                attrs = proxy.read_attributes(names)
+        except Exception as err:
+            log.debug('[Tango] batched read of %s failed: %s',
+                      ', '.join(names), err)
+            self._values = {}
+        else:
+            self._values = {attr.name.lower(): attr for attr in attrs
+                            if not attr.has_failed}
+
+    def get(self, name):
+        """Return the DeviceAttribute for *name*, or None if not read."""
+        return self._values.get(name.lower())
+
+
 def check_tango_host_connection(address, timeout=3.0):
     """Check pure network connection to the tango host."""
     tango_host = os.environ.get('TANGO_HOST', 'localhost:10000')
@@ -157,6 +209,10 @@ class PyTangoDevice(HasCommunication):
 
     The PyTangoDevice uses an internal tango.DeviceProxy but wraps command
     execution and attribute operations with logging and exception mapping.
+
+    When polling many devices, the number of round trips can be reduced with
+    the ``pollreads`` parameter, and the load on a single Tango host can be
+    bounded with ``maxhostrequests``.
     """
 
     hardware_access = True
@@ -167,6 +223,19 @@ class PyTangoDevice(HasCommunication):
         'tangotimeout': Param('TANGO network timeout for this process',
                               unit='s', type=floatrange(0.0, 1200), default=3,
                               settable=True, preinit=True),
+        'pollreads':    Param('How status and value are read when polling',
+                              type=oneof('single', 'batched'),
+                              default='single',
+                              ext_desc='With ``batched``, the attributes in '
+                              '`poll_attributes` are read with one request '
+                              'when polling.'),
+        'maxhostrequests': Param('Maximum number of concurrent requests to '
+                                 'the Tango host of the device (0 for no '
+                                 'limit)', type=intrange(0, 1000), default=0,
+                                 preinit=True,
+                                 ext_desc='The limit applies to all devices '
+                                 'of the process with the same Tango host '
+                                 'and limit.'),
     }
     parameter_overrides = {
         'unit': Override(mandatory=False),
@@ -180,6 +249,13 @@ class PyTangoDevice(HasCommunication):
         tango.DevState.MOVING: status.BUSY,
     }
 
+    # attributes read with one request when polling, if enabled by the
+    # "pollreads" parameter; State and Status are answered from these reads
+    # instead of calling the commands
+    poll_attributes = ('State', 'Status', 'value')
+
+    _limiter = nullcontext()
+
     # Since each DeviceProxy leaks a few Python objects, we can't just
     # drop them when the device fails to initialize, and create another one.
     # It is also not required since they reconnect automatically.
@@ -192,6 +268,7 @@ class PyTangoDevice(HasCommunication):
             self._createPyTangoDevice, 'constructor')
 
         self._dev = None
+        self._limiter = host_limiter(self.tangodevice, self.maxhostrequests)
 
         # Don't create Tango device in simulation mode
         if mode != SIMULATION:
@@ -205,6 +282,17 @@ class PyTangoDevice(HasCommunication):
                                                    status.UNKNOWN)
         return (nicosState, self._dev.Status())
 
+    def poll(self, n=0, maxage=0):
+        if self.pollreads == 'single' or self._mode == SIMULATION or \
+           self._sim_intercept or self._cache is None:
+            return super().poll(n, maxage)
+        _prefetched.current = AttributePrefetch(
+            self._dev, list(self.poll_attributes), self._limiter, self.log)
+        try:
+            return super().poll(n, maxage)
+        finally:
+            _prefetched.current = None
+
     def _hw_wait(self):
         """Wait until hardware status is not BUSY."""
         while PyTangoDevice.doStatus(self, 0)[0] == status.BUSY:
@@ -284,6 +372,21 @@ class PyTangoDevice(HasCommunication):
         dev.__dict__['_nicos_proxies_applied'] = True
         return dev
 
+    def _prefetchedResult(self, func, category, args, kwds):
+        """Return the result of a call from the attributes read in advance,
+        or None.
+        """
+        prefetch = getattr(_prefetched, 'current', None)
+        if prefetch is None or kwds or \
+           getattr(func, '__self__', None) is not prefetch.proxy:
+            return None
+        if category == 'attr_read' and len(args) == 1:
+            return prefetch.get(args[0])
+        if category == 'cmd' and args in (('State',), ('Status',)):
+            attr = prefetch.get(args[0])
+            return attr.value if attr is not None else None
+        return None
+
     def _applyGuardToFunc(self, func, category='cmd'):
         """
         Wrap given function with logging and exception mapping.
@@ -316,10 +419,18 @@ class PyTangoDevice(HasCommunication):
             else:
                 self.log.debug('[Tango] call: %s%r', func.__name__, args)
 
-            return self._com_retry(info, func, *args, **kwds)
+            result = self._prefetchedResult(func, category, args, kwds)
+            if result is not None:
+                return self._com_return(result, info + ' (prefetched)')
+            return self._com_retry(info, limited, *args, **kwds)
+
+        def limited(*args, **kwds):
+            # the host limit applies to each try, not to the delay between
+            with self._limiter:
+                return func(*args, **kwds)
 
         # hide the wrapping
-        wrap.__name__ = func.__name__
+        wrap.__name__ = limited.__name__ = func.__name__
 
         return wrap
 
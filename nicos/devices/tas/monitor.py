@@ -23,8 +23,6 @@
 
 """TAS specific detector devices."""
 
-from scipy.interpolate import interp1d
-
 from nicos.core import Attach, Param, Value, dictof
 from nicos.devices.generic import PostprocessPassiveChannel
 
@@ -51,6 +49,8 @@ class OrderCorrectedMonitor(PostprocessPassiveChannel):
     }
 
     def doInit(self, mode):
+        # scipy takes long to import, only do it when needed
+        from scipy.interpolate import interp1d
         # PostprocessPassiveChannel.doInit(self, mode)
         self._interp = interp1d(list(self.mapping.keys()),
                                 list(self.mapping.values()), kind='cubic')
@@ -27,7 +27,33 @@ import numpy as np
 
 from nicos import session
 from nicos.core.device import Readable
-from nicos.core.errors import NicosError
+from nicos.core.errors import ConfigurationError, NicosError
+
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+COMPRESSIONS = (None, 'gzip', 'lzf', 'bitshuffle')
+
+
+def compression_filter(compression, level=None):
+    """Return the keyword arguments for h5py's ``create_dataset`` that select
+    the given compression filter.
+
+    Bitshuffle needs the ``hdf5plugin`` package; without it, gzip is used.
+    """
+    if compression == 'bitshuffle':
+        if hdf5plugin is not None:
+            return dict(hdf5plugin.Bitshuffle())
+        session.log.warning('bitshuffle compression needs the hdf5plugin '
+                            'package, using gzip instead')
+        compression = 'gzip'
+    if compression == 'gzip':
+        return {'compression': 'gzip', 'compression_opts': level}
+    if compression == 'lzf':
+        return {'compression': 'lzf'}
+    return {}
 
 
 class NexusElementBase:
@@ -47,6 +73,14 @@ class NexusElementBase:
 
     dtype = None
 
+    # in files kept open in SWMR mode, datasets appended to in a scan are
+    # enlarged by this many points at once, and trimmed to the number of
+    # points written by trim() at the end; other files are valid after every
+    # update, so their datasets only grow by the points written
+    growstep = 100
+    _growstep = 1
+    _grown = None
+
     def __init__(self):
         self.doAppend = False
         self.np = 0
@@ -65,8 +99,21 @@ class NexusElementBase:
 
     def resize_dataset(self, dset):
         idx = self.np + 1
+        if self._grown is None:
+            self._grown = {}
+        self._grown[dset.name] = max(self._grown.get(dset.name, 0), idx)
         if len(dset) < idx:
-            dset.resize((idx,))
+            dset.resize((max(idx, len(dset) + self._growstep),))
+
+    def trim(self, h5file):
+        """Shrink the datasets enlarged by resize_dataset() to the number of
+        points actually written.
+        """
+        for name, size in (self._grown or {}).items():
+            dset = h5file[name]
+            if len(dset) > size:
+                dset.resize((size,))
+        self._grown = None
 
     def testAppend(self, sinkhandler):
         self.doAppend = bool((hasattr(sinkhandler.startdataset,
@@ -74,6 +121,9 @@ class NexusElementBase:
                               sinkhandler.startdataset.npoints > 1) or
                              hasattr(session, '_manualscan'))
         self.np = 0
+        self._grown = None
+        self._growstep = self.growstep \
+            if getattr(sinkhandler.sink, 'swmr', False) else 1
 
     def determineType(self):
         if self.dtype is None:
@@ -361,12 +411,23 @@ class DetectorDataset(NexusElementBase):
 
 
 class ImageDataset(NexusElementBase):
-    """Placeholder for a detector image."""
+    """Placeholder for a detector image.
+
+    Images are stored in chunks of one image, compressed with the filter
+    given by *compression* (one of `COMPRESSIONS`).  For gzip, the
+    compression level can be given by *compression_level*.
+    """
 
-    def __init__(self, detectorIDX, imageIDX, **attrs):
+    def __init__(self, detectorIDX, imageIDX, compression='gzip',
+                 compression_level=None, **attrs):
         NexusElementBase.__init__(self)
+        if compression not in COMPRESSIONS:
+            raise ConfigurationError('unknown compression %r for image '
+                                     'dataset' % compression)
         self.detectorIDX = detectorIDX
         self.imageIDX = imageIDX
+        self.compression = compression
+        self.compression_level = compression_level
         self.attrs = {}
         self.doAppend = False
         self.np = 0
@@ -387,6 +448,8 @@ class ImageDataset(NexusElementBase):
         arinfo = det.arrayInfo()
         myDesc = arinfo[self.imageIDX]
         rawshape = myDesc.shape
+        compression = compression_filter(self.compression,
+                                         self.compression_level)
         if self.doAppend:
             shape = list(rawshape)
             shape.insert(0, 1)
@@ -397,12 +460,12 @@ class ImageDataset(NexusElementBase):
             dset = h5parent.create_dataset(name, shape, maxshape=maxshape,
                                            chunks=tuple(chonk),
                                            dtype=myDesc.dtype,
-                                           compression='gzip')
+                                           **compression)
         else:
             dset = h5parent.create_dataset(name, rawshape,
                                            chunks=tuple(rawshape),
                                            dtype=myDesc.dtype,
-                                           compression='gzip')
+                                           **compression)
         self.createAttributes(dset, sinkhandler)
 
     def resize_dataset(self, dset, sinkhandler):
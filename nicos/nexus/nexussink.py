@@ -21,6 +21,9 @@
 #
 # *****************************************************************************
 
+import queue
+from contextlib import contextmanager
+
 import numpy
 from h5py import File as H5File
 from h5py.version import hdf5_version
@@ -32,22 +35,31 @@ from nicos.core.data.sink import DataFileBase
 from nicos.core.errors import NicosError
 from nicos.core.params import Param
 from nicos.devices.datasinks import FileSink
-from nicos.nexus.elements import NexusElementBase, NXAttribute, NXScanLink, \
-    NXTime
-from nicos.utils import importString
+from nicos.nexus.elements import NexusElementBase, NXAttribute, NXLink, \
+    NXScanLink, NXTime
+from nicos.utils import createThread, importString
 
 
 class NexusFile(DataFileBase):
 
+    # HDF5 library version bounds to create the file with
+    libver = None
+
     def __init__(self, shortpath, filepath):
         DataFileBase.__init__(self, shortpath, filepath)
-        with H5File(filepath, 'w') as h5file:
+        with H5File(filepath, 'w', libver=self.libver) as h5file:
             h5file.attrs['file_name'] = numpy.string_(filepath)
             h5file.attrs['HDF5_Version'] = numpy.string_(hdf5_version)
             tf = NXTime()
             h5file.attrs['file_time'] = numpy.string_(tf.formatTime())
 
 
+class NexusSWMRFile(NexusFile):
+    """A NeXus file in a format that can be written in SWMR mode."""
+
+    libver = 'latest'
+
+
 class NexusTemplateProvider:
     """A base class which provides the NeXus template for the NexusSinkHandler.
 
@@ -76,6 +88,65 @@ def copy_nexus_template(template):
     return template
 
 
+class NexusWriter:
+    """Executes the file updates of a sink handler in a separate thread, in
+    the order they were requested.
+
+    At most *maxqueue* updates can be pending; further requests block until
+    the writer has caught up.
+    """
+
+    def __init__(self, log, maxqueue=100):
+        self.log = log
+        self._queue = queue.Queue(maxqueue)
+        self._thread = createThread('nexus writer', self._run)
+
+    def submit(self, func, *args):
+        self._queue.put((func, args))
+
+    def finish(self):
+        """Wait until all pending updates are written."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            func, args = item
+            try:
+                func(*args)
+            except Exception:
+                self.log.exception('error writing NeXus file')
+
+
+class HandlerSnapshot:
+    """Stands in for the sink handler in updates done by the writer thread.
+
+    The datasets are fixed to those current when the update was requested,
+    all other attributes are taken from the handler.
+    """
+
+    def __init__(self, handler):
+        self._handler = handler
+        self.dataset = handler.dataset
+        self.startdataset = handler.startdataset
+
+    def __getattr__(self, name):
+        return getattr(self._handler, name)
+
+
+def copy_results(results):
+    """Copy the arrays of detector results, which the detectors may reuse
+    for the next point.
+    """
+    return {key: (value[0], [numpy.array(arr)
+                             if isinstance(arr, numpy.ndarray) else arr
+                             for arr in value[1]])
+            for (key, value) in results.items()}
+
+
 class NexusSinkHandler(DataSinkHandler):
     """
     For a scan NICOS sends first a scan dataset and then a point dataset
@@ -87,10 +158,26 @@ class NexusSinkHandler(DataSinkHandler):
     to disk for other programs to digest while the data is still being
     collected. Thus it is necessary to keep the file closed and open and
     close it only when data needs to be updated.
+
+    If the sink's ``swmr`` parameter is set, the file is instead kept open
+    for the whole measurement in HDF5's single-writer/multiple-reader mode,
+    in which other programs can follow the data being written.  In this mode,
+    no new HDF5 objects can be created after createStructure().
+
+    The template is walked only once, in createStructure(), which collects
+    the elements to write into a flat list of (group path, name, element).
+
+    If the sink's ``asyncwrite`` parameter is set, all updates of the file are
+    done by a `NexusWriter` thread, while the measurement continues.  The
+    elements then get a `HandlerSnapshot` instead of the handler, so that
+    they see the dataset the update belongs to.
     """
     def __init__(self, sink, dataset, detector):
         self.startdataset = None
         self._filename = None
+        self._h5file = None
+        self._writer = None
+        self._entries = []
         self.filepath = None
         self.template = {}
         DataSinkHandler.__init__(self, sink, dataset, detector)
@@ -106,7 +193,7 @@ class NexusSinkHandler(DataSinkHandler):
             # Generate the file
             h5file = self.manager.createDataFile(
                 self.dataset, self.sink.filenametemplate, self.sink.subdir,
-                fileclass=NexusFile)
+                fileclass=NexusSWMRFile if self.sink.swmr else NexusFile)
             self.filepath = h5file.filepath
 
     def begin(self):
@@ -120,11 +207,28 @@ class NexusSinkHandler(DataSinkHandler):
             if not self.dataset.metainfo:
                 self.manager.updateMetainfo()
             self.createStructure()
+            if self.sink.asyncwrite:
+                self._writer = NexusWriter(self.log)
 
     def createStructure(self):
-        with H5File(self._filename, 'r+') as h5file:
-            h5obj = h5file['/']
-            self.create(self.template, h5obj)
+        if not self.sink.swmr:
+            with H5File(self._filename, 'r+') as h5file:
+                self.create(self.template, h5file['/'])
+            self._entries = self.collectEntries(self.template, '/')
+            return
+        h5file = H5File(self._filename, 'r+', libver='latest')
+        try:
+            self.create(self.template, h5file['/'])
+            self._entries = self.collectEntries(self.template, '/')
+            # links cannot be created anymore once SWMR writing started
+            for h5obj, key, val in self.iterEntries(h5file):
+                if isinstance(val, NXLink):
+                    val.update(key, h5obj, self, {})
+            h5file.swmr_mode = True
+        except Exception:
+            h5file.close()
+            raise
+        self._h5file = h5file
 
     def create(self, dictdata, h5obj):
         for key, val in dictdata.items():
@@ -145,70 +249,75 @@ class NexusSinkHandler(DataSinkHandler):
             else:
                 self.log.warning('Cannot write %r of type %r', key, type(val))
 
-    def updateValues(self, dictdata, h5obj, values):
-        if self.dataset.settype == POINT:
-            for key, val in dictdata.items():
-                if isinstance(val, dict):
-                    nxname = key.split(':')[0]
-                    childh5obj = h5obj[nxname]
-                    self.updateValues(val, childh5obj, values)
-                elif isinstance(val, str):
-                    # No need to update attributes
-                    pass
-                elif isinstance(val, NexusElementBase):
-                    val.update(key, h5obj, self, values)
-                else:
-                    self.log.warning('Cannot identify and update %r', key)
-
-    def append(self, dictdata, h5obj, subset):
+    def collectEntries(self, dictdata, path):
+        """Return a list of (group path, name, element) for all elements of
+        the template that need to be updated, in template order.
+        """
+        entries = []
         for key, val in dictdata.items():
             if isinstance(val, dict):
-                nxname = key.split(':', 1)[0]
-                childh5obj = h5obj[nxname]
-                self.append(val, childh5obj, subset)
-            elif isinstance(val, str):
-                # No need to update attributes
-                pass
+                # groups without nxclass have not been created
+                if ':' in key:
+                    entries.extend(self.collectEntries(
+                        val, path.rstrip('/') + '/' + key.rsplit(':', 1)[0]))
             elif isinstance(val, NexusElementBase):
-                try:
-                    val.append(key, h5obj, self, subset)
-                except Exception as err:
-                    self.log.warning('Exception %r on key %r', err, key)
-            else:
-                self.log.warning('Cannot identify and append %r', key)
+                entries.append((path, key, val))
+        return entries
+
+    def iterEntries(self, h5file):
+        """Yield (h5 group, name, element) for all template elements."""
+        groups = {}
+        for path, key, val in self._entries:
+            h5obj = groups.get(path)
+            if h5obj is None:
+                h5obj = groups[path] = h5file[path]
+            yield h5obj, key, val
+
+    @contextmanager
+    def openFile(self):
+        if self._h5file is not None:
+            yield self._h5file
+            self._h5file.flush()
+        else:
+            with H5File(self._filename, 'r+') as h5file:
+                yield h5file
+
+    def write(self, func, *args):
+        """Call ``func(handler, *args)`` to update the file, either directly
+        or in the writer thread.
+        """
+        if self._writer is None:
+            func(self, *args)
+        else:
+            self._writer.submit(func, HandlerSnapshot(self), *args)
 
     def putValues(self, values):
+        if not values or self.dataset.settype != POINT:
+            return
+        self.write(self.writeValues, dict(values))
+
+    def writeValues(self, handler, values):
         try:
-            with H5File(self._filename, 'r+') as h5file:
-                h5obj = h5file['/']
-                if values:
-                    self.updateValues(self.template, h5obj, values)
+            with self.openFile() as h5file:
+                for h5obj, key, val in self.iterEntries(h5file):
+                    val.update(key, h5obj, handler, values)
         except BlockingIOError:
             # This is not interesting to know
             pass
 
-    def resultValues(self, dictdata, h5obj, results):
-        for key, val in dictdata.items():
-            if isinstance(val, dict):
-                nxname = key.split(':')[0]
-                childh5obj = h5obj[nxname]
-                self.resultValues(val, childh5obj, results)
-            elif isinstance(val, str):
-                # No need to update attributes
-                pass
-            elif isinstance(val, NexusElementBase):
-                val.results(key, h5obj, self, results)
-            else:
-                self.log.warning('Cannot add results to %r', key)
-
     def putResults(self, quality, results):
         # Suppress updating data files when updating live data
         if quality == LIVE:
             return
+        if self._writer is not None:
+            results = copy_results(results)
+        self.write(self.writeResults, results)
+
+    def writeResults(self, handler, results):
         try:
-            with H5File(self._filename, 'r+') as h5file:
-                h5obj = h5file['/']
-                self.resultValues(self.template, h5obj, results)
+            with self.openFile() as h5file:
+                for h5obj, key, val in self.iterEntries(h5file):
+                    val.results(key, h5obj, handler, results)
         except BlockingIOError:
             session.log.warning('Other process is accessing NeXus file '
                                 'while saving results')
@@ -219,35 +328,30 @@ class NexusSinkHandler(DataSinkHandler):
             if self._filename is None:
                 self.log.info('skipping: %s', self.dataset.settype)
                 return
-            try:
-                with H5File(self._filename, 'r+') as h5file:
-                    h5obj = h5file['/']
-                    self.append(self.template, h5obj, subset)
-            except BlockingIOError:
-                session.log.warning('Other process is accessing NeXus file '
-                                    'while updating, possibly loosing '
-                                    'scan point')
-
-    def find_scan_link(self, h5obj, template):
-        for key, val in template.items():
-            if isinstance(val, dict):
-                nxname = key.split(':', 1)[0]
-                childobj = h5obj[nxname]
-                link = self.find_scan_link(childobj, val)
-                if link is not None:
-                    return link
-            if isinstance(val, NXScanLink):
-                return h5obj.name
-        return None
+            self.write(self.writeSubset, subset)
 
-    def make_scan_links(self, h5obj, template, linkpath):
-        for key, val in template.items():
-            if isinstance(val, dict):
-                nxname = key.split(':')[0]
-                childobj = h5obj[nxname]
-                self.make_scan_links(childobj, val, linkpath)
-            elif isinstance(val, NexusElementBase):
-                val.scanlink(key, self, h5obj, linkpath)
+    def writeSubset(self, handler, subset):
+        try:
+            with self.openFile() as h5file:
+                for h5obj, key, val in self.iterEntries(h5file):
+                    try:
+                        val.append(key, h5obj, handler, subset)
+                    except Exception as err:
+                        self.log.warning('Exception %r on key %r', err, key)
+        except BlockingIOError:
+            session.log.warning('Other process is accessing NeXus file '
+                                'while updating, possibly loosing '
+                                'scan point')
+
+    def make_scan_links(self, h5file):
+        for path, _key, val in self._entries:
+            if isinstance(val, NXScanLink):
+                linkpath = path
+                break
+        else:
+            return
+        for h5obj, key, val in self.iterEntries(h5file):
+            val.scanlink(key, self, h5obj, linkpath)
 
     def end(self):
         """
@@ -262,11 +366,18 @@ class NexusSinkHandler(DataSinkHandler):
         """
         if self.startdataset.finished is not None:
             # if self.startdataset.settype == SCAN:
-            with H5File(self._filename, 'r+') as h5file:
-                h5obj = h5file['/']
-                linkpath = self.find_scan_link(h5obj, self.template)
-                if linkpath is not None:
-                    self.make_scan_links(h5obj, self.template, linkpath)
+            if self._writer is not None:
+                self._writer.finish()
+                self._writer = None
+            if self._h5file is not None:
+                self._h5file.close()
+                self._h5file = None
+            if self._filename is not None:
+                with H5File(self._filename, 'r+') as h5file:
+                    for _path, _key, val in self._entries:
+                        val.trim(h5file)
+                    self.make_scan_links(h5file)
+            self._entries = []
             self._filename = None
             self.sink.end()
             self.startdataset = None
@@ -287,6 +398,16 @@ class NexusSink(FileSink):
         'templateclass': Param('Python class implementing '
                                'NexusTemplateProvider',
                                type=str, mandatory=True),
+        'swmr':          Param('Keep the file open while writing, in HDF5 '
+                               'SWMR mode to let other programs follow it',
+                               type=bool, default=False,
+                               ext_desc='SWMR files need HDF5 1.10 or later '
+                               'to read, and the elements of the template '
+                               'must not create new HDF5 objects after the '
+                               'file structure has been created.'),
+        'asyncwrite':    Param('Write to the file in a separate thread, '
+                               'while the measurement continues',
+                               type=bool, default=False),
     }
 
     handlerclass = NexusSinkHandler
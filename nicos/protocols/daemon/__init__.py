@@ -255,6 +255,16 @@ class ServerTransport:
         """
         raise NotImplementedError
 
+    def send_events(self, events):
+        """Send several events to the client.
+
+        *events* is a list of (evtname, payload, blobs) tuples as for
+        `send_event()`.  Transports can override this to send the events
+        with fewer network operations.
+        """
+        for evtname, payload, blobs in events:
+            self.send_event(evtname, payload, blobs)
+
 
 class ClientTransport:
     """Represents the transport of data, client side."""
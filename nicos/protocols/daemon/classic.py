@@ -28,8 +28,16 @@ import json
 import pickle
 import struct
 
+import numpy as np
+
 from nicos.protocols.daemon import DAEMON_COMMANDS, DAEMON_EVENTS, \
-    Serializer as BaseSerializer
+    ProtocolError, Serializer as BaseSerializer
+from nicos.utils import readonlydict, readonlylist
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 # default port for the daemon
 
@@ -38,13 +46,14 @@ DEFAULT_PORT = 1301
 # protocol version, increment this whenever making changes to command
 # arguments or adding new commands
 
-PROTO_VERSION = 23
+PROTO_VERSION = 24
 
 # old versions with which the client is still compatible
 
 # 21 -> 22: added "done" event
 # 22 -> 23: added interval in history queries
-COMPATIBLE_PROTO_VERSIONS = [23]
+# 23 -> 24: added time and request filters in message queries
+COMPATIBLE_PROTO_VERSIONS = [23, 24]
 
 # to encode payload lengths as network-order 32-bit unsigned int
 LENGTH = struct.Struct('>I')
@@ -164,7 +173,137 @@ class JsonSerializer(BaseSerializer):
         return evtname, self.decoder.decode(data.decode())
 
 
+# extension type codes used by the binary serializer
+EXT_TUPLE = 1
+EXT_SET = 2
+EXT_FROZENSET = 3
+EXT_READONLYLIST = 4
+EXT_READONLYDICT = 5
+EXT_NDARRAY = 6
+EXT_PICKLE = 127
+
+
+class BinarySerializer(BaseSerializer):
+    """Compact binary serializer based on the msgpack format.
+
+    Basic types are encoded natively by msgpack; tuples, sets, the read-only
+    NICOS containers and numpy arrays get their own extension types so that
+    they survive a round trip unchanged.  numpy arrays are transferred as raw
+    buffers together with dtype and shape.  Everything else falls back to an
+    embedded pickle, like the JSON serializer does.
+    """
+
+    name = 'binary'
+
+    def __init__(self):
+        if msgpack is None:
+            raise ProtocolError('the binary serializer requires the msgpack '
+                                'module')
+
+    def _pack(self, obj):
+        # no shared Packer instance: events are serialized from several
+        # threads at once, and Packer objects are not thread-safe
+        try:
+            return msgpack.packb(obj, default=self._default,
+                                 use_bin_type=True, strict_types=True)
+        except OverflowError:
+            # integers beyond 64 bits are not supported by msgpack
+            return msgpack.packb(msgpack.ExtType(EXT_PICKLE,
+                                                 pickle.dumps(obj, 2)))
+
+    def _default(self, obj):
+        # with strict_types, subclasses of the natively supported types
+        # end up here as well
+        if isinstance(obj, tuple):
+            return msgpack.ExtType(EXT_TUPLE, self._pack(list(obj)))
+        if isinstance(obj, readonlylist):
+            return msgpack.ExtType(EXT_READONLYLIST, self._pack(list(obj)))
+        if isinstance(obj, readonlydict):
+            return msgpack.ExtType(EXT_READONLYDICT, self._pack(dict(obj)))
+        if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+            obj = np.ascontiguousarray(obj)
+            header = self._pack([obj.dtype.str, list(obj.shape)])
+            return msgpack.ExtType(EXT_NDARRAY, header + obj.tobytes())
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, set):
+            return msgpack.ExtType(EXT_SET, self._pack(list(obj)))
+        if isinstance(obj, frozenset):
+            return msgpack.ExtType(EXT_FROZENSET, self._pack(list(obj)))
+        if isinstance(obj, list):
+            return list(obj)
+        if isinstance(obj, dict):
+            return dict(obj)
+        if isinstance(obj, str):
+            return str(obj)
+        if isinstance(obj, bool):
+            return bool(obj)
+        if isinstance(obj, int):
+            return int(obj)
+        if isinstance(obj, float):
+            return float(obj)
+        return msgpack.ExtType(EXT_PICKLE, pickle.dumps(obj, 2))
+
+    def _ext_hook(self, code, data):
+        if code == EXT_TUPLE:
+            return tuple(self._unpack(data))
+        if code == EXT_NDARRAY:
+            unpacker = msgpack.Unpacker(None, ext_hook=self._ext_hook,
+                                        raw=False, strict_map_key=False)
+            unpacker.feed(data)
+            dtype, shape = unpacker.unpack()
+            # copy, so that the array does not reference the (potentially
+            # much larger) message buffer and is writable
+            return np.frombuffer(data, dtype, offset=unpacker.tell()) \
+                .reshape(shape).copy()
+        if code == EXT_READONLYLIST:
+            return readonlylist(self._unpack(data))
+        if code == EXT_READONLYDICT:
+            return readonlydict(self._unpack(data))
+        if code == EXT_SET:
+            return set(self._unpack(data))
+        if code == EXT_FROZENSET:
+            return frozenset(self._unpack(data))
+        if code == EXT_PICKLE:
+            return pickle.loads(data, encoding='latin1')
+        raise ProtocolError('unknown extension type %d' % code)
+
+    def _unpack(self, data):
+        return msgpack.unpackb(data, ext_hook=self._ext_hook, raw=False,
+                               strict_map_key=False)
+
+    # serializing
+
+    def serialize_cmd(self, cmdname, args):
+        return self._pack(args)
+
+    def serialize_ok_reply(self, payload):
+        return self._pack(payload)
+
+    def serialize_error_reply(self, reason):
+        return self._pack(reason)
+
+    def serialize_event(self, evtname, payload):
+        return self._pack(payload)
+
+    # deserializing
+
+    def deserialize_cmd(self, data, cmdname=None):
+        return cmdname, self._unpack(data)
+
+    def deserialize_reply(self, data, success=None):
+        assert success is not None
+        data = self._unpack(data) if data else None
+        return success, data
+
+    def deserialize_event(self, data, evtname=None):
+        return evtname, self._unpack(data)
+
+
 SERIALIZERS = {
     ClassicSerializer.name: ClassicSerializer,
     JsonSerializer.name: JsonSerializer,
 }
+
+if msgpack is not None:
+    SERIALIZERS[BinarySerializer.name] = BinarySerializer
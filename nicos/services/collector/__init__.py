@@ -23,16 +23,18 @@
 
 """The NICOS cache collector daemon."""
 
-import queue
 import re
+import threading
+from collections import OrderedDict
+from time import sleep, time as currenttime
 
 from nicos.core import Attach, Override, Param
 from nicos.core.device import Device
 from nicos.core.errors import ConfigurationError
 from nicos.core.mixins import DeviceMixinBase
-from nicos.core.params import dictof, listof, oneof
+from nicos.core.params import dictof, floatrange, intrange, listof, oneof
 from nicos.devices.cacheclient import BaseCacheClient
-from nicos.protocols.cache import OP_TELL, OP_TELLOLD
+from nicos.protocols.cache import OP_TELL, OP_TELLOLD, cache_dump
 from nicos.utils import createThread
 
 try:
@@ -93,17 +95,134 @@ class ForwarderBase(CacheKeyFilter, DeviceMixinBase):
     def _putChange(self, timestamp, ttl, key, op, value):
         pass
 
+    def _forwardStats(self):
+        """Return a dictionary of statistics to publish, or None."""
+        return None
 
-class CacheForwarder(ForwarderBase, BaseCacheClient):
+
+class BatchingForwarder(ForwarderBase):
+    """Base for forwarders that send cache updates in batches.
+
+    Updates are collected for `batchwindow` seconds; multiple updates of the
+    same key within that time are coalesced, so that only the latest value is
+    forwarded.  If the destination cannot keep up, at most `maxpending` keys
+    are kept and the oldest updates are dropped.
+
+    Subclasses implement `_sendBatch` and can implement `_canSend` to hold
+    back updates while the destination is not ready.
+    """
+
+    parameters = {
+        'batchwindow': Param('Time to collect updates before forwarding '
+                             'them as one batch', type=floatrange(0, 10),
+                             unit='s', default=0.1),
+        'maxbatch':    Param('Maximum number of updates in one batch',
+                             type=intrange(1, 100000), default=500),
+        'maxpending':  Param('Maximum number of keys waiting to be '
+                             'forwarded, further updates are dropped',
+                             type=intrange(1, 10000000), default=10000),
+    }
+
+    def _initBatching(self):
+        self._stoprequest = False
+        # maps the key to the latest (timestamp, ttl, key, op, value)
+        self._pending = OrderedDict()
+        self._pendcond = threading.Condition()
+        self._sent = self._dropped = self._coalesced = 0
+        self._batcher = createThread('%s batcher' % self, self._batchLoop,
+                                     start=False)
+
+    def _startWorker(self):
+        self._batcher.start()
+
+    def _stopBatching(self):
+        with self._pendcond:
+            self._stoprequest = True
+            self._pendcond.notify()
+
+    def _putChange(self, timestamp, ttl, key, op, value):
+        if not self._checkKey(key):
+            return
+        with self._pendcond:
+            if key in self._pending:
+                self._coalesced += 1
+            elif len(self._pending) >= self.maxpending:
+                self._pending.popitem(last=False)
+                self._dropped += 1
+            self._pending[key] = (timestamp, ttl, key, op, value)
+            if len(self._pending) == 1:
+                self._pendcond.notify()
+
+    def _canSend(self):
+        return True
+
+    def _sendBatch(self, batch):
+        """Send a list of (timestamp, ttl, key, op, value) tuples.
+
+        Can return the number of updates that could not be sent.
+        """
+        raise NotImplementedError
+
+    def _backlog(self):
+        """Return the number of updates queued beyond the pending ones."""
+        return 0
+
+    def _nextBatch(self):
+        with self._pendcond:
+            while not self._pending and not self._stoprequest:
+                self._pendcond.wait()
+        if self._stoprequest:
+            return None
+        # wait for the batch window (or the destination) before taking the
+        # updates, to coalesce quickly repeated updates
+        sleep(self.batchwindow)
+        while not self._canSend() and not self._stoprequest:
+            sleep(max(self.batchwindow, 0.1))
+        with self._pendcond:
+            pending = self._pending
+            return [pending.popitem(last=False)[1]
+                    for _ in range(min(self.maxbatch, len(pending)))]
+
+    def _batchLoop(self):
+        while not self._stoprequest:
+            batch = self._nextBatch()
+            if not batch:
+                continue
+            try:
+                failed = self._sendBatch(batch) or 0
+            except Exception:
+                self.log.warning('could not forward %d updates', len(batch),
+                                 exc=True)
+                failed = len(batch)
+            with self._pendcond:
+                self._sent += len(batch) - failed
+                self._dropped += failed
+
+    def _forwardStats(self):
+        with self._pendcond:
+            return {'queued': len(self._pending) + self._backlog(),
+                    'sent': self._sent, 'dropped': self._dropped,
+                    'coalesced': self._coalesced}
+
+
+class CacheForwarder(BatchingForwarder, BaseCacheClient):
     """Forwards cache updates to another cache.
 
     The `prefix` parameter of this device can be set to something other than
     `nicos/` to put keys from various sources into unique namespaces.
+
+    Each batch of updates is sent as one multi-line write.  While the target
+    cache is not connected, updates are coalesced and held back.
     """
 
     def doInit(self, mode):
         BaseCacheClient.doInit(self, mode)
         self._initFilters()
+        self._initBatching()
+
+    def doShutdown(self):
+        self._stopBatching()
+        BaseCacheClient.doShutdown(self)
 
     def _connect_action(self):
         # send no requests for keys or updates
@@ -111,15 +230,29 @@ class CacheForwarder(ForwarderBase, BaseCacheClient):
 
     def _startWorker(self):
         self._worker.start()
+        self._batcher.start()
 
-    def _putChange(self, timestamp, ttl, key, op, value):
-        if not self._checkKey(key):
-            return
-        if value is None:
-            msg = '%s@%s%s%s\n' % (timestamp, self._prefix, key, OP_TELL)
-        else:
-            msg = '%s@%s%s%s%s\n' % (timestamp, self._prefix, key, op, value)
-        self._queue.put(msg)
+    def _canSend(self):
+        # do not let the send queue grow while the target is away or slow
+        return self._connected and self._queue.qsize() < 10
+
+    def _backlog(self):
+        return self._queue.qsize()
+
+    def _mapKey(self, key):
+        return key
+
+    def _sendBatch(self, batch):
+        msgs = []
+        for (timestamp, _ttl, key, op, value) in batch:
+            key = self._mapKey(key)
+            if value is None:
+                msgs.append('%s@%s%s%s\n' % (timestamp, self._prefix, key,
+                                             OP_TELL))
+            else:
+                msgs.append('%s@%s%s%s%s\n' % (timestamp, self._prefix, key,
+                                               op, value))
+        self._queue.put(''.join(msgs))
 
     def _handle_msg(self, _time, _ttlop, _ttl, _tsop, _key, _op, _value):
         pass
@@ -135,22 +268,18 @@ class MappingCacheForwarder(CacheForwarder):
                      mandatory=True),
     }
 
-    def _putChange(self, timestamp, ttl, key, op, value):
-        if not self._checkKey(key):
-            return
+    def _mapKey(self, key):
         dev, slash, sub = key.partition('/')
-        dev = self.map.get(dev, dev)
-        if value is None:
-            msg = '%s@%s%s%s\n' % (timestamp, self._prefix, dev + slash + sub,
-                                   OP_TELL)
-        else:
-            msg = '%s@%s%s%s%s\n' % (timestamp, self._prefix,
-                                     dev + slash + sub, op, value)
-        self._queue.put(msg)
+        return self.map.get(dev, dev) + slash + sub
+
 
+class WebhookForwarder(BatchingForwarder, Device):
+    """Forwards cache updates to a web service.
 
-class WebhookForwarder(ForwarderBase, Device):
-    """Forwards cache updates to a web service."""
+    Requests are made over a persistent (keep-alive) HTTP session.  With
+    `jsonarrays`, each batch of updates is posted as one JSON array instead of
+    one request per update.
+    """
 
     parameters = {
         'hook_url':      Param('Hook URL endpoint', type=str, mandatory=True),
@@ -161,54 +290,63 @@ class WebhookForwarder(ForwarderBase, Device):
                                type=oneof('plain', 'json'), mandatory=True),
         'jsonname':      Param('JSON parameter name (used for GET requests)',
                                type=str, default='json'),
+        'jsonarrays':    Param('Post each batch of updates as one JSON array '
+                               '(requires POST and json encoding)',
+                               type=bool, default=False),
+    }
+
+    parameter_overrides = {
+        'maxpending': Override(default=1000),
     }
 
     def doInit(self, mode):
         if requests is None:
             raise ConfigurationError(self, 'requests package is missing')
+        if self.jsonarrays and (self.http_mode != 'POST' or
+                                self.paramencoding != 'json'):
+            raise ConfigurationError(self, 'jsonarrays requires POST mode and '
+                                     'json encoding')
         self._prefix = self.prefix.strip('/')
         if self._prefix:
             self._prefix += '/'
         self._initFilters()
-        self._queue = queue.Queue(1000)
-        self._processor = createThread('webhookprocessor', self._processQueue)
-
-    def _putChange(self, timestamp, ttl, key, op, value):
-        if not self._checkKey(key):
+        self._initBatching()
+        self._session = requests.Session()
+
+    def doShutdown(self):
+        self._stopBatching()
+        self._session.close()
+
+    def _sendBatch(self, batch):
+        pdicts = [dict(time=timestamp, ttl=ttl, key=self._prefix + key,
+                       op=op, value=value)
+                  for (timestamp, ttl, key, op, value) in batch]
+        if self.jsonarrays:
+            self._session.post(self.hook_url, json=pdicts, timeout=0.5)
             return
-        pdict = dict(time=timestamp, ttl=ttl, key=self._prefix + key,
-                     op=op, value=value)
-        retry = 2
-        while retry:
+        failed = 0
+        for pdict in pdicts:
             try:
-                self._queue.put(pdict, False)
-                break
-            except queue.Full:
-                self._queue.get()
-                self._queue.task_done()
-                retry -= 1
+                self._webHookTask(pdict)
+            except Exception:
+                if not failed:
+                    self.log.warning('Exception during webhook call',
+                                     exc=True)
+                failed += 1
+        return failed
 
     def _webHookTask(self, pdict):
-        try:
-            if self.paramencoding == 'json':
-                if self.http_mode == 'GET':
-                    pdict = {self.jsonname: json.dumps(pdict)}
-                    requests.get(self.hook_url, params=pdict, timeout=0.5)
-                elif self.http_mode == 'POST':
-                    requests.post(self.hook_url, json=pdict, timeout=0.5)
-            else:
-                if self.http_mode == 'GET':
-                    requests.get(self.hook_url, params=pdict, timeout=0.5)
-                elif self.http_mode == 'POST':
-                    requests.post(self.hook_url, data=pdict, timeout=0.5)
-        except Exception:
-            self.log.warning('Execption during webhook call', exc=True)
-
-    def _processQueue(self):
-        while not self._stoprequest:
-            item = self._queue.get()
-            self._webHookTask(item)
-            self._queue.task_done()
+        if self.paramencoding == 'json':
+            if self.http_mode == 'GET':
+                pdict = {self.jsonname: json.dumps(pdict)}
+                self._session.get(self.hook_url, params=pdict, timeout=0.5)
+            elif self.http_mode == 'POST':
+                self._session.post(self.hook_url, json=pdict, timeout=0.5)
+        else:
+            if self.http_mode == 'GET':
+                self._session.get(self.hook_url, params=pdict, timeout=0.5)
+            elif self.http_mode == 'POST':
+                self._session.post(self.hook_url, data=pdict, timeout=0.5)
 
 
 class Collector(CacheKeyFilter, BaseCacheClient):
@@ -219,6 +357,16 @@ class Collector(CacheKeyFilter, BaseCacheClient):
                              ForwarderBase, multiple=True),
     }
 
+    parameters = {
+        'statsinterval': Param('Interval for publishing the forwarding '
+                               'statistics in the source cache (0 to disable)',
+                               type=floatrange(0), unit='s', default=10,
+                               ext_desc='The statistics of each forwarder are '
+                               'published as ``collector/<forwarder>/queued``, '
+                               '``.../sent``, ``.../dropped`` and '
+                               '``.../coalesced``.'),
+    }
+
     parameter_overrides = {
         'prefix': Override(mandatory=False, default='nicos/'),
     }
@@ -226,9 +374,29 @@ class Collector(CacheKeyFilter, BaseCacheClient):
     def doInit(self, mode):
         BaseCacheClient.doInit(self, mode)
         self._initFilters()
+        self._publish_at = 0
         for service in self._attached_forwarders:
             service._startWorker()
 
+    def _wait_data(self):
+        if self.statsinterval and currenttime() > self._publish_at:
+            self._publishStats()
+
+    def _publishStats(self):
+        now = currenttime()
+        self._publish_at = now + self.statsinterval
+        # the statistics expire if the collector is gone
+        ttl = 3 * self.statsinterval
+        for service in self._attached_forwarders:
+            stats = service._forwardStats()
+            if not stats:
+                continue
+            self._queue.put(''.join(
+                '%s+%s@collector/%s/%s%s%s\n' % (now, ttl,
+                                                  service.name.lower(), key,
+                                                  OP_TELL, cache_dump(value))
+                for (key, value) in sorted(stats.items())))
+
     def _handle_msg(self, time, ttlop, ttl, tsop, key, op, value):
         if not key.startswith(self._prefix):
             return False
@@ -26,13 +26,17 @@
 import sys
 import threading
 import time
+from math import ceil
+from os import path
 
 from nicos import config, nicos_version
-from nicos.core import Attach, ConfigurationError, Device, Param, host, listof
+from nicos.core import Attach, ConfigurationError, Device, Param, host, \
+    intrange, listof, oneof
 from nicos.core.utils import system_user
 from nicos.protocols.daemon.classic import DEFAULT_PORT
 from nicos.services.daemon.auth import Authenticator
 from nicos.services.daemon.script import ExecutionController
+from nicos.services.daemon.utils import COALESCE_POLICIES, MessageLog
 from nicos.utils import createThread, formatExtendedStack, importString, \
     parseHostPort
 
@@ -76,7 +80,25 @@ class NicosDaemon(Device):
         'simmode':        Param('Whether to always start in dry run mode',
                                 type=bool),
         'autosimulate':   Param('Whether to simulate scripts when running them',
-                                type=bool, default=False)
+                                type=bool, default=False),
+        'coalesceevents': Param('Events for which only the latest one is '
+                                'sent to clients that fall behind',
+                                type=listof(oneof(*COALESCE_POLICIES)),
+                                default=sorted(COALESCE_POLICIES),
+                                ext_desc='For ``cache`` events, this applies '
+                                'per cache key; for ``message`` events, only '
+                                'to ACTION messages.'),
+        'maxmessages':    Param('Number of log messages kept in memory for '
+                                'clients that request the message history',
+                                type=intrange(100, 10000000), default=10000),
+        'spillmessages':  Param('Number of older log messages kept on disk '
+                                'in addition to those in memory',
+                                type=intrange(0, 100000000), default=100000,
+                                ext_desc='Messages are stored in segments of '
+                                '5000 messages in the ``daemon-messages`` '
+                                'subdirectory of the logging directory, and '
+                                'kept across restarts.  Clients only get '
+                                'them when paging back through the history.'),
     }
 
     def doInit(self, mode):
@@ -95,7 +117,20 @@ class NicosDaemon(Device):
                                                self.autosimulate)
 
         # cache log messages emitted so far
-        self._messages = []
+        spilldir = None
+        if self.spillmessages:
+            spilldir = path.join(config.nicos_root, config.logging_path,
+                                 'daemon-messages')
+        try:
+            self._messages = MessageLog(
+                self.maxmessages, spilldir,
+                maxsegments=max(1, ceil(self.spillmessages / 5000)))
+        except OSError as err:
+            self.log.warning('cannot store old messages on disk: %s', err)
+            self._messages = MessageLog(self.maxmessages)
+
+        self._coalesce_policies = {event: COALESCE_POLICIES[event]
+                                   for event in self.coalesceevents}
 
         host, port = parseHostPort(self.server, DEFAULT_PORT)
 
@@ -141,6 +176,10 @@ class NicosDaemon(Device):
             else:
                 name = str(tid)
             self.log.info('%s: %s', name, formatExtendedStack(frame))
+        for handler in list(getattr(self._server, 'handlers', {}).values()):
+            self.log.info('handler #%s event statistics (sent/coalesced/'
+                          'dropped): %s', handler.ident,
+                          handler.event_stats())
 
     def start(self):
         """Start the daemon's server."""
@@ -162,6 +201,8 @@ class NicosDaemon(Device):
         self._server.stop()
         self._worker.join()
         self._server.close()
+        # keep the messages in memory for the next run
+        self._messages.flush()
 
     def current_script(self):
         return self._controller.current_script
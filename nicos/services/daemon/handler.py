@@ -89,7 +89,7 @@ def command(needcontrol=False, needscript=None, name=None):
 
 
 # unique objects
-stop_queue = (object(), '', [])
+stop_queue = (object(), '', [], None)
 no_msg = object()
 
 
@@ -107,12 +107,18 @@ class ConnectionHandler:
     respectively.
     """
 
+    # maximum number of events to send at once
+    max_batch = 100
+
     def __init__(self, daemon):
         self.daemon = daemon
         self.controller = daemon._controller
         # limit memory usage to 100 Megs
         self.event_queue = SizedQueue(100*1024*1024)
         self.event_mask = set()
+        # number of events sent, and dropped because the queue was full
+        self.events_sent = {}
+        self.events_dropped = {}
         self.log = LoggerWrapper(self.daemon.log, '[new handler] ')
 
     def setIdent(self, ident):
@@ -231,22 +237,52 @@ class ConnectionHandler:
 
     # -- Event thread entry point ---------------------------------------------
 
+    def event_stats(self):
+        """Return a dictionary with statistics about the events for this
+        client, per event name.
+
+        Each value is a tuple of the number of sent, coalesced (i.e. not sent
+        because a newer event superseded them) and dropped events.
+        """
+        with self.event_queue.mutex:
+            coalesced = dict(self.event_queue.coalesced)
+        return {event: (self.events_sent.get(event, 0),
+                        coalesced.get(event, 0),
+                        self.events_dropped.get(event, 0))
+                for event in set(self.events_sent) | set(coalesced) |
+                set(self.events_dropped)}
+
     def event_sender(self):
         """Take events from the handler instance's event queue and send them
         to the client.
+
+        All events that have piled up in the queue since the last send are
+        sent together, up to `max_batch` events at once.
         """
         self.log.info('event sender started')
         queue_get = self.event_queue.get
         event_mask = self.event_mask
-        while 1:
-            item = queue_get()
-            if item is stop_queue:
-                break
-            event, data, blobs = item
-            if event in event_mask:
+        sent = self.events_sent
+        max_batch = self.max_batch
+        stop = False
+        while not stop:
+            items = [queue_get()]
+            try:
+                while len(items) < max_batch:
+                    items.append(queue_get(False))
+            except queue.Empty:
+                pass
+            batch = []
+            for item in items:
+                if item is stop_queue:
+                    stop = True
+                    break
+                if item[0] not in event_mask:
+                    batch.append(item[:3])
+            if not batch:
                 continue
             try:
-                self.send_event(event, data, blobs)
+                self.send_events(batch)
             except socket.timeout:
                 # XXX move socket specific error handling to transport
                 self.log.error('send timeout in event sender')
@@ -255,9 +291,17 @@ class ConnectionHandler:
                 self.log.warning('connection broken in event sender: %s', err)
                 break
             except Exception:
-                self.log.exception('exception in event sender; event: %s, '
-                                   'data: %s', event, repr(data)[:1000])
+                self.log.exception('exception in event sender; events: %s',
+                                   repr(batch)[:1000])
+            else:
+                for (event, _, _) in batch:
+                    sent[event] = sent.get(event, 0) + 1
         self.log.info('closing connections from event sender')
+        stats = self.event_stats()
+        if stats:
+            self.log.info('event statistics (sent/coalesced/dropped): %s',
+                          ', '.join('%s %d/%d/%d' % ((event,) + stats[event])
+                                    for event in sorted(stats)))
         self.close()
 
     # -- Script control commands ----------------------------------------------
@@ -566,17 +610,23 @@ class ConnectionHandler:
         ))
 
     @command()
-    def getmessages(self, n):
-        """Return the last *n* messages.
+    def getmessages(self, n, fromtime=None, totime=None, reqid=None):
+        """Return the last *n* messages, optionally filtered.
+
+        To page back through the message history, pass the time and the
+        sequence number (the last entry) of the oldest message received so far
+        as a pair for *totime*.
 
         :param n: number of messages to transfer or '*' for all messages
+        :param fromtime: if given, only messages at or after this time
+        :param totime: if given, only messages before this time, or before the
+           message with this (time, sequence number) pair
+        :param reqid: if given, only messages of the request with this ID
         :returns: list of messages (each message being a list of logging
            fields)
         """
-        if n == '*':
-            self.send_ok_reply(self.daemon._messages)
-        else:
-            self.send_ok_reply(self.daemon._messages[-int(n):])
+        self.send_ok_reply(self.daemon._messages.query(
+            None if n == '*' else int(n), fromtime, totime, reqid))
 
     @command()
     def getscript(self):
@@ -37,6 +37,10 @@ from nicos.protocols.daemon.classic import ACK, ENQ, LENGTH, NAK, \
 from nicos.services.daemon.handler import ConnectionHandler
 from nicos.utils import closeSocket, createThread
 
+# events with larger payloads are sent on their own instead of being joined
+# with others, to avoid copying the data
+BATCH_PAYLOAD_LIMIT = 65536
+
 
 class Server(BaseServer, socketserver.TCPServer):
     request_queue_size = 20
@@ -62,11 +66,19 @@ class Server(BaseServer, socketserver.TCPServer):
         self.server_close()
 
     def emit(self, event, data, blobs, handler=None):
+        policy = self.daemon._coalesce_policies.get(event)
+        key = None
+        if policy and not handler:
+            key = policy(data)
+            if key is not None:
+                key = (event, key)
         data = self.serializer.serialize_event(event, data)
         for hdlr in (handler,) if handler else self.handlers.values():
             try:
-                hdlr.event_queue.put((event, data, blobs), True, 0.1)
+                hdlr.event_queue.put((event, data, blobs, key), True, 0.1)
             except queue.Full:
+                hdlr.events_dropped[event] = \
+                    hdlr.events_dropped.get(event, 0) + 1
                 # close event socket to let the connection get
                 # closed by the handler
                 self.daemon.log.warning('handler %s: queue full, '
@@ -280,3 +292,19 @@ class ServerTransport(ConnectionHandler, BaseServerTransport,
         for blob in blobs:
             self.event_sock.sendall(LENGTH.pack(len(blob)))
             self.event_sock.sendall(blob)
+
+    def send_events(self, events):
+        # join the frames of small events to send them with one call
+        frames = []
+        for (evtname, payload, blobs) in events:
+            if blobs or len(payload) > BATCH_PAYLOAD_LIMIT:
+                if frames:
+                    self.event_sock.sendall(b''.join(frames))
+                    frames = []
+                self.send_event(evtname, payload, blobs)
+                continue
+            frames.append(STX + event2code[evtname] + b'\x00' +
+                          LENGTH.pack(len(payload)))
+            frames.append(payload)
+        if frames:
+            self.event_sock.sendall(b''.join(frames))
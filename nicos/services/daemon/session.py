@@ -202,7 +202,7 @@ class DaemonSession(NoninteractiveSession):
         NoninteractiveSession.experimentCallback(self, proposal, proptype)
         # reset cached messages when switching TO user experiment
         if proptype == 'user':
-            del self.daemon_device._messages[:]
+            self.daemon_device._messages.clear()
         self.emitfunc('experiment', (proposal, proptype))
 
     def pnpEvent(self, event, setupname, description):
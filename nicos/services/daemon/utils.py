@@ -24,17 +24,22 @@
 """Utilities for the NICOS daemon."""
 
 import ast
+import glob
 import linecache
 import logging
+import os
+import pickle
 import queue
 import re
 import sys
 import time
+from collections import OrderedDict, deque
+from os import path
 from threading import Event, Lock
 
 from nicos import session
 from nicos.services.daemon.errors import ScriptError
-from nicos.utils import fixupScript
+from nicos.utils import ensureDirectory, fixupScript
 from nicos.utils.loggers import ACTION, recordToMessage
 
 TIMESTAMP_FMT = '%Y-%m-%d %H:%M:%S'
@@ -194,12 +199,193 @@ class DaemonLogHandler(logging.Handler):
             # received after the fact (this should also lower memory consumption
             # of the daemon a bit)
             self.daemon._messages.append(msg)
-            # limit to 100000-110000 messages
-            if len(self.daemon._messages) > 110000:
-                del self.daemon._messages[:10000]
         self.daemon.emit_event('message', msg)
 
 
+class MessageLog:
+    """Bounded, indexed store of the log messages for clients.
+
+    The newest *maxmem* messages are kept in memory.  Older messages are moved
+    in segments of *segsize* messages to files in *spilldir* (if given), of
+    which the newest *maxsegments* are kept, also across restarts.  The time
+    range and the request IDs of each segment are stored at the start of its
+    file and indexed, so that queries only load segments that can contain
+    matching messages.
+
+    Messages are lists as created by `recordToMessage`, i.e. with the time as
+    second and the request ID as sixth entry.  A sequence number is appended
+    to each message, which, together with the time, identifies the message
+    when paging back through the history.
+    """
+
+    def __init__(self, maxmem, spilldir=None, segsize=5000, maxsegments=20):
+        self.maxmem = maxmem
+        self.segsize = segsize
+        self.maxsegments = maxsegments
+        self.spilldir = spilldir
+        self._lock = Lock()
+        self._messages = deque()
+        # list of (filename, mintime, maxtime, reqids, count, lastseq) tuples
+        self._segments = []
+        self._segnum = 0
+        self._seq = 0
+        if spilldir:
+            ensureDirectory(spilldir)
+            self._loadIndex()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._messages) + \
+                sum(seg[4] for seg in self._segments)
+
+    def append(self, msg):
+        with self._lock:
+            self._seq += 1
+            msg.append(self._seq)
+            self._messages.append(msg)
+            if len(self._messages) >= self.maxmem + self.segsize:
+                self._spill(self.segsize)
+
+    def clear(self):
+        with self._lock:
+            self._messages.clear()
+            for seg in self._segments:
+                self._remove(seg[0])
+            self._segments = []
+
+    def flush(self):
+        """Move all messages in memory to the segments on disk, e.g. before
+        shutting down.
+        """
+        if not self.spilldir:
+            return
+        with self._lock:
+            while self._messages:
+                self._spill(min(self.segsize, len(self._messages)))
+
+    def _loadIndex(self):
+        """Index the segments left over from a previous run."""
+        for filename in sorted(glob.glob(path.join(self.spilldir,
+                                                   '*.msgs'))):
+            try:
+                self._segnum = max(self._segnum, int(
+                    path.basename(filename)[:-5]))
+                with open(filename, 'rb') as fp:
+                    # only the index entry, not the messages
+                    index = tuple(pickle.load(fp))
+                if len(index) != 5:
+                    raise ValueError('unknown index format')
+            except Exception:
+                self._remove(filename)
+                continue
+            self._segments.append((filename,) + index)
+            self._seq = max(self._seq, index[4])
+        while len(self._segments) > self.maxsegments:
+            self._remove(self._segments.pop(0)[0])
+
+    def _spill(self, count):
+        popleft = self._messages.popleft
+        msgs = [popleft() for _ in range(count)]
+        if not self.spilldir:
+            return
+        self._segnum += 1
+        filename = path.join(self.spilldir, '%08d.msgs' % self._segnum)
+        times = [msg[1] for msg in msgs]
+        index = (min(times), max(times), {msg[5] for msg in msgs}, len(msgs),
+                 msgs[-1][6])
+        try:
+            with open(filename, 'wb') as fp:
+                pickle.dump(index, fp, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(msgs, fp, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # no logging here, we are called from a log handler
+            self._remove(filename)
+            return
+        self._segments.append((filename,) + index)
+        if len(self._segments) > self.maxsegments:
+            self._remove(self._segments.pop(0)[0])
+
+    def _remove(self, filename):
+        try:
+            os.unlink(filename)
+        except OSError:
+            pass
+
+    def query(self, n=None, fromtime=None, totime=None, reqid=None):
+        """Return the newest *n* messages (all if *n* is None) that match the
+        given filters, in chronological order.
+
+        *fromtime* and *totime* select messages with ``fromtime <= time <
+        totime``.  To page back through the history, pass the time and the
+        sequence number (the last entry) of the oldest message already
+        retrieved as a pair for *totime*; this selects the messages before
+        that one, including those with the same time.  *reqid* selects
+        messages belonging to one script request.
+
+        Without any filter, only the messages in memory are returned; the
+        segments on disk are only read for queries with a filter.
+        """
+        if isinstance(totime, (tuple, list)):
+            # compare (time, sequence number) of the messages
+            cursor = tuple(totime)
+            totime = cursor[0]
+
+            def before(msg):
+                return (msg[1], msg[6]) < cursor
+        else:
+            cursor = None
+
+            def before(msg):
+                return msg[1] < totime
+
+        def match(msg):
+            return (fromtime is None or msg[1] >= fromtime) and \
+                (totime is None or before(msg)) and \
+                (reqid is None or msg[5] == reqid)
+
+        if n == 0:
+            return []
+        with self._lock:
+            if fromtime is None and totime is None and reqid is None:
+                # fast path for the common case, e.g. on client connect
+                if n is None:
+                    return list(self._messages)
+                return list(self._messages)[-n:]
+            memory = list(self._messages)
+            segments = self._segments[:]
+
+        result = []
+        for msg in reversed(memory):
+            if match(msg):
+                result.append(msg)
+                if len(result) == n:
+                    result.reverse()
+                    return result
+        for (filename, mintime, maxtime, reqids, _, _) in reversed(segments):
+            if fromtime is not None and maxtime < fromtime:
+                continue
+            if totime is not None and (mintime > totime or
+                                       mintime == totime and cursor is None):
+                continue
+            if reqid is not None and reqid not in reqids:
+                continue
+            try:
+                with open(filename, 'rb') as fp:
+                    pickle.load(fp)  # skip the index entry
+                    msgs = pickle.load(fp)
+            except Exception:
+                # segment has been removed in the meantime
+                continue
+            for msg in reversed(msgs):
+                if match(msg):
+                    result.append(msg)
+                    if len(result) == n:
+                        result.reverse()
+                        return result
+        result.reverse()
+        return result
+
+
 # -- Script queue -------------------------------------------------------------
 
 class QueueOperator:
@@ -284,22 +470,63 @@ class ScriptQueue:
 
 # -- Size-limited queue (for event senders) ------------------------------------
 
+# Coalescing policies for events: for each event listed here, a function
+# returns a key from the event data (or None if this particular event must
+# not be coalesced).  Of several queued events with the same name and key,
+# only the latest one is sent to the client.
+COALESCE_POLICIES = {
+    # only the latest value of a cache key is interesting
+    'cache':   lambda data: data[1],
+    # ACTION messages only update the "current action" display of clients;
+    # all other messages must be delivered
+    'message': lambda data: 'action' if data[2] == ACTION else None,
+    # these events always carry the complete current state ('status' is not
+    # included since clients rely on seeing each state transition)
+    'watch':   lambda data: '',
+    'eta':     lambda data: '',
+}
+
+
 class SizedQueue(queue.Queue):
-    """A Queue that limits the total size of event messages"""
+    """A Queue that limits the total size of event messages.
+
+    Items are tuples of ``(event, data, blobs, coalesce_key)``.  If the
+    coalescing key is not None, an item that is still in the queue when
+    another item with the same key is put is removed from the queue, and the
+    new item is queued at the end.
+    """
     def _init(self, maxsize):
         assert maxsize > 0
         self.nbytes = 0
-        queue.Queue._init(self, maxsize)
+        # queued items by coalescing key, or by a serial number for items
+        # that are not coalesced
+        self.queue = OrderedDict()
+        self.serial = 0
+        # number of discarded items per event
+        self.coalesced = {}
 
     def _qsize(self):
         return self.nbytes
 
-    def _put(self, item):
+    def _itemsize(self, item):
         # size of the queue item should never be zero, so add one
-        self.nbytes += len(item[1]) + sum(len(x) for x in item[2]) + 1
-        self.queue.append(item)
+        return len(item[1]) + sum(len(x) for x in item[2]) + 1
+
+    def _put(self, item):
+        key = item[3]
+        if key is None:
+            self.serial += 1
+            key = self.serial
+        else:
+            key = ('key', key)
+            old = self.queue.pop(key, None)
+            if old is not None:
+                self.nbytes -= self._itemsize(old)
+                self.coalesced[old[0]] = self.coalesced.get(old[0], 0) + 1
+        self.nbytes += self._itemsize(item)
+        self.queue[key] = item
 
     def _get(self):
-        item = self.queue.popleft()
-        self.nbytes -= len(item[1]) + sum(len(x) for x in item[2]) + 1
+        item = self.queue.popitem(last=False)[1]
+        self.nbytes -= self._itemsize(item)
         return item
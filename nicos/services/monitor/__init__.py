@@ -209,13 +209,31 @@ class Monitor(BaseCacheClient):
     def register(self, widget, key):
         """API used by NicosListener widgets to register keys for callback."""
         key = self._prefix + key.lower()
+        if key not in self._keymap and self._connected:
+            # registered after connecting: get the value and updates
+            self._add_subscriptions([key])
         self._keymap.setdefault(key, []).append(widget)
         return key
 
+    def _subscription_keys(self):
+        # only get values for keys that are displayed
+        return sorted(set(self._keymap) |
+                      {self._prefix + 'session/master',
+                       self._prefix + 'session/mastersetup'})
+
     # called to handle an incoming protocol message
     def _handle_msg(self, time, ttlop, ttl, tsop, key, op, value):
         if op not in (OP_TELL, OP_TELLOLD):
             return
+        if key == 'watchdog/warnings':
+            if not self.showwatchdog:
+                return
+        elif key not in self._keymap and key not in (
+                self._prefix + 'session/master',
+                self._prefix + 'session/mastersetup'):
+            # the subscriptions match substrings of keys, so we can still
+            # get uninteresting keys: don't bother decoding them
+            return
         try:
             time = float(time)
         except (ValueError, TypeError):
@@ -225,7 +243,7 @@ class Monitor(BaseCacheClient):
         except ValueError:
             value = None
 
-        if key == 'watchdog/warnings' and self.showwatchdog:
+        if key == 'watchdog/warnings':
             self._process_warnings(value)
             return
 
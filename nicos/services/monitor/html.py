@@ -24,23 +24,27 @@
 """Instrument monitor that generates an HTML page."""
 
 import html
+import itertools
+import json
 import os
 import tempfile
 import time
 from base64 import b64encode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from threading import RLock
 from time import sleep, time as currenttime
+from urllib.parse import parse_qs, urlsplit
 
 import numpy
 from lttb import lttb
 
-from nicos.core import Param
+from nicos.core import Param, host
 from nicos.core.constants import NOT_AVAILABLE
 from nicos.core.status import BUSY, DISABLED, ERROR, NOTREACHED, OK, WARN
 from nicos.services.monitor import Monitor as BaseMonitor
 from nicos.services.monitor.icon import nicos_icon
-from nicos.utils import checkSetupSpec, parseKeyExpression, safeWriteFile, \
-    KEYEXPR_NS
+from nicos.utils import checkSetupSpec, createThread, parseHostPort, \
+    parseKeyExpression, safeWriteFile, KEYEXPR_NS
 
 try:
     import gr
@@ -57,7 +61,7 @@ HEAD = '''\
 <html>
 <head>
 <meta charset="utf-8"/>
-<meta http-equiv="refresh" content="%(intv)s">
+%(refresh)s
 <link rel="shortcut icon" type="image/png" href="data:image/png;base64,%(icon)s">
 <style type="text/css">
 body { background-color: #e0e0e0;
@@ -85,6 +89,37 @@ table { font-family: inherit; font-size: 100%%; }
 <body>
 '''
 
+REFRESH = '<meta http-equiv="refresh" content="%s">'
+
+# replaces the refresh header when the page is served via HTTP: instead of
+# reloading the whole page, only changed values are fetched
+DELTA_SCRIPT = '''\
+<script>
+var gen = 0;
+function update() {
+  fetch('delta?since=' + gen).then(r => r.json()).then(d => {
+    if (d.reload && gen) { location.reload(); return; }
+    for (const [id, l] of Object.entries(d.labels)) {
+      const e = document.getElementById(id);
+      if (e) { e.innerHTML = l[0]; e.style.color = l[1];
+               e.style.backgroundColor = l[2]; }
+    }
+    for (const [id, src] of Object.entries(d.plots)) {
+      const e = document.getElementById(id);
+      if (e) { e.src = src; }
+    }
+    gen = d.gen;
+  }).catch(() => {}).finally(() => setTimeout(update, %s));
+}
+window.addEventListener('load', update);
+</script>'''
+
+# the time display alone only causes the file to be rewritten this often
+TIME_UPDATE_INTERVAL = 60
+
+# generation numbers of changes to the displayed elements
+_generation = itertools.count(1)
+
 
 class Field:
     # what to display
@@ -166,28 +201,57 @@ class Static(str):
 
 class Block:
     def __init__(self, config):
+        self.dirty = True
         self.enabled = True
         self._content = []
+        self._plots = []
+        self._html = ''
         self.setups = config.get('setups')
         self._onlyfields = []
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name == 'enabled':
+            self.dirty = True
+
     def __iadd__(self, content):
         """Easily adds content to the block using ``+=``."""
         if isinstance(content, str):
             self._content.append(Static(content))
         else:
+            if isinstance(content, Label):
+                content.owner = self
+            elif isinstance(content, Plot):
+                self._plots.append(content)
             self._content.append(content)
+        self.dirty = True
         return self
 
     def getHTML(self):
-        if self.enabled and self._content:
-            return ''.join(c.getHTML() for c in self._content)
-        return ''
+        if not (self.enabled and self._content):
+            return ''
+        # the children cache their own HTML; joining is only necessary if
+        # one of them changed
+        if self.dirty or any(p.outdated() for p in self._plots):
+            # reset before rendering, so that concurrent changes are not lost
+            self.dirty = False
+            self._html = ''.join(c.getHTML() for c in self._content)
+        return self._html
 
 
 class Label:
+    """A text element whose HTML is only regenerated after changes."""
+
+    # the Block this label is in, notified about changes
+    owner = None
+    # generation of the last change of a displayed attribute
+    gen = 0
+    _cache = (-1, '')
+    _ids = itertools.count(1)
+
     def __init__(self, cls='label', width=0, text='&nbsp;',
                  fore='inherit', back='inherit'):
+        self.id = 'l%d' % next(self._ids)
         self.cls = cls
         self.width = width
         self.text = text
@@ -195,12 +259,30 @@ class Label:
         self.back = back
         self.enabled = True
 
+    def __setattr__(self, name, value):
+        if name in ('cls', 'width', 'text', 'fore', 'back', 'enabled'):
+            if getattr(self, name, None) == value:
+                return
+            object.__setattr__(self, name, value)
+            self.gen = next(_generation)
+            if self.owner is not None:
+                self.owner.dirty = True
+        else:
+            object.__setattr__(self, name, value)
+
     def getHTML(self):
         if not self.enabled:
             return ''
-        return ('<div class="%s" style="color: %s; min-width: %sex; '
-                'background-color: %s">%s</div>' %
-                (self.cls, self.fore, self.width, self.back, self.text))
+        gen, cached = self._cache
+        if gen == self.gen:
+            return cached
+        gen = self.gen
+        cached = ('<div id="%s" class="%s" style="color: %s; min-width: %sex; '
+                  'background-color: %s">%s</div>' %
+                  (self.id, self.cls, self.fore, self.width, self.back,
+                   self.text))
+        self._cache = (gen, cached)
+        return cached
 
 
 DATEFMT = '%Y-%m-%d'
@@ -211,8 +293,13 @@ class Plot:
 
     # if the field should be displayed
     enabled = True
+    # generation of the last rendering
+    gen = 0
+
+    _ids = itertools.count(1)
 
     def __init__(self, window, width, height):
+        self.id = 'p%d' % next(self._ids)
         self.window = window
         self.width = width
         self.height = height
@@ -229,6 +316,13 @@ class Plot:
         os.environ['GKS_WSTYPE'] = 'svg'
         (fd, self.tempfile) = tempfile.mkstemp('.svg')
         os.close(fd)
+        # last rendered image and its time; unchanged data is only rendered
+        # again when the time axis has moved by 1% of the window
+        self.src = ''
+        self._html = None
+        self._changed = True
+        self._rendered = 0
+        self._rerender = max(10, window / 100.)
 
     def xtickCallBack(self, x, y, _svalue, value):
         gr.setcharup(-1., 1.)
@@ -249,6 +343,7 @@ class Plot:
         # we have to guard modifications to self.data, since otherwise the
         # __str__ method below may see inconsistent X and Y lists
         with self.lock:
+            self._changed = True
             ts, yy = self.data[curve]
             ts.append(x)
             yy.append(y)
@@ -266,11 +361,17 @@ class Plot:
             data = down[:, 0], down[:, 1]
         return data
 
+    def outdated(self):
+        return self._html is None or self._changed or \
+            currenttime() > self._rendered + self._rerender
+
     def getHTML(self):
         if not self.enabled:
             return ''
         if not self.data or not self.curves:
             return '<span>No data or curves found</span>'
+        if not self.outdated():
+            return self._html
         with self.lock:
             for i, (d, c) in enumerate(zip(self.data, self.curves)):
                 try:
@@ -283,6 +384,8 @@ class Plot:
                 except IndexError:
                     # no data (yet)
                     pass
+            # the "current value" points added above do not count as change
+            self._changed = False
         c = self.axes.getCurves()
         self.axes.setWindow(c.xmin, c.xmax, c.ymin, c.ymax)
         if os.path.isfile(self.tempfile):
@@ -298,10 +401,13 @@ class Plot:
             gr.clearws()
         with open(self.tempfile, 'rb') as fp:
             imgbytes = fp.read()
-        return ('<img src="data:image/svg+xml;base64,%s" '
-                'style="width: %sex; height: %sex">' % (
-                    b64encode(imgbytes).decode(),
-                    self.width, self.height))
+        self._rendered = currenttime()
+        self.src = 'data:image/svg+xml;base64,' + b64encode(imgbytes).decode()
+        self.gen = next(_generation)
+        self._html = ('<img id="%s" src="%s" style="width: %sex; '
+                      'height: %sex">' % (self.id, self.src,
+                                          self.width, self.height))
+        return self._html
 
 
 class Picture:
@@ -326,28 +432,128 @@ class Picture:
         return s
 
 
+class DeltaRequestHandler(BaseHTTPRequestHandler):
+    """Serves the page and the changes of displayed values as JSON."""
+
+    def do_GET(self):
+        monitor = self.server.monitor
+        url = urlsplit(self.path)
+        if url.path == '/delta':
+            try:
+                since = int(parse_qs(url.query).get('since', ['0'])[0])
+            except ValueError:
+                since = 0
+            body = json.dumps(monitor.getDelta(since)).encode()
+            ctype = 'application/json'
+        elif url.path in ('/', '/index.html'):
+            body = monitor._served.encode()
+            ctype = 'text/html; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        self.server.monitor.log.debug('%s: ' + fmt, self.address_string(),
+                                      *args)
+
+
 class Monitor(BaseMonitor):
-    """HTML specific implementation of instrument monitor."""
+    """HTML specific implementation of instrument monitor.
+
+    The HTML of blocks and plots is cached and only regenerated after one of
+    their values changed, and the file is not rewritten if nothing changed
+    (if only the time display changed, it is rewritten once per minute).
+
+    If ``httpserver`` is set, the page is also served via HTTP.  That page
+    does not reload itself, but fetches the changed values from the
+    ``/delta`` URL in JSON format.
+    """
 
     parameters = {
         'filename': Param('Filename for HTML output', type=str, mandatory=True),
         'interval': Param('Interval for writing file', default=5),
-        'noexpired': Param('If true, show expired values as "n/a"', type=bool)
+        'noexpired': Param('If true, show expired values as "n/a"', type=bool),
+        'httpserver': Param('Address (host:port) to serve the page with '
+                            'incremental updates via HTTP', type=host(),
+                            ext_desc='The default port is 8080.  Empty to '
+                            'disable the server.'),
     }
 
+    _lastbody = None
+    _lastwrite = 0
+    _served = ''
+    _structgen = 0
+
     def mainLoop(self):
+        if self.httpserver:
+            self._startServer()
         while not self._stoprequest:
             try:
-                if self._content:
-                    content = ''.join(ct.getHTML() for ct in self._content)
-                    safeWriteFile(self.filename, content, maxbackups=0)
+                if self._content and self._render():
+                    safeWriteFile(self.filename, self._content_html,
+                                  maxbackups=0)
+                    self.log.debug('wrote status to %r', self.filename)
             except Exception:
                 self.log.error('could not write status to %r', self.filename,
                                exc=1)
-            else:
-                self.log.debug('wrote status to %r', self.filename)
             sleep(self.interval)
 
+    def _render(self):
+        """Render the page, return True if it needs to be written."""
+        body = []
+        timeindex, timehtml = 0, ''
+        for ct in self._content:
+            if ct is self._timelabel:
+                timeindex, timehtml = len(body), ct.getHTML()
+                body.append('')  # placeholder for the time
+            else:
+                body.append(ct.getHTML())
+        now = currenttime()
+        if body == self._lastbody and \
+           now < self._lastwrite + TIME_UPDATE_INTERVAL:
+            return False
+        self._lastbody = list(body)
+        self._lastwrite = now
+        body[timeindex] = timehtml
+        self._content_html = content = ''.join(body)
+        if self.httpserver:
+            self._served = content.replace(
+                REFRESH % self.interval,
+                DELTA_SCRIPT % int(self.interval * 1000), 1)
+        return True
+
+    def _startServer(self):
+        address = parseHostPort(self.httpserver, 8080)
+        try:
+            server = ThreadingHTTPServer(address, DeltaRequestHandler)
+        except OSError as err:
+            self.log.error('could not start HTTP server on %s: %s',
+                           self.httpserver, err)
+            return
+        server.daemon_threads = True
+        server.monitor = self
+        createThread('HTTP server', server.serve_forever)
+        self.log.info('serving the status page on %s', self.httpserver)
+
+    def getDelta(self, since):
+        """Return the labels and plots changed since generation *since*."""
+        gen = next(_generation)
+        return {
+            'gen': gen,
+            # changes of the page structure need a reload
+            'reload': self._structgen > since,
+            'labels': {label.id: [label.text, label.fore, label.back]
+                       for label in self._labels if label.gen > since},
+            'plots': {plot.id: plot.src for plot in self._plots.values()
+                      if plot.gen > since},
+        }
+
     def closeGui(self):
         pass
 
@@ -360,6 +566,7 @@ class Monitor(BaseMonitor):
 
     def initGui(self):
         self._content = []
+        self._labels = []
         self._bgcolor = 'inherit'
         self._black = 'black'
         self._yellow = 'yellow'
@@ -375,7 +582,7 @@ class Monitor(BaseMonitor):
             fsb = self._fontsizebig,
             ff = self.font,
             ffm = self.valuefont or self.font,
-            intv = self.interval,
+            refresh = REFRESH % self.interval,
             title = html.escape(self.title),
             icon = nicos_icon,
         )
@@ -388,6 +595,8 @@ class Monitor(BaseMonitor):
         self += '</div><div>'
         self._warnlabel = Label('warnings', back='red', text='')
         self += self._warnlabel
+        self._labels.append(self._timelabel)
+        self._labels.append(self._warnlabel)
         self += '</div></td></tr>\n'
 
         self._plots = {}
@@ -419,6 +628,7 @@ class Monitor(BaseMonitor):
                 flabel = field._namelabel = Label('name', field.width,
                                                   html.escape(field.name))
                 blk += flabel
+                self._labels.append(flabel)
                 blk += '</td></tr><tr><td>'
                 # create value label
                 cls = 'value'
@@ -426,6 +636,7 @@ class Monitor(BaseMonitor):
                     cls += ' istext'
                 vlabel = field._valuelabel = Label(cls, fore='white')
                 blk += vlabel
+                self._labels.append(vlabel)
             return field
 
         for superrow in self.layout:
@@ -549,6 +760,15 @@ class Monitor(BaseMonitor):
             self._warnlabel.text = ''
 
     def reconfigureBoxes(self):
+        before = [label.enabled for label in self._labels] + \
+            [block.enabled for block in self._onlyblocks]
+        self._reconfigureBoxes()
+        after = [label.enabled for label in self._labels] + \
+            [block.enabled for block in self._onlyblocks]
+        if before != after:
+            self._structgen = next(_generation)
+
+    def _reconfigureBoxes(self):
         fields = []
         for block in self._onlyblocks:
             block.enabled = checkSetupSpec(block.setups, self._setups,
@@ -29,13 +29,16 @@ import signal
 import sys
 import threading
 import traceback
+from functools import partial
 from os import path
 from time import sleep, time as currenttime
+from urllib.parse import urlsplit
 
 from nicos import config, session
 from nicos.core import ConfigurationError, Device, DeviceAlias, Param, \
-    Readable, listof, status
+    Readable, floatrange, intrange, listof, status
 from nicos.devices.generic.cache import CacheReader
+from nicos.services.poller.scheduler import PollScheduler, ScheduledJob
 from nicos.utils import createSubprocess, createThread, loggers, \
     watchFileContent, whyExited
 from nicos.utils.files import findSetup
@@ -44,6 +47,160 @@ POLL_MIN_VALID_TIME = 0.15  # latest time slot to poll before value times out du
 POLL_BUSY_INTERVAL = 0.5    # if dev is busy, poll this often
 POLL_MIN_WAIT = 0.1         # minimum amount of time between two calls to poll()
                             # POLL_MIN_WAIT < POLL_BUSY_INTERVAL / 2 !!!
+POLL_BACKOFF = 1.5          # factor to increase the interval for stable values
+
+
+class PollState:
+    """Timing state of polling a single device.
+
+    The wait between pollings is adjusted based on events received via the
+    cache (e.g. the device or one of its attached devices went busy).  This
+    is shared between the thread-per-device and the scheduled polling modes.
+
+    If *maxbackoff* is greater than 1, the interval is increased up to this
+    factor while the polled value and status do not change (within the
+    device's ``precision``, if it has one).  The device's ``maxage`` still
+    bounds the wait in `deadline`.  *stats* is a list of the number
+    of reads done and saved by this, which is kept over restarts.
+    """
+
+    def __init__(self, dev, log, maxbackoff=1, stats=None):
+        self.dev = dev
+        self.log = log
+        self.count = 0     # number of polls
+        self.lastpoll = 0  # last timestamp of successful poll
+        self.maxbackoff = maxbackoff
+        self.stats = [0, 0.] if stats is None else stats
+        self.reset()
+
+    def reset(self):
+        self.interval = self.dev.pollinterval
+        self.maxage = self.interval - POLL_MIN_VALID_TIME if self.interval \
+            else (self.dev.maxage or 0)
+        self.lastresult = None
+        self.tolerance = 0
+        if 'precision' in getattr(self.dev, 'parameters', ()):
+            self.tolerance = self.dev.precision or 0
+
+    def tighten(self):
+        # values changed elsewhere, forget about previous stability
+        self.lastresult = None
+        if self.interval and self.interval > self.dev.pollinterval:
+            self.interval = self.dev.pollinterval
+
+    def _unchanged(self, result):
+        (oldst, oldval), (stval, rdval) = self.lastresult, result
+        if oldst != stval:
+            return False
+        if isinstance(rdval, (int, float)) and \
+           isinstance(oldval, (int, float)):
+            return abs(rdval - oldval) <= self.tolerance
+        try:
+            return bool(rdval == oldval)
+        except Exception:  # e.g. arrays of different shapes
+            return False
+
+    def adapt(self, result):
+        """Return the interval to use after polling *result*."""
+        base = self.dev.pollinterval
+        if self.maxbackoff <= 1:
+            return base
+        if self.lastresult is None or not self._unchanged(result):
+            # compare against the value at the last change, so that slow
+            # drifts are noticed as well
+            self.lastresult = result
+            return base
+        return min(max(self.interval, base) * POLL_BACKOFF,
+                   base * self.maxbackoff)
+
+    def busy(self):
+        self.interval = POLL_BUSY_INTERVAL
+        self.maxage = self.interval / 2.
+
+    def deadline(self):
+        """Return the time of the next poll, with a default of 1h."""
+        dev, lastpoll = self.dev, self.lastpoll
+        nextpoll = lastpoll + (self.interval or 3600)
+        # note: dev.maxage is intended here!
+        timesout = lastpoll + (dev.maxage - POLL_MIN_VALID_TIME
+                               if dev.maxage else POLL_MIN_VALID_TIME)
+        self.log.debug('%-10s: nextpoll=%g, timesout=%g',
+                       dev, nextpoll, timesout)
+        return min(nextpoll, timesout)
+
+    def handle_event(self, event):
+        """Handle an event, return True if the device should be polled."""
+        self.log.debug('%-10s: event %s', self.dev, event)
+        if event == 'adev_busy':  # one of our attached_devices went busy
+            self.busy()
+            # also poll
+        elif event == 'adev_normal':  # one of our attached_devices is no more busy
+            self.tighten()
+            # just poll
+        elif event == 'adev_target':  # one of our attached_devices got new target
+            self.busy()
+            return False
+        elif event == 'adev_value':  # one of our attached_devices changed value
+            self.tighten()
+            self.maxage = POLL_BUSY_INTERVAL / 2
+            # just poll
+        elif event in ('dev_busy', 'dev_target'):  # our device went busy
+            self.busy()
+            return False
+        elif event in ('dev_normal', 'dev_value'):
+            return False
+        elif event == 'param':  # update local vars
+            self.reset()
+            return False
+        elif event.startswith('pollparam:'):
+            try:
+                self.dev._pollParam(event[10:])
+            except Exception:
+                self.dev.log.warning('error polling parameter %s',
+                                     event[10:], exc=True)
+        return True
+
+    def may_poll(self, now):
+        # rate-limiting if too many events occur which would retrigger
+        # this device
+        if self.lastpoll + POLL_MIN_WAIT > now:
+            self.log.debug('%-10s: rate-limiting poll()', self.dev)
+            return False
+        return True
+
+    def poll(self):
+        """Poll the device; errors are raised to the caller."""
+        dev = self.dev
+        # only poll if enabled
+        if dev.pollinterval is not None:
+            self.count += 1
+            self.stats[0] += 1
+            if self.lastpoll and (self.interval or 0) > dev.pollinterval:
+                # number of polls that would have been done in the meantime
+                elapsed = currenttime() - self.lastpoll
+                self.stats[1] += max(elapsed / dev.pollinterval - 1, 0)
+            stval, rdval = dev.poll(self.count, maxage=self.maxage)
+            self.log.debug('%-10s: status = %-25s, value = %s',
+                           dev, stval, rdval)
+            # adjust timing of we are no longer busy
+            if stval is not None and stval[0] != status.BUSY:
+                self.interval = self.adapt((stval, rdval))
+                self.maxage = dev.pollinterval - POLL_MIN_VALID_TIME
+            else:
+                self.lastresult = None
+        # keep track of when we last (tried to) poll
+        self.lastpoll = currenttime()
+
+
+class PollJob(ScheduledJob):
+    """State of a device polled by the scheduler."""
+
+    def __init__(self, devname, target):
+        ScheduledJob.__init__(self, devname, target)
+        self.dev = None
+        self.state = None
+        self.registered = False
+        self.errstate = [0, 10]  # number of errors, current wait time
 
 
 class Poller(Device):
@@ -60,11 +217,29 @@ class Poller(Device):
                             'master setup', type=listof(str)),
         'blacklist':  Param('Devices that should never be polled',
                             type=listof(str)),
+        'scheduler':  Param('Poll devices from a central scheduler instead '
+                            'of one thread per device', type=bool,
+                            default=False),
+        'poolsize':   Param('Number of poll threads per hardware backend '
+                            'if the scheduler is used',
+                            type=intrange(1, 64), default=4),
+        'maxbackoff': Param('Maximum factor by which the polling interval '
+                            'of devices with unchanged values is increased',
+                            type=floatrange(1, 100), default=1,
+                            ext_desc='The interval is always limited by '
+                            'the ``maxage`` of the device, so that its '
+                            'values in the cache do not expire.  With the '
+                            'default maxage of 12 and pollinterval of 5 '
+                            'seconds, the effective factor is at most about '
+                            '2.4; devices need a larger maxage to back off '
+                            'further.'),
     }
 
     def doInit(self, mode):
         self._stoprequest = False
         self._workers = {}
+        self._scheduler = None
+        self._pollstats = {}
         self._creation_lock = threading.Lock()
 
     def doUpdateLoglevel(self, value):
@@ -72,42 +247,59 @@ class Poller(Device):
         # a poller session
         self.log.setLevel(loggers.loglevels[value])
 
-    def _worker_thread(self, devname, work_queue):
+    def _register_callbacks(self, dev, put):
         # pylint: disable=dangerous-default-value
 
         def reconfigure_dev_target(key, value, time, oldvalues={}):
             if value is not None:
-                work_queue.put('dev_target', False)
+                put('dev_target')
                 oldvalues[key] = value
 
         def reconfigure_dev_status(key, value, time, oldvalues={}):
             if value[0] != oldvalues.get(key):
                 if value[0] == status.BUSY:  # just went busy, wasn't before!
-                    work_queue.put('dev_busy', False)
+                    put('dev_busy')
                 else:
-                    work_queue.put('dev_normal', False)
+                    put('dev_normal')
                 oldvalues[key] = value[0]  # only store status code!
 
         def reconfigure_adev_value(key, value, time, oldvalues={}):
             if value != oldvalues.get(key):
-                work_queue.put('adev_value', False)
+                put('adev_value')
                 oldvalues[key] = value
 
         def reconfigure_adev_target(key, value, time, oldvalues={}):
             if value != oldvalues.get(key):
-                work_queue.put('adev_target', False)
+                put('adev_target')
                 oldvalues[key] = value
 
         def reconfigure_adev_status(key, value, time, oldvalues={}):
             if value[0] != oldvalues.get(key):
                 if value[0] == status.BUSY:  # just went busy, wasn't before!
-                    work_queue.put('adev_busy', False)
+                    put('adev_busy')
                 else:
-                    work_queue.put('adev_normal', False)
+                    put('adev_normal')
                 oldvalues[key] = value[0]  # only store status code!
 
         def reconfigure_param(key, value, time):
-            work_queue.put('param', False)
+            put('param')
+
+        self.log.debug('%-10s: registering callbacks', dev)
+        # keep track of some parameters via cache callback
+        # session.cache.addCallback(dev, 'value', reconfigure_dev_value)  # spams events
+        session.cache.addCallback(dev, 'target', reconfigure_dev_target)
+        session.cache.addCallback(dev, 'status', reconfigure_dev_status)  # may spam events
+        session.cache.addCallback(dev, 'maxage', reconfigure_param)
+        session.cache.addCallback(dev, 'pollinterval', reconfigure_param)
+        # also subscribe to value and status updates of attached devices.
+        for adev in dev._adevs.values():
+            if not isinstance(adev, Readable):
+                continue
+            session.cache.addCallback(adev, 'value', reconfigure_adev_value)
+            session.cache.addCallback(adev, 'target', reconfigure_adev_target)
+            session.cache.addCallback(adev, 'status', reconfigure_adev_status)
+
+    def _worker_thread(self, devname, work_queue):
 
         def poll_loop(dev):
             """
@@ -122,24 +314,12 @@ class Poller(Device):
             Read errors in the device raise and this gets restarted from the
             outer loop. If the received event is 'quit' we just exit here.
             """
-            # get the initial values
-            interval = dev.pollinterval
-            maxage = interval - POLL_MIN_VALID_TIME if interval else (
-                dev.maxage or 0)
-
-            i = 0
-            lastpoll = 0  # last timestamp of successful poll
+            state = PollState(dev, self.log, self.maxbackoff,
+                              self._pollstats.setdefault(devname, [0, 0.]))
 
             while not self._stoprequest:
-                # determine maximum waiting time with a default of 1h
-                now = currenttime()
-                nextpoll = lastpoll + (interval or 3600)
-                # note: dev.maxage is intended here!
-                timesout = lastpoll + (dev.maxage - POLL_MIN_VALID_TIME
-                                       if dev.maxage else POLL_MIN_VALID_TIME)
-                maxwait = min(nextpoll, timesout) - now
-                self.log.debug('%-10s: maxwait is %g (nextpoll=%g, timesout=%g)',
-                               dev, maxwait, nextpoll, timesout)
+                maxwait = state.deadline() - currenttime()
+                self.log.debug('%-10s: maxwait is %g', dev, maxwait)
 
                 # only wait for events if there is time, otherwise just poll
                 if maxwait > 0:
@@ -147,75 +327,22 @@ class Poller(Device):
                     try:
                         # if the timeout is reached, this raises queue.Empty
                         event = work_queue.get(True, maxwait)
-                        self.log.debug('%-10s: event %s', dev, event)
-
-                        # handle events....
-                        # use pass to trigger a poll or continue to just fetch the next event
-                        if event == 'adev_busy':  # one of our attached_devices went busy
-                            interval = POLL_BUSY_INTERVAL
-                            maxage = interval / 2.
-                            # also poll
-                        elif event == 'adev_normal':  # one of our attached_devices is no more busy
-                            pass  # just poll
-                        elif event == 'adev_target':  # one of our attached_devices got new target
-                            interval = POLL_BUSY_INTERVAL
-                            maxage = interval / 2.
-                            continue
-                        elif event == 'adev_value':  # one of our attached_devices changed value
-                            maxage = POLL_BUSY_INTERVAL / 2
-                            # just poll
-                        elif event == 'dev_busy':  # our device went busy
-                            interval = POLL_BUSY_INTERVAL
-                            maxage = interval / 2.
-                            continue
-                        elif event == 'dev_normal':  # our device is no more busy
-                            continue
-                        elif event == 'dev_target':  # our device got new target
-                            interval = POLL_BUSY_INTERVAL
-                            maxage = interval / 2.
-                            continue
-                        elif event == 'dev_value':  # our device changed value
-                            continue
-                        elif event == 'param':  # update local vars
-                            interval = dev.pollinterval
-                            maxage = interval - POLL_MIN_VALID_TIME \
-                                if interval else (dev.maxage or 0)
-                            continue
-                        elif event == 'quit':  # stop doing anything
+                        if event == 'quit':  # stop doing anything
                             return
-                        elif event.startswith('pollparam:'):
-                            try:
-                                dev._pollParam(event[10:])
-                            except Exception:
-                                dev.log.warning('error polling parameter %s',
-                                                event[10:], exc=True)
-
+                        if not state.handle_event(event):
+                            continue
                     except queue.Empty:
                         pass  # just poll if timed out
                 else:
                     self.log.debug('%-10s: ignoring events for one round', dev)
 
-                # also do rate-limiting if too many events occur which would
-                # retrigger this device
-                if lastpoll + POLL_MIN_WAIT > currenttime():
-                    self.log.debug('%-10s: rate-limiting poll()', dev)
+                if not state.may_poll(currenttime()):
                     continue
 
-                # only poll if enabled
-                if dev.pollinterval is not None:
-                    i += 1
-                    # if the polling fails, raise into outer loop which handles this...
-                    stval, rdval = dev.poll(i, maxage=maxage)
-                    self.log.debug('%-10s: status = %-25s, value = %s',
-                                   dev, stval, rdval)
-                    # adjust timing of we are no longer busy
-                    if stval is not None and stval[0] != status.BUSY:
-                        interval = dev.pollinterval
-                        maxage = interval - POLL_MIN_VALID_TIME
-                # keep track of when we last (tried to) poll
-                lastpoll = currenttime()
+                # if the polling fails, raise into outer loop which handles this...
+                state.poll()
                 # reset error count and waittime after first successful poll
-                if i == 1:
+                if state.count == 1:
                     errstate[:] = [0, 10]
                     self.log.info('%-10s: polled successfully', dev)
             # end of while not self._stoprequest
@@ -239,20 +366,7 @@ class Poller(Device):
                             work_queue.put('pollparam:%s' % name)
 
                 if not registered:
-                    self.log.debug('%-10s: registering callbacks', dev)
-                    # keep track of some parameters via cache callback
-                    # session.cache.addCallback(dev, 'value', reconfigure_dev_value)  # spams events
-                    session.cache.addCallback(dev, 'target', reconfigure_dev_target)
-                    session.cache.addCallback(dev, 'status', reconfigure_dev_status)  # may spam events
-                    session.cache.addCallback(dev, 'maxage', reconfigure_param)
-                    session.cache.addCallback(dev, 'pollinterval', reconfigure_param)
-                    # also subscribe to value and status updates of attached devices.
-                    for adev in dev._adevs.values():
-                        if not isinstance(adev, Readable):
-                            continue
-                        session.cache.addCallback(adev, 'value', reconfigure_adev_value)
-                        session.cache.addCallback(adev, 'target', reconfigure_adev_target)
-                        session.cache.addCallback(adev, 'status', reconfigure_adev_status)
+                    self._register_callbacks(dev, work_queue.put)
                 registered = True
 
                 poll_loop(dev)
@@ -280,12 +394,79 @@ class Poller(Device):
         # end of while not self._stoprequest
     # end of _worker_thread
 
+    def _backend(self, dev):
+        """Return the name of the worker pool used for polling *dev*."""
+        if 'tangodevice' in dev.parameters:
+            # all devices of one Tango server host share a pool
+            return 'tango:%s' % urlsplit(dev.tangodevice).netloc
+        return type(dev).__module__
+
+    def _scheduled_poll(self, job):
+        """Poll the device of a PollJob once if necessary.
+
+        This is the scheduler equivalent of one round of the `poll_loop` in
+        `_worker_thread`.  Returns the time of the next poll.
+        """
+        try:
+            if job.dev is None:
+                # device creation should be serialized due to the many
+                # global state updates in the session object
+                with self._creation_lock:
+                    job.dev = session.getDevice(job.name)
+                job.backend = self._backend(job.dev)
+                for name, info in job.dev.parameters.items():
+                    if info.volatile:
+                        job.events.append('pollparam:%s' % name)
+
+            if not job.registered:
+                self._register_callbacks(
+                    job.dev, partial(self._scheduler.post, job))
+                job.registered = True
+
+            if job.state is None:
+                job.state = PollState(
+                    job.dev, self.log, self.maxbackoff,
+                    self._pollstats.setdefault(job.name, [0, 0.]))
+            state = job.state
+
+            trigger = False
+            while job.events:
+                trigger |= state.handle_event(job.events.popleft())
+            now = currenttime()
+            if (trigger or now >= state.deadline()) and state.may_poll(now):
+                state.poll()
+                # reset error count and waittime after first successful poll
+                if state.count == 1:
+                    job.errstate[:] = [0, 10]
+                    self.log.info('%-10s: polled successfully', job.dev)
+            return max(state.deadline(), state.lastpoll + POLL_MIN_WAIT)
+        except Exception:
+            errstate = job.errstate
+            errstate[0] += 1
+            if job.dev is None:
+                self.log.warning('%-10s: error creating device, retrying in '
+                                 '%d sec', job.name, errstate[1], exc=True)
+            else:
+                self.log.warning('%-10s: error polling, retrying in %d sec',
+                                 job.dev, errstate[1], exc=True)
+            if errstate[0] % 5 == 0:
+                errstate[1] = min(2 * errstate[1], 600)
+            # start over with fresh timing, like a restarted poll_loop;
+            # events posted in the meantime trigger an earlier retry
+            job.state = None
+            return currenttime() + errstate[1]
+
+    def _post_event(self, devname, event):
+        if self._scheduler:
+            self._scheduler.post(self._workers[devname], event)
+        else:
+            self._workers[devname].work_queue.put(event, False)
+
     def enqueue_params_poll(self, key, value, time, tell):
         dev, key = key[len('poller/'):].split('/', 2)
         if dev in self._workers:
-            worker = self._workers[dev]
             for param in value:
-                worker.work_queue.put('pollparam:%s' % param)
+                self._post_event(dev, 'pollparam:%s' % param)
 
     def start(self, setup=None):
         self._setup = setup
@@ -298,6 +479,9 @@ class Poller(Device):
 
         try:
             session.loadSetup(setup, allow_startupcode=False)
+            if self.scheduler:
+                self._scheduler = PollScheduler(self.log, self.poolsize)
+                self._scheduler.start()
             for devname in session.getSetupInfo()[setup]['devices']:
                 if devname in self.blacklist:
                     self.log.debug('not polling %s, it is blacklisted', devname)
@@ -318,6 +502,19 @@ class Poller(Device):
                     self.log.info('%s is a DeviceAlias or a CacheReader, '
                                   'not polling', devname)
                     continue
+                if not cls.needs_polling:
+                    self.log.info('%s updates the cache itself, not polling',
+                                  devname)
+                    continue
+
+                if self._scheduler:
+                    # no staggering necessary: the number of concurrent
+                    # polls is limited by the worker pools
+                    self.log.debug('scheduling %s', devname)
+                    job = PollJob(devname, self._scheduled_poll)
+                    self._workers[devname.lower()] = job
+                    self._scheduler.add(job)
+                    continue
 
                 self.log.debug('starting thread for %s', devname)
                 work_queue = queue.Queue()
@@ -360,6 +557,9 @@ class Poller(Device):
             return self._wait_master()
         while not self._stoprequest:
             sleep(1)
+        if self._scheduler:
+            self._scheduler.join()
+            return
         for worker in self._workers.values():
             worker.join()
 
@@ -370,10 +570,14 @@ class Poller(Device):
             return  # already quitting
         self.log.info('poller quitting on signal %s...', signum)
         self._stoprequest = True
-        for worker in self._workers.values():
-            worker.work_queue.put('quit', False)  # wake up to quit
-        for worker in self._workers.values():
-            worker.join()
+        if self._scheduler:
+            self._scheduler.stop()
+            self._scheduler.join()
+        else:
+            for worker in self._workers.values():
+                worker.work_queue.put('quit', False)  # wake up to quit
+            for worker in self._workers.values():
+                worker.join()
         self.log.info('poller finished')
 
     def reload(self):
@@ -390,14 +594,25 @@ class Poller(Device):
     def statusinfo(self):
         self.log.info('got SIGUSR2')
         if self._setup is not None:
-            info = []
-            for worker in self._workers.values():
-                wname = worker.getName()
-                if worker.is_alive():
-                    info.append('%s: alive' % wname)
-                else:
-                    info.append('%s: dead' % wname)
-            self.log.info(', '.join(info))
+            if self._scheduler:
+                for name, (workers, queued, stats) in \
+                        sorted(self._scheduler.stats().items()):
+                    self.log.info('pool %s: %d workers, %d queued, %s',
+                                  name, workers, queued, stats)
+            else:
+                info = []
+                for worker in self._workers.values():
+                    wname = worker.getName()
+                    if worker.is_alive():
+                        info.append('%s: alive' % wname)
+                    else:
+                        info.append('%s: dead' % wname)
+                self.log.info(', '.join(info))
+            if self.maxbackoff > 1:
+                self.log.info('reads done/saved by adaptive polling: %s',
+                              ', '.join('%s: %d/%d' % (dev, done, saved)
+                                        for (dev, (done, saved)) in
+                                        sorted(self._pollstats.items())))
             self.log.info('current stacktraces for each thread:')
             active = threading._active
             for tid, frame in list(sys._current_frames().items()):
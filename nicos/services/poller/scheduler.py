@@ -0,0 +1,231 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Central scheduler for the poller.
+
+Instead of one sleeping thread per device, the scheduler keeps a heap of the
+next due times of all jobs and hands due jobs to a small pool of worker
+threads, one pool per hardware backend.
+"""
+
+import heapq
+import itertools
+import queue
+import threading
+from collections import deque
+from time import time as currenttime
+
+from nicos.utils import createThread
+
+
+class ScheduledJob:
+    """A job that is run repeatedly by the `PollScheduler`.
+
+    *target* is called with the job as the only argument and must return the
+    absolute time at which the job should run next, or None to not run it
+    again until an event is posted.
+    """
+
+    def __init__(self, name, target, backend=''):
+        self.name = name
+        self.target = target
+        self.backend = backend
+        # events posted since the last run
+        self.events = deque()
+        self.due = None
+        self.seq = None
+        self.running = False
+
+    def __repr__(self):
+        return '<job %s>' % self.name
+
+
+class PollStats:
+    """Statistics about the delay between due time and start of a job."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.maximum = 0.
+        self.jitter = 0.
+        self._last = None
+
+    def record(self, latency):
+        self.count += 1
+        self.total += latency
+        self.maximum = max(self.maximum, latency)
+        if self._last is not None:
+            # smoothed variation of the latency, as in RFC 3550
+            self.jitter += (abs(latency - self._last) - self.jitter) / 16.
+        self._last = latency
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.
+
+    def __str__(self):
+        return '%d polls, latency %.1f ms (max %.1f ms), jitter %.1f ms' % (
+            self.count, self.mean * 1000, self.maximum * 1000,
+            self.jitter * 1000)
+
+
+class WorkerPool:
+    """A bounded number of threads running the jobs of one backend."""
+
+    def __init__(self, scheduler, name, size):
+        self.name = name
+        self.stats = PollStats()
+        self._scheduler = scheduler
+        self._queue = queue.Queue()
+        self._threads = [createThread('poll worker %s #%d' % (name, i + 1),
+                                      self._worker)
+                         for i in range(size)]
+
+    def submit(self, job, due):
+        self._queue.put((job, due))
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job, due = item
+            started = currenttime()
+            self.stats.record(max(started - due, 0))
+            nextdue = None
+            try:
+                nextdue = job.target(job)
+            except Exception:
+                self._scheduler.log.exception('%-10s: unhandled error in '
+                                              'scheduled job', job.name)
+                nextdue = currenttime() + 10
+            finally:
+                self._scheduler.done(job, nextdue)
+
+
+class PollScheduler:
+    """Dispatches due jobs to the worker pool of their backend.
+
+    Each job is either waiting in the heap, queued for a worker or running,
+    so it is never run concurrently with itself.
+    """
+
+    def __init__(self, log, poolsize):
+        self.log = log
+        self.poolsize = poolsize
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._pools = {}
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        self._thread = createThread('poll scheduler', self._run)
+
+    def add(self, job, due=None):
+        with self._cond:
+            self._schedule(job, currenttime() if due is None else due)
+
+    def post(self, job, event):
+        """Add an event for the job and run it as soon as possible."""
+        with self._cond:
+            job.events.append(event)
+            if not job.running:
+                now = currenttime()
+                if job.due is None or job.due > now:
+                    self._schedule(job, now)
+
+    def done(self, job, nextdue):
+        with self._cond:
+            job.running = False
+            if self._stopped:
+                return
+            if job.events:
+                nextdue = currenttime()
+            if nextdue is not None:
+                self._schedule(job, nextdue)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.stop()
+
+    def join(self):
+        if self._thread:
+            self._thread.join()
+        for pool in list(self._pools.values()):
+            pool.join()
+
+    def stats(self):
+        """Return a dictionary of backend name -> (workers, queued, stats)."""
+        with self._cond:
+            return {name: (len(pool._threads), pool.qsize(), pool.stats)
+                    for (name, pool) in self._pools.items()}
+
+    def _schedule(self, job, due):
+        # a previous heap entry of the job becomes stale by changing its seq
+        job.due = due
+        job.seq = next(self._seq)
+        heapq.heappush(self._heap, (due, job.seq, job))
+        if self._heap[0][2] is job:
+            self._cond.notify()
+
+    def _run(self):
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, seq, job = self._heap[0]
+                if seq != job.seq:
+                    heapq.heappop(self._heap)
+                    continue
+                delay = due - currenttime()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                job.seq = job.due = None
+                job.running = True
+                pool = self._pools.get(job.backend)
+                if pool is None:
+                    self.log.debug('starting worker pool for %r',
+                                   job.backend)
+                    pool = self._pools[job.backend] = WorkerPool(
+                        self, job.backend or 'default', self.poolsize)
+                pool.submit(job, due)
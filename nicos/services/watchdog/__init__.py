@@ -23,6 +23,7 @@
 
 """The NICOS watchdog daemon."""
 
+import builtins
 import hashlib
 import os
 import sys
@@ -34,8 +35,8 @@ from nicos import config, session
 from nicos.core import Override, Param, anytype, dictof, listof, status
 from nicos.devices.cacheclient import BaseCacheClient
 from nicos.devices.notifiers import Mailer, Notifier
-from nicos.protocols.cache import OP_SUBSCRIBE, OP_TELL, OP_TELLOLD, \
-    cache_dump, cache_load
+from nicos.protocols.cache import OP_ASK, OP_SUBSCRIBE, OP_TELL, OP_TELLOLD, \
+    OP_WILDCARD, cache_dump, cache_load
 from nicos.services.watchdog.conditions import DelayedTrigger, Expression, \
     ConditionWithPrecondition
 from nicos.utils import LCDict, createSubprocess, createThread, \
@@ -79,6 +80,10 @@ class Entry:
                 'precondtime', 'okmessage', 'okaction', 'actiontimeout',
                 'precondcooldown')}
         res['enabled'] = self.cond_obj.enabled
+        # number of evaluations, skipped evaluations (inputs unchanged) and
+        # the total evaluation time of the condition expressions
+        res['evalcount'], res['evalskipped'], res['evaltime'] = \
+            self.cond_obj.eval_stats()
         return res
 
 
@@ -114,6 +119,19 @@ class Watchdog(BaseCacheClient):
         self._setups = set()
         # mapping entry ids to entrys
         self._entries = {}
+        # mapping of full cache keys to mangled keys for conditions
+        self._keynames = {}
+        # lowercased names of all devices in the setups
+        self._devnames = None
+        # names in conditions that are no cache keys
+        self._constants = {name.lower() for name in self._keydict} | \
+            set(dir(builtins))
+        # keys of unknown devices, requested with a wildcard
+        self._wildcard_keys = set()
+        # last raw (undecoded) values of interesting keys
+        self._rawvalues = {}
+        # when to publish the configuration with updated statistics
+        self._publish_at = 0
         # (mangled) key to update mail receivers
         self._mailreceiverkey = self.mailreceiverkey.replace('/', '_').lower()
         # mapping cache keys to entries that check this key
@@ -207,9 +225,12 @@ class Watchdog(BaseCacheClient):
                            'this condition', logprefix)
             return
 
+        newkeys = cond.interesting_keys() - set(self._keymap)
         for key in cond.interesting_keys():
             self._keymap.setdefault(key, set()).add(entry)
         self._entries[entry.id] = entry
+        if newkeys and self._connected:
+            self._add_subscriptions(self._cache_keys(newkeys))
 
     def _remove_entry(self, eid):
         entry = self._entries.pop(eid, None)
@@ -217,8 +238,56 @@ class Watchdog(BaseCacheClient):
             for key in entry.cond_obj.interesting_keys():
                 self._keymap[key].discard(entry)
 
+    def _cache_key(self, key):
+        """Return the cache key that is mangled to the given key.
+
+        Condition keys are ``dev/param`` with the slash replaced by an
+        underscore.  Since device names can contain underscores, the key is
+        split after the longest device name known from the setups.  Keys of
+        unknown devices cannot be resolved; for them, all keys of devices
+        starting with the part up to the first underscore are requested.
+        Names that are no cache keys (status constants and builtins) give
+        None.
+        """
+        if key in self._constants:
+            return None
+        if self._devnames is None:
+            self._devnames = {devname.lower()
+                              for info in session._setup_info.values() if info
+                              for devname in info['devices']}
+        pos = key.rfind('_')
+        if pos == -1:
+            return self._prefix + key
+        while pos != -1:
+            if key[:pos] in self._devnames:
+                return self._prefix + key[:pos] + '/' + key[pos + 1:]
+            first = pos
+            pos = key.rfind('_', 0, pos)
+        fallback = self._prefix + key[:first]
+        if fallback not in self._wildcard_keys:
+            self.log.warning('condition key %r does not start with a known '
+                             'device name, requesting all keys starting with '
+                             '%r', key, fallback)
+            self._wildcard_keys.add(fallback)
+        return fallback
+
+    def _cache_keys(self, keys):
+        return sorted({self._cache_key(key) for key in keys} - {None})
+
     # cache client API
 
+    # request only the exact keys, not all keys containing them
+    _subscription_op = OP_ASK
+
+    def _request_op(self, key):
+        if key in self._wildcard_keys:
+            return OP_WILDCARD
+        return OP_ASK
+
+    def _subscription_keys(self):
+        # only request keys used by conditions (and the special ones)
+        return self._cache_keys(self._keymap)
+
     def _connect_action(self):
         # inhibit direct processing of updates
         self._process_updates = False
@@ -243,6 +312,8 @@ class Watchdog(BaseCacheClient):
         for entry in self._entries.values():
             if entry.cond_obj.tick(t) or entry.cond_obj.is_expired(t):
                 self._check_state(entry, t)
+        if self._publish_at and t > self._publish_at:
+            self._publish_config()
 
     def _handle_msg(self, time, ttlop, ttl, tsop, key, op, value):
         if key.startswith('watchdog/'):
@@ -250,17 +321,29 @@ class Watchdog(BaseCacheClient):
                                      op != OP_TELL)
             return
 
-        key = key[len(self._prefix):].replace('/', '_').lower()
+        try:
+            key = self._keynames[key]
+        except KeyError:
+            key = self._keynames[key] = \
+                key[len(self._prefix):].replace('/', '_').lower()
 
         # do we need the key for conditions?
         if key not in self._keymap:
             return
         expired = op == OP_TELLOLD or not value
-        value = None if expired else cache_load(value)
-        if not expired:
-            self._keydict[key] = value
-        else:
+        if expired:
+            self._rawvalues.pop(key, None)
             self._keydict.pop(key, None)
+            value = None
+            if not time:
+                # reply to the request for a key that does not exist
+                return
+        elif self._rawvalues.get(key) == value:
+            # no need to decode the same value again
+            value = self._keydict[key]
+        else:
+            self._rawvalues[key] = value
+            value = self._keydict[key] = cache_load(value)
         time = float(time)
 
         if self._process_updates:
@@ -290,9 +373,11 @@ class Watchdog(BaseCacheClient):
         self._publish_config()
 
     def _publish_config(self):
-        # publish current condition info in the cache
+        # publish current condition info in the cache; republish it
+        # regularly to update the evaluation statistics
         self._put_message('configured', None,
                           [c.serialize() for c in self._entries.values()])
+        self._publish_at = currenttime() + 60
 
     def _process_key(self, time, key, value):
         # check setups?
@@ -316,6 +401,7 @@ class Watchdog(BaseCacheClient):
                     self._remove_entry(entry.id)
         # check if we need to add some conditions
         session.readSetups()  # refresh setup info
+        self._devnames = None
         for new_setup in self._setups - prev_setups:
             info = session._setup_info.get(new_setup)
             if info and info['watch_conditions']:
@@ -24,9 +24,14 @@
 """Condition objects for the NICOS watchdog."""
 
 import ast
+import builtins
+from time import perf_counter
 
 from nicos.utils import checkSetupSpec
 
+# marks keys without a current value in the inputs of an Expression
+MISSING = object()
+
 
 class Condition:
     """Represents the current state of a watchdog condition.
@@ -76,9 +81,20 @@ class Condition:
     def update(self, time, keydict):
         """Must be called to notify about a cache key-value change."""
 
+    def eval_stats(self):
+        """Return number of evaluations, skipped evaluations and the total
+        evaluation time of all expressions of this condition.
+        """
+        return (0, 0, 0.)
+
 
 class Expression(Condition):
-    """A condition that evaluates an expression made up of cache keys."""
+    """A condition that evaluates an expression made up of cache keys.
+
+    The expression is compiled once, with all names converted to lowercase
+    cache keys.  It is only evaluated again if one of the keys it uses, or
+    the enabled state, has changed since the last evaluation.
+    """
 
     def __init__(self, log, expr, setup_expr):
         Condition.__init__(self, log)
@@ -89,10 +105,19 @@ class Expression(Condition):
         # otherwise wait for new_setups() to be called
         self.setup_enabled = not self.setup_expr
         self.expires_at = 0
-        cond_parse = ast.parse(expr)
+        cond_parse = ast.parse(expr, mode='eval')
         for node in ast.walk(cond_parse):
             if isinstance(node, ast.Name):
-                self.keys.add(node.id.lower())
+                node.id = node.id.lower()
+                self.keys.add(node.id)
+        self._code = compile(cond_parse, '<condition %r>' % expr, 'eval')
+        self._globals = {'__builtins__': builtins}
+        # the keys to look up in the key dictionary, in a fixed order
+        self._slots = tuple(sorted(self.keys))
+        self._lastinput = None
+        self.evalcount = 0
+        self.skipcount = 0
+        self.evaltime = 0.
 
     def is_expired(self, time):
         return self.expires_at and time > self.expires_at
@@ -103,10 +128,30 @@ class Expression(Condition):
     def new_setups(self, setups):
         self.setup_enabled = checkSetupSpec(self.setup_expr, setups)
         self.expires_at = 0
+        self._lastinput = None
+
+    def eval_stats(self):
+        return (self.evalcount, self.skipcount, self.evaltime)
+
+    def _unchanged(self, inputs):
+        try:
+            return inputs == self._lastinput
+        except Exception:  # e.g. comparing arrays
+            return False
 
     def update(self, time, keydict):
+        values = tuple(keydict.get(key, MISSING) for key in self._slots)
+        inputs = (values, self.enabled, self.setup_enabled)
+        if self._unchanged(inputs):
+            self.skipcount += 1
+            return
+        self._lastinput = inputs
+        namespace = {key: value for (key, value) in zip(self._slots, values)
+                     if value is not MISSING}
+        self.evalcount += 1
+        started = perf_counter()
         try:
-            value = eval(self.expr, keydict)
+            value = eval(self._code, self._globals, namespace)
         except NameError:
             if self.setup_enabled and self.enabled and not self.expires_at:
                 self.expires_at = time + 6
@@ -116,6 +161,8 @@ class Expression(Condition):
         else:
             self.expires_at = 0
             self.triggered = bool(value) and self.enabled and self.setup_enabled
+        finally:
+            self.evaltime += perf_counter() - started
 
 
 class DelayedTrigger(Condition):
@@ -142,6 +189,9 @@ class DelayedTrigger(Condition):
     def interesting_keys(self):
         return self.cond.interesting_keys()
 
+    def eval_stats(self):
+        return self.cond.eval_stats()
+
     def tick(self, time):
         self.cond.tick(time)
         if self.t_trigger and time >= self.t_trigger:
@@ -192,6 +242,10 @@ class ConditionWithPrecondition(Condition):
     def interesting_keys(self):
         return self.pre.interesting_keys() | self.cond.interesting_keys()
 
+    def eval_stats(self):
+        return tuple(a + b for (a, b) in zip(self.pre.eval_stats(),
+                                             self.cond.eval_stats()))
+
     def tick(self, time):
         return self.pre.tick(time) or self.cond.tick(time)
 
@@ -0,0 +1,134 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Profiling of the startup of NICOS processes.
+
+If the environment variable ``NICOS_STARTUP_PROFILE`` is set to a file name
+when a NICOS process starts, the time needed to import each module and to
+create each device is recorded.  A report is written to that file each time
+setups have been loaded, and when the process exits.
+
+The times are given as cumulative time, and "own" time excluding nested
+imports and device creations (e.g. of attached devices).
+"""
+
+import atexit
+import builtins
+import os
+import sys
+import threading
+from time import perf_counter
+
+# the active profile, if any
+profile = None
+
+
+class StartupProfile:
+    """Records import and device creation times."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.started = perf_counter()
+        # module name -> (cumulative, own) time
+        self.imports = {}
+        # device name -> (cumulative, own) time
+        self.devices = {}
+        self._local = threading.local()
+        self._orig_import = builtins.__import__
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+            return stack
+
+    def begin(self):
+        # the stack entries accumulate the time spent in nested operations
+        self._stack().append(0.)
+        return perf_counter()
+
+    def end(self, table, name, started):
+        elapsed = perf_counter() - started
+        stack = self._stack()
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        table[name] = (elapsed, elapsed - nested)
+
+    def device_created(self, devname, started):
+        self.end(self.devices, devname, started)
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._orig_import(name, globals, locals, fromlist, level)
+        started = self.begin()
+        try:
+            return self._orig_import(name, globals, locals, fromlist, level)
+        finally:
+            self.end(self.imports, name, started)
+
+    def report(self, limit=50):
+        lines = ['NICOS startup profile of %s (pid %d), %.3f s after start'
+                 % (' '.join(sys.argv), os.getpid(),
+                    perf_counter() - self.started), '']
+
+        def table(title, entries, key):
+            lines.append('%s (%d entries, times in ms):' % (title,
+                                                           len(entries)))
+            lines.append('%10s %10s  %s' % ('cumulative', 'own', 'name'))
+            for (name, (cumulative, own)) in sorted(
+                    entries.items(), key=key, reverse=True)[:limit]:
+                lines.append('%10.1f %10.1f  %s' % (cumulative * 1000,
+                                                    own * 1000, name))
+            lines.append('')
+
+        imports = dict(self.imports)
+        devices = dict(self.devices)
+        table('Module imports by own time', imports, lambda e: e[1][1])
+        table('Device creation by cumulative time', devices,
+              lambda e: e[1][0])
+        return '\n'.join(lines)
+
+    def write(self):
+        try:
+            with open(self.filename, 'w', encoding='utf-8') as fp:
+                fp.write(self.report())
+        except OSError as err:
+            sys.stderr.write('could not write startup profile: %s\n' % err)
+
+
+def install(filename):
+    """Start profiling, and write the report to *filename*."""
+    global profile  # pylint: disable=global-statement
+    if profile is not None:
+        return
+    profile = StartupProfile(filename)
+    builtins.__import__ = profile._import
+    atexit.register(profile.write)
+
+
+def write_report():
+    """Write the report, if profiling is active."""
+    if profile is not None:
+        profile.write()
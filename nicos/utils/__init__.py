@@ -49,8 +49,6 @@ from stat import S_IRGRP, S_IROTH, S_IRUSR, S_IRWXU, S_IWUSR, S_IXGRP, \
 from time import localtime, mktime, sleep, strftime, strptime, \
     time as currenttime
 
-import numpy
-
 # do **not** import nicos.session here
 # session dependent nicos utilities should be implemented in nicos.core.utils
 from nicos import config, get_custom_version, nicos_version
@@ -167,6 +165,49 @@ class BoundedOrderedDict(OrderedDict):
         return value
 
 
+class LRUCache(OrderedDict):
+    """Ordered dict that drops the least recently used items when it holds
+    more than *maxlen* items, or items of more than *maxbytes* total size.
+
+    The size of an item is determined by calling *sizeof* with the value.
+    Items are marked as used with `touch`.  Since values can be modified in
+    place, `shrink` should be called after that.  The most recently added or
+    used item is never dropped.
+    """
+
+    def __init__(self, maxlen=None, maxbytes=None, sizeof=sys.getsizeof):
+        self.maxlen = maxlen
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        OrderedDict.__init__(self)
+
+    def __setitem__(self, key, value):
+        OrderedDict.__setitem__(self, key, value)
+        self.move_to_end(key)
+        self.shrink()
+
+    def touch(self, key):
+        """Mark the item as most recently used."""
+        self.move_to_end(key)
+
+    def totalsize(self):
+        return sum(self.sizeof(value) for value in self.values())
+
+    def shrink(self):
+        """Drop least recently used items until the limits are met."""
+        if self.maxlen is not None:
+            while len(self) > max(self.maxlen, 1):
+                self.popitem(last=False)
+        if self.maxbytes is not None:
+            sizes = [self.sizeof(value) for value in self.values()]
+            total = sum(sizes)
+            for size in sizes[:-1]:
+                if total <= self.maxbytes:
+                    break
+                self.popitem(last=False)
+                total -= size
+
+
 class AutoDefaultODict(OrderedDict):
     """Ordered dict that automatically creates values for missing keys as
     ordered dicts.
@@ -1536,12 +1577,22 @@ class KeyExprTransform(ast.NodeTransformer):
         return node
 
 
-KEYEXPR_NS = {}
-for name in [
-        'pi', 'sqrt', 'sin', 'cos', 'tan', 'arcsin', 'arccos',
-        'arctan', 'exp', 'log', 'radians', 'degrees', 'ceil', 'floor']:
-    KEYEXPR_NS[name] = getattr(numpy, name)
-KEYEXPR_NS['numpy'] = numpy
+KEYEXPR_NAMES = frozenset([
+    'pi', 'sqrt', 'sin', 'cos', 'tan', 'arcsin', 'arccos',
+    'arctan', 'exp', 'log', 'radians', 'degrees', 'ceil', 'floor', 'numpy'])
+
+
+def __getattr__(name):
+    # KEYEXPR_NS is created on first use, to avoid importing numpy with
+    # this module
+    if name == 'KEYEXPR_NS':
+        import numpy
+        ns = {fname: getattr(numpy, fname)
+              for fname in KEYEXPR_NAMES if fname != 'numpy'}
+        ns['numpy'] = numpy
+        globals()['KEYEXPR_NS'] = ns
+        return ns
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
 
 
 def _split_spec(spec, exprs):
@@ -1599,7 +1650,7 @@ def parseKeyExpression(spec, append_value=True,
         # find the variable and replace by "x"
         key = None
         for node in ast.walk(expr):
-            if isinstance(node, ast.Name) and node.id not in KEYEXPR_NS:
+            if isinstance(node, ast.Name) and node.id not in KEYEXPR_NAMES:
                 key = normalize(node.id)
                 if '/' not in key and append_value:
                     key += '/value'
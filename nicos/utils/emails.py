@@ -23,11 +23,6 @@
 
 """Utilities for sending E-Mails."""
 
-import smtplib
-from email.mime.application import MIMEApplication
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.utils import formatdate
 from os import path
 
 from nicos.core import ConfigurationError
@@ -79,6 +74,13 @@ def sendMail(mailserver, receiverlist, mailsender, topic, body,
     if errors:
         return ['No mail sent because of invalid parameters'] + errors
 
+    # the email modules take long to import, only do it when needed
+    import smtplib
+    from email.mime.application import MIMEApplication
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.utils import formatdate
+
     # construct msg according to
     # http://docs.python.org/library/email-examples.html#email-examples
     receivers = ', '.join(receiverlist)
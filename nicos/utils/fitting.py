@@ -24,8 +24,6 @@
 
 from numpy import array, cos, diagonal, exp, full_like, isinf, linspace, log, \
     mean, pi, piecewise, power, sqrt
-from scipy.optimize import curve_fit
-from scipy.signal import argrelmax
 
 from nicos.core import ProgrammingError
 from nicos.utils import FitterRegistry
@@ -145,6 +143,8 @@ class Fit(metaclass=FitterMeta):
                 return self.result(xn, yn, dyn, None, None,
                                    msg='while guessing parameters: %s' % e)
 
+        # scipy takes long to import, only do it when needed
+        from scipy.optimize import curve_fit
         try:
             popt, pcov = curve_fit(self.model, xn, yn, self.parstart, dyn,
                                    # default of 1000 can be too restrictive,
@@ -307,6 +307,7 @@ class CosineFit(PredefinedFit):
         return B + A * cos(2 * pi * f * (x - x0))
 
     def guesspar(self, x, y):
+        from scipy.signal import argrelmax
         ymin = min(y)
         ymax = max(y)
         A = (ymax - ymin) / 2
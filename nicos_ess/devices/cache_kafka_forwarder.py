@@ -21,7 +21,6 @@
 #   Ebad Kamil <ebad.kamil@ess.eu>
 #
 # *****************************************************************************
-import queue
 import time
 from threading import Lock
 
@@ -30,7 +29,7 @@ from streaming_data_types.logdata_f144 import serialise_f144
 
 from nicos.core import Device, Override, Param, host, listof, status
 from nicos.protocols.cache import cache_load
-from nicos.services.collector import ForwarderBase
+from nicos.services.collector import BatchingForwarder
 from nicos.utils import createThread
 from nicos_ess.devices.kafka.producer import KafkaProducer
 
@@ -65,7 +64,14 @@ def to_f144(dev_name, dev_value, timestamp_ns):
     return serialise_f144(dev_name, dev_value, timestamp_ns)
 
 
-class CacheKafkaForwarder(ForwarderBase, Device):
+class CacheKafkaForwarder(BatchingForwarder, Device):
+    """Forwards the values and statuses of devices to Kafka.
+
+    Updates are coalesced per device within the `batchwindow`, so that only
+    the latest value is sent, and each batch is produced to Kafka in one go.
+    In addition, the last known values are sent every `update_interval`.
+    """
+
     parameters = {
         'brokers':
             Param('List of kafka brokers to connect to',
@@ -93,6 +99,12 @@ class CacheKafkaForwarder(ForwarderBase, Device):
                   default=10.0,
                   type=float,
                   settable=False),
+        'update_stale_only':
+            Param('Send regular updates only for values that have not been '
+                  'sent within the last update interval',
+                  default=False,
+                  type=bool,
+                  settable=False),
     }
     parameter_overrides = {
         # Key filters are irrelevant for this collector
@@ -100,16 +112,15 @@ class CacheKafkaForwarder(ForwarderBase, Device):
     }
 
     def doInit(self, mode):
-        self._dev_to_value_cache = {}
-        self._dev_to_status_cache = {}
+        # maps the key to the latest (timestamp, ttl, key, op, value)
+        self._latest = {}
+        # maps the key to the time.monotonic() of the last send
+        self._last_sent = {}
         self._producer = None
         self._lock = Lock()
 
         self._initFilters()
-        self._queue = queue.Queue(1000)
-        self._worker = createThread('cache_to_kafka',
-                                    self._processQueue,
-                                    start=False)
+        self._initBatching()
         self._regular_update_worker = createThread('send_regular_updates',
                                                    self._poll_updates,
                                                    start=False)
@@ -123,21 +134,31 @@ class CacheKafkaForwarder(ForwarderBase, Device):
                 time.sleep(5)
         self.log.info('Connected to Kafka brokers %s', self.brokers)
 
+    def doShutdown(self):
+        self._stopBatching()
+
     def _startWorker(self):
-        self._worker.start()
+        BatchingForwarder._startWorker(self)
         self._regular_update_worker.start()
 
     def _poll_updates(self):
-        while True:
-            with self._lock:
-                for name, (value,
-                           timestamp) in self._dev_to_value_cache.items():
-                    self._push_to_queue(name, value, timestamp, True)
-                for name, (value,
-                           timestamp) in self._dev_to_status_cache.items():
-                    self._push_to_queue(name, value, timestamp, False)
-
+        while not self._stoprequest:
             time.sleep(self.update_interval)
+            self._send_regular_updates()
+
+    def _send_regular_updates(self):
+        now = time.monotonic()
+        # enqueue while holding the batching lock, so that a newer update
+        # cannot arrive in between and be replaced by the one read here;
+        # keys with a pending update are sent anyway
+        with self._pendcond, self._lock:
+            for (key, update) in self._latest.items():
+                if key in self._pending:
+                    continue
+                if self.update_stale_only and \
+                   now - self._last_sent.get(key, 0) < self.update_interval:
+                    continue
+                BatchingForwarder._putChange(self, *update)
 
     def _checkKey(self, key):
         if key.endswith('/value') or key.endswith('/status'):
@@ -149,7 +170,7 @@ class CacheKafkaForwarder(ForwarderBase, Device):
             return True
         return False
 
-    def _putChange(self, timestamp, ttl, key, value):
+    def _putChange(self, timestamp, ttl, key, op, value):
         if value is None:
             return
         dev_name = key[0:key.index('/')]
@@ -158,45 +179,49 @@ class CacheKafkaForwarder(ForwarderBase, Device):
         self.log.debug('_putChange %s %s %s', key, value, timestamp)
 
         with self._lock:
-            timestamp_ns = int(float(timestamp) * 10**9)
-            if key.endswith('value'):
-                self._dev_to_value_cache[dev_name] = (value, timestamp_ns)
-                self._push_to_queue(dev_name, value, timestamp_ns, True)
-            else:
-                self._dev_to_status_cache[dev_name] = (convert_status(value),
-                                                       timestamp_ns)
-                self._push_to_queue(dev_name,
-                                    *self._dev_to_status_cache[dev_name],
-                                    False)
-
-    def _push_to_queue(self, dev_name, value, timestamp, is_value):
-        try:
-            self._queue.put_nowait((dev_name, value, timestamp, is_value))
-        except queue.Full:
-            self.log.error('Queue full, so discarding older value(s)')
-            self._queue.get()
-            self._queue.put((dev_name, value, timestamp, is_value))
-            self._queue.task_done()
-
-    def _processQueue(self):
-        while True:
-            name, value, timestamp, is_value = self._queue.get()
+            self._latest[key] = (timestamp, ttl, key, op, value)
+        BatchingForwarder._putChange(self, timestamp, ttl, key, op, value)
+
+    def _to_message(self, timestamp, key, value):
+        """Return the FlatBuffer for an update, or None if it isn't sent."""
+        dev_name, _, subkey = key.partition('/')
+        timestamp_ns = int(float(timestamp) * 10**9)
+        if subkey == 'value':
+            # Convert value from string to correct type
+            value = cache_load(value)
+            if isinstance(value, str):
+                # Policy decision: don't send strings via f144
+                return None
+            return to_f144(dev_name, value, timestamp_ns)
+        return serialise_al00(dev_name, timestamp_ns, *convert_status(value))
+
+    def _sendBatch(self, batch):
+        messages = []
+        failed = 0
+        for (timestamp, _ttl, key, _op, value) in batch:
             try:
-                if is_value:
-                    # Convert value from string to correct type
-                    value = cache_load(value)
-                    if not isinstance(value, str):
-                        # Policy decision: don't send strings via f144
-                        buffer = to_f144(name, value, timestamp)
-                        self._send_to_kafka(buffer, name)
-                else:
-                    buffer = serialise_al00(name, timestamp, value[0],
-                                            value[1])
-                    self._send_to_kafka(buffer, name)
+                buffer = self._to_message(timestamp, key, value)
             except Exception as error:
                 self.log.error('Could not forward data: %s', error)
-            self._queue.task_done()
-
-    def _send_to_kafka(self, buffer, name):
-        self._producer.produce(self.output_topic, buffer,
-                               key=name.encode('utf-8'))
+                failed += 1
+                continue
+            if buffer is not None:
+                dev_name = key[0:key.index('/')]
+                messages.append((dev_name.encode('utf-8'), buffer))
+
+        errors = []
+
+        def on_delivery(err, _msg):
+            if err is not None:
+                errors.append(err)
+
+        self._producer.produce_batch(self.output_topic, messages,
+                                     on_delivery_callback=on_delivery)
+        if errors:
+            self.log.error('Could not deliver %d of %d messages: %s',
+                           len(errors), len(messages), errors[0])
+        now = time.monotonic()
+        with self._lock:
+            for (_timestamp, _ttl, key, _op, _value) in batch:
+                self._last_sent[key] = now
+        return failed + len(errors)
@@ -0,0 +1,248 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Local histogramming of ev44 event data, without just-bin-it."""
+
+import time
+from threading import Lock
+
+import numpy as np
+from streaming_data_types import deserialise_ev44
+from streaming_data_types.utils import get_schema
+
+from nicos.core import Override, Value, oneof, status
+from nicos.devices.generic import ImageChannelMixin, PassiveChannel
+
+from nicos_ess.devices.datasources.just_bin_it import HasHistogramParams, \
+    hist_type_by_name
+from nicos_ess.devices.kafka.consumer import KafkaSubscriber
+
+
+def _bin_indices(values, low, high, num_bins):
+    """Return the bin of each value in [low, high) divided into *num_bins*.
+
+    Values outside of the range get the index *num_bins*.
+    """
+    scaled = np.subtract(values, low, dtype=np.float64)
+    scaled *= num_bins / (high - low)
+    indices = scaled.astype(np.intp)
+    indices[(scaled < 0) | (indices >= num_bins)] = num_bins
+    return indices
+
+
+class EventHistogram:
+    """Histograms events into a preallocated array, like just-bin-it does.
+
+    The histogram types are those of just-bin-it:
+
+    * '1-D TOF': *num_bins* time-of-flight bins over *tof_range*, counting
+      only events of the pixels in *det_range*
+    * '2-D TOF': *num_bins* time-of-flight bins times *num_bins* pixel bins
+      over *det_range*
+    * '2-D DET': one bin per pixel of a *det_width* x *det_height* detector,
+      whose first pixel has the ID ``det_range[0]``
+
+    The upper limits of the ranges are excluded.  Events are binned with
+    whole-array operations, and the counts are added to `data` in place.
+    """
+
+    hist_types = ('1-D TOF', '2-D TOF', '2-D DET')
+
+    def __init__(self, hist_type, tof_range, det_range, num_bins, det_width,
+                 det_height):
+        self.hist_type = hist_type
+        self.tof_range = tof_range
+        self.det_range = det_range
+        self.num_bins = num_bins
+        if hist_type not in self.hist_types:
+            raise ValueError(f'histogram type {hist_type} is not supported')
+        if hist_type == '1-D TOF':
+            shape = (num_bins,)
+        elif hist_type == '2-D TOF':
+            shape = (num_bins, num_bins)
+        else:
+            shape = (det_width, det_height)
+        self.data = np.zeros(shape, dtype=np.float64)
+        self._flat = self.data.reshape(-1)
+        # number of events counted in the histogram
+        self.total = 0
+
+    def clear(self):
+        self.data[...] = 0
+        self.total = 0
+
+    def _indices(self, time_of_flight, pixel_id):
+        if self.hist_type == '2-D DET':
+            indices = np.subtract(pixel_id, self.det_range[0], dtype=np.intp)
+            indices[(indices < 0) | (indices >= self._flat.size)] = \
+                self._flat.size
+            return indices
+        indices = _bin_indices(time_of_flight, *self.tof_range, self.num_bins)
+        if self.hist_type == '1-D TOF':
+            pixel_id = np.asarray(pixel_id)
+            indices[(pixel_id < self.det_range[0]) |
+                    (pixel_id >= self.det_range[1])] = self.num_bins
+            return indices
+        pixel_bins = _bin_indices(pixel_id, *self.det_range, self.num_bins)
+        outside = (indices == self.num_bins) | (pixel_bins == self.num_bins)
+        indices *= self.num_bins
+        indices += pixel_bins
+        indices[outside] = self._flat.size
+        return indices
+
+    def add_events(self, time_of_flight, pixel_id):
+        """Add events given by arrays of their time-of-flight and pixel ID."""
+        if not len(pixel_id):
+            return
+        indices = self._indices(time_of_flight, pixel_id)
+        size = self._flat.size
+        if len(indices) >= size // 8:
+            counts = np.bincount(indices, minlength=size + 1)
+            self.total += len(indices) - int(counts[size])
+            self._flat += counts[:size]
+        else:
+            # don't go through all bins of a large histogram for few events
+            indices = indices[indices < size]
+            self.total += len(indices)
+            np.add.at(self._flat, indices, 1)
+
+    def add_message(self, message):
+        """Add the events of an ev44 message (given as bytes)."""
+        events = deserialise_ev44(message)
+        self.add_events(events.time_of_flight, events.pixel_id)
+
+
+class EventHistogramImage(KafkaSubscriber, HasHistogramParams,
+                          ImageChannelMixin, PassiveChannel):
+    """An image channel that histograms ev44 event data itself.
+
+    It gives the same histograms as `JustBinItImage`, without needing a
+    just-bin-it service.  The events are taken from the data topic while
+    counting; recorded messages can be replayed with `new_messages_callback`.
+    """
+
+    parameter_overrides = {
+        'hist_type':
+            Override(type=oneof(*EventHistogram.hist_types)),
+        'unit':
+            Override(default='events', settable=False, mandatory=False),
+        'fmtstr':
+            Override(default='%d'),
+        'pollinterval':
+            Override(default=None, userparam=False, settable=False),
+    }
+
+    def doPreinit(self, mode):
+        self._current_status = (status.OK, '')
+        self._counting = False
+        self._lock = Lock()
+        KafkaSubscriber.doPreinit(self, mode)
+
+    def doInit(self, mode):
+        self._create_histogram()
+
+    def _histogram_config(self):
+        return (self.hist_type, self.tof_range, self.det_range,
+                self.num_bins, self.det_width, self.det_height)
+
+    def _create_histogram(self):
+        with self._lock:
+            self._config = self._histogram_config()
+            self._histogram = EventHistogram(*self._config)
+
+    def arrayInfo(self):
+        return hist_type_by_name[self.hist_type].get_array_description(
+            **self._params)
+
+    def doPrepare(self):
+        self._update_status(status.BUSY, 'Preparing')
+        if self._histogram_config() == self._config:
+            # keep the arrays, the histogram has the same layout
+            with self._lock:
+                self._histogram.clear()
+        else:
+            self._create_histogram()
+        self._update_status(status.OK, '')
+
+    def doStart(self):
+        self._counting = True
+        if self._consumer:
+            try:
+                self.subscribe(self.data_topic)
+            except Exception as error:
+                self._counting = False
+                self._update_status(status.ERROR, str(error))
+                raise
+        self._update_status(status.BUSY, 'Counting')
+
+    def new_messages_callback(self, messages):
+        if not self._counting:
+            return
+        for _, message in messages:
+            if get_schema(message) != 'ev44':
+                continue
+            events = deserialise_ev44(message)
+            if self.source and events.source_name != self.source:
+                continue
+            with self._lock:
+                self._histogram.add_events(events.time_of_flight,
+                                           events.pixel_id)
+
+    def _stop_counting(self):
+        self._counting = False
+        self._stoprequest = True
+        self._update_status(status.OK, '')
+
+    def doFinish(self):
+        self._stop_counting()
+
+    def doStop(self):
+        self._stop_counting()
+
+    def _update_status(self, new_status, message):
+        self._current_status = new_status, message
+        if self._cache:
+            self._cache.put(self._name, 'status', self._current_status,
+                            time.time())
+
+    def doStatus(self, maxage=0):
+        return self._current_status
+
+    def doRead(self, maxage=0):
+        return [self._histogram.total]
+
+    def doReadArray(self, quality):
+        with self._lock:
+            data = self._histogram.data.copy()
+        return hist_type_by_name[self.hist_type].transform_data(
+            data, rotation=self.rotation)
+
+    def valueInfo(self):
+        return (Value(self.name, fmtstr='%d'), )
+
+    def doInfo(self):
+        result = [(f'{self.name} histogram type', self.hist_type,
+                   self.hist_type, '', 'general')]
+        result.extend(
+            hist_type_by_name[self.hist_type].get_info(**self._params))
+        return result
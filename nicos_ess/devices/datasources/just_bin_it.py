@@ -27,8 +27,9 @@ import numpy as np
 from streaming_data_types import deserialise_hs00, deserialise_hs01
 from streaming_data_types.utils import get_schema
 
-from nicos.core import ArrayDesc, InvalidValueError, Override, Param, Value, \
-    floatrange, listof, multiStatus, oneof, status, tupleof
+from nicos.core import ArrayDesc, DeviceMixinBase, InvalidValueError, \
+    Override, Param, Value, floatrange, listof, multiStatus, oneof, status, \
+    tupleof
 from nicos.core.constants import LIVE, MASTER, SIMULATION
 from nicos.devices.generic import Detector, ImageChannelMixin, PassiveChannel
 from nicos.utils import createThread
@@ -149,16 +150,12 @@ deserialiser_by_schema = {
 }
 
 
-class JustBinItImage(KafkaSubscriber, ImageChannelMixin, PassiveChannel):
+class HasHistogramParams(DeviceMixinBase):
+    """Parameters of the histograms made from event data, see
+    `hist_type_by_name`.
+    """
+
     parameters = {
-        'hist_topic':
-            Param(
-                'The topic to listen on for the histogram data',
-                type=str,
-                userparam=False,
-                settable=False,
-                mandatory=True,
-            ),
         'data_topic':
             Param(
                 'The topic to listen on for the event data',
@@ -209,14 +206,6 @@ class JustBinItImage(KafkaSubscriber, ImageChannelMixin, PassiveChannel):
                 userparam=True,
                 settable=True,
             ),
-        'left_edges':
-            Param(
-                'The left edges for a ROI histogram',
-                type=listof(int),
-                default=[],
-                userparam=True,
-                settable=True,
-            ),
         'source':
             Param(
                 'Identifier source on multiplexed topics',
@@ -235,6 +224,28 @@ class JustBinItImage(KafkaSubscriber, ImageChannelMixin, PassiveChannel):
             ),
     }
 
+
+class JustBinItImage(KafkaSubscriber, HasHistogramParams, ImageChannelMixin,
+                     PassiveChannel):
+    parameters = {
+        'hist_topic':
+            Param(
+                'The topic to listen on for the histogram data',
+                type=str,
+                userparam=False,
+                settable=False,
+                mandatory=True,
+            ),
+        'left_edges':
+            Param(
+                'The left edges for a ROI histogram',
+                type=listof(int),
+                default=[],
+                userparam=True,
+                settable=True,
+            ),
+    }
+
     parameter_overrides = {
         'unit':
             Override(default='events', settable=False, mandatory=False),
@@ -26,7 +26,8 @@ import time
 from enum import Enum
 
 import numpy
-from streaming_data_types import deserialise_ADAr
+from streaming_data_types.area_detector_ADAr import get_payload_data
+from streaming_data_types.fbschemas.ADAr_ADArray_schema.ADArray import ADArray
 from streaming_data_types.utils import get_schema
 
 from nicos import session
@@ -38,12 +39,24 @@ from nicos.devices.epics.status import SEVERITY_TO_STATUS, STAT_TO_STATUS
 from nicos.devices.generic import Detector, ImageChannelMixin, ManualSwitch
 from nicos.utils import byteBuffer
 
-from nicos_ess.devices.kafka.consumer import KafkaSubscriber
+from nicos_ess.devices.kafka.consumer import KafkaSubscriber, latest_messages
 from nicos_sinq.devices.epics.area_detector import \
     ADKafkaPlugin as ADKafkaPluginBase
 
-deserialiser_by_schema = {
-    'ADAr': deserialise_ADAr,
+
+def get_ADAr_image(buffer):
+    """Return the image of an ADAr message.
+
+    Unlike deserialise_ADAr, this does not decode the attributes, and the
+    image is a view into *buffer* instead of a copy.  Since the buffer of a
+    Kafka message is immutable, the image is read-only: it is passed on as
+    is by `AreaDetector`, and must be copied by users that modify it.
+    """
+    return get_payload_data(ADArray.GetRootAsADArray(buffer, 0))
+
+
+image_getter_by_schema = {
+    'ADAr': get_ADAr_image,
 }
 
 data_type_t = {
@@ -219,6 +232,12 @@ class AreaDetector(KafkaSubscriber, EpicsDevice, ImageChannelMixin, Measurable):
         ),
     }
 
+    parameter_overrides = {
+        # only the latest image is shown
+        'batchsize': Override(default=100),
+        'latestonly': Override(default=True),
+    }
+
     _control_pvs = {
         'size_x': 'SizeX',
         'size_y': 'SizeY',
@@ -334,15 +353,19 @@ class AreaDetector(KafkaSubscriber, EpicsDevice, ImageChannelMixin, Measurable):
     def _get_new_messages(self):
         self._consumer.seek_to_end()
         while not self._stoprequest:
-            if (data := self._consumer.poll(timeout_ms=100)):
-                message = (data.timestamp()[1], data.value())
-                self.new_messages_callback([message])
-                approx_imsize = numpy.sqrt(len(data.value()) / 2)
+            received = self._consumer.consume(self.batchsize, timeout_ms=100)
+            if self.latestonly:
+                # images that arrived in the meantime replace each other
+                received = latest_messages(received)
+            if received:
+                self.new_messages_callback(
+                    [(data.timestamp()[1], data.value()) for data in received])
+                approx_imsize = numpy.sqrt(len(received[-1].value()) / 2)
                 sleep_time = (approx_imsize / 2048) * 2
                 time.sleep(sleep_time)
+                # skip the images that arrived while waiting, so that the
+                # next one shown is the newest
                 self._consumer.seek_to_end()
-            else:
-                time.sleep(0.1)
         self.log.debug('KafkaSubscriber thread finished')
 
     def new_messages_callback(self, messages):
@@ -350,12 +373,12 @@ class AreaDetector(KafkaSubscriber, EpicsDevice, ImageChannelMixin, Measurable):
         with self._image_processing_lock:
             latest_timestamp = None
             for timestamp, message in messages:
-                deserialiser = deserialiser_by_schema.get(get_schema(message))
-                if not deserialiser:
+                get_image = image_getter_by_schema.get(get_schema(message))
+                if not get_image:
                     continue
                 if latest_timestamp is None or timestamp > latest_timestamp:
                     latest_timestamp = timestamp
-                    self._latest_image = deserialiser(message).data
+                    self._latest_image = get_image(message)
 
             if self._latest_image is not None:
                 self.putResult(LIVE, self._latest_image, latest_timestamp)
@@ -436,6 +459,7 @@ class AreaDetector(KafkaSubscriber, EpicsDevice, ImageChannelMixin, Measurable):
         return self._get_pv('readpv')
 
     def doReadArray(self, quality):
+        # a read-only view into the last message, see get_ADAr_image
         return self._image_array
 
     def doReadSizex(self):
@@ -187,6 +187,19 @@ class EpicsMotor(CanDisable, CanReference, HasOffset, EpicsMoveable, Motor):
 
         return pvs
 
+    @classmethod
+    def _get_config_pv_names(cls, config):
+        motor_record_prefix = config.get('motorpv')
+        if not motor_record_prefix:
+            return set()
+        pvnames = {'.'.join((motor_record_prefix, field))
+                   for field in cls._record_fields.values()}
+        for suffix, motor_suffix in cls._suffixes.items():
+            if config.get('has_' + suffix,
+                          cls.parameters['has_' + suffix].default):
+                pvnames.add(''.join((motor_record_prefix, motor_suffix)))
+        return pvnames
+
     def _get_status_parameters(self):
         status_pars = {
             'miss',
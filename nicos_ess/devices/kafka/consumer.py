@@ -27,7 +27,7 @@ import uuid
 from confluent_kafka import OFFSET_END, Consumer, KafkaException, \
     TopicPartition
 
-from nicos.core import DeviceMixinBase, Param, host, listof
+from nicos.core import DeviceMixinBase, Param, host, intrange, listof
 from nicos.core.constants import SIMULATION
 from nicos.core.errors import ConfigurationError
 from nicos.utils import createThread
@@ -35,6 +35,22 @@ from nicos.utils import createThread
 from nicos_ess.devices.kafka.utils import create_sasl_config
 
 
+def latest_messages(messages):
+    """Return only the latest of messages that supersede each other.
+
+    A message supersedes the earlier ones with the same topic, partition,
+    key and FlatBuffers schema, e.g. the frames of an image stream.  The
+    order of the remaining messages is kept.
+    """
+    latest = {}
+    for message in messages:
+        kind = (message.topic(), message.partition(), message.key(),
+                message.value()[4:8])
+        latest.pop(kind, None)
+        latest[kind] = message
+    return list(latest.values())
+
+
 class KafkaConsumer:
     """Class for wrapping the Confluent Kafka consumer."""
 
@@ -107,6 +123,17 @@ class KafkaConsumer:
         """
         return self._consumer.poll(timeout_ms // 1000)
 
+    def consume(self, max_messages, timeout_ms=5):
+        """Poll for several messages at once.
+
+        :param max_messages: The maximum number of messages to return.
+        :param timeout_ms: The time to wait for *max_messages* messages.
+        :return: A list of the messages received within the timeout, without
+            error events.
+        """
+        messages = self._consumer.consume(max_messages, timeout_ms / 1000)
+        return [message for message in messages if not message.error()]
+
     def close(self):
         """Close the consumer."""
         self._consumer.close()
@@ -171,7 +198,20 @@ class KafkaSubscriber(DeviceMixinBase):
                   type=listof(host(defaultport=9092)),
                   mandatory=True,
                   preinit=True,
-                  userparam=False)
+                  userparam=False),
+        'batchsize':
+            Param('Maximum number of messages to receive at once; with '
+                  'more than one, messages are received as they arrive '
+                  'instead of one per loop delay',
+                  type=intrange(1, 100000),
+                  default=1,
+                  userparam=False),
+        'latestonly':
+            Param('Pass only the latest of the messages received at once '
+                  'that supersede each other (see latest_messages)',
+                  type=bool,
+                  default=False,
+                  userparam=False),
     }
     _updater_thread = None
 
@@ -209,14 +249,22 @@ class KafkaSubscriber(DeviceMixinBase):
                                             self._get_new_messages)
         self.log.debug('subscribed to updates from topic: %s' % topic)
 
-    def _get_new_messages(self):
-        while not self._stoprequest:
+    def _receive_messages(self):
+        if self.batchsize == 1:
             time.sleep(self._long_loop_delay)
-
-            messages = []
             data = self._consumer.poll(timeout_ms=5)
-            if data:
-                messages.append((data.timestamp(), data.value()))
+            received = [data] if data else []
+        else:
+            received = self._consumer.consume(
+                self.batchsize, timeout_ms=int(self._long_loop_delay * 1000))
+        if self.latestonly:
+            received = latest_messages(received)
+        return received
+
+    def _get_new_messages(self):
+        while not self._stoprequest:
+            messages = [(data.timestamp(), data.value())
+                        for data in self._receive_messages()]
 
             if messages:
                 self.new_messages_callback(messages)
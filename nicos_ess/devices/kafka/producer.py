@@ -76,6 +76,25 @@ class KafkaProducer:
                                key=key, on_delivery=on_delivery_callback)
         self._producer.flush()
 
+    def produce_batch(self, topic_name, messages, on_delivery_callback=None):
+        """Send several messages to Kafka, waiting only once for delivery.
+
+        :param topic_name: The topic to send to.
+        :param messages: The (key, message) pairs to send.
+        :param on_delivery_callback: The delivery callback, called for each
+            message. Optional.
+        """
+        for key, message in messages:
+            while True:
+                try:
+                    self._producer.produce(topic_name, message, key=key,
+                                           on_delivery=on_delivery_callback)
+                    break
+                except BufferError:
+                    # the local queue is full: wait for some deliveries
+                    self._producer.poll(0.1)
+        self._producer.flush()
+
 
 class ProducesKafkaMessages(DeviceMixinBase):
     """ Device to produce messages to kafka. The method *send* can be used
@@ -35,6 +35,6 @@ class NumpyBinaryFileReader(ImageFileReader):
     @classmethod
     def fromfile(cls, filename):
         try:
-            return np.load(filename)
+            return np.load(filename, mmap_mode='r')
         except Exception as error:
             raise NicosError("Unable to open numpy file.") from error
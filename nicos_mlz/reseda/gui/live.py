@@ -135,6 +135,8 @@ class CascadeLiveDataPanel(LiveDataPanel):
                 self.log.debug('add to cache: %s', uid)
                 self._datacache[uid] = {}
             self._datacache[uid]['dataarrays'] = arrays
+            self._datacache.touch(uid)
+            self._datacache.shrink()
         if display:
             if uid:
                 if titles is None:
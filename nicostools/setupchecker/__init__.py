@@ -22,19 +22,27 @@
 # *****************************************************************************
 
 import ast
+import hashlib
+import json
 import logging
+import multiprocessing
 import os
 import re
+import sys
 import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from os import path
+from time import time as currenttime
 
+from nicos import nicos_version
 from nicos.clients.gui import config as guicfg
 from nicos.clients.gui.config import prepareGuiNamespace
 from nicos.core.device import DeviceAlias
 from nicos.core.errors import ConfigurationError
 from nicos.core.params import nicosdev_re
-from nicos.core.sessions.setups import SETUP_GROUPS, fixup_stacked_devices, \
-    prepareNamespace
+from nicos.core.sessions.setups import SETUP_GROUPS, SetupGraph, \
+    fixup_stacked_devices, prepareNamespace
 from nicos.utils import checkSetupSpec, importString
 from nicos.utils.files import findSetupRoots, iterSetups
 from nicos.utils.loggers import StreamHandler
@@ -51,6 +59,44 @@ interpol_re = re.compile(
     r'[hlL]?[diouxXeEfFgGcrs%]'
 )
 
+# increase when the checks change, to invalidate cached results
+CHECKER_VERSION = 1
+
+# results of importString() for all classes and modules used by the setups,
+# including errors; with multiple worker processes, each inherits the entries
+# of the main process
+_import_cache = {}
+
+
+def import_class(name):
+    """Like `importString`, but imports every name only once."""
+    try:
+        result = _import_cache[name]
+    except KeyError:
+        try:
+            result = importString(name)
+        except Exception as err:
+            result = err
+        _import_cache[name] = result
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def file_hash(filename):
+    with open(filename, 'rb') as fp:
+        return hashlib.sha1(fp.read()).hexdigest()
+
+
+def module_stamps(modnames):
+    stamps = {}
+    for modname in modnames:
+        filename = getattr(sys.modules.get(modname), '__file__', None)
+        if filename:
+            st = os.stat(filename)
+            stamps[filename] = [st.st_mtime_ns, st.st_size]
+    return stamps
+
 
 def setupname(filename):
     return path.basename(filename)[:-3]
@@ -70,6 +116,9 @@ class Logger(logging.Logger):
     def handle(self, record):
         record.message = record.getMessage()
         record.filename = ''
+        # keep the originals for recording the messages
+        record.setupfile = record.name
+        record.setupline = getattr(record, 'line', 0)
         # the ColoredConsoleHandler does not use "line", make it part of name
         if getattr(record, 'line', 0):
             record.name = '%s:%s' % (record.name, record.line)
@@ -91,6 +140,7 @@ class SetupCollection:
         self.setup_ast = {}         # Setup file ASTs.
         self.exec_errors = {}       # Errors during exec()ution of a setup.
         self.all_devs_lc = set()    # All devices seen, with lowercase name.
+        self.graph = None           # Relations between the setups.
 
         # bookkeeping for SetupChecker
         self.devs_seen = {}
@@ -110,6 +160,7 @@ class SetupCollection:
             setuplist = list(iterSetups(setup_roots))
             self.all_setups = dict(setuplist)
             self._exec_all(setuplist)
+            self._build_graph()
 
     def _exec_all(self, setuplist):
         for (setupname, filename) in setuplist:
@@ -141,6 +192,57 @@ class SetupCollection:
                 for dev in ns.get('devices', {}):
                     self.all_devs_lc.add(dev.lower())
 
+    def register(self, filename):
+        """Register devices and help topics of a setup in the order in which
+        the setups are checked, as the check of each setup would do.
+
+        This is needed to check setups independent of each other.
+        """
+        ns = self.namespace.get(path.normpath(path.abspath(filename)))
+        if ns is None or setupname(filename).startswith('guiconfig') or \
+           ns.get('group', 'optional') == 'special':
+            return
+        filename = path.normpath(path.abspath(filename))
+        for devname in ns.get('devices', {}):
+            self.devs_seen.setdefault(devname, filename)
+        for helpname in ns.get('help_topics', {}):
+            self.helptopics_seen.setdefault(helpname, filename)
+
+    def dependencies(self, filename):
+        """Return the files whose content influences the result of checking
+        the given setup file.
+        """
+        filename = path.normpath(path.abspath(filename))
+        ns = self.namespace.get(filename, {})
+        deps = {filename}
+        name = setupname(filename)
+        if self.graph and self.all_setups and not name.startswith('guiconfig'):
+            for include in self.graph.closure([name]):
+                if include in self.all_setups:
+                    deps.add(path.normpath(path.abspath(
+                        self.all_setups[include])))
+                else:
+                    deps.add(include)  # missing setup
+        for devname in ns.get('devices', {}):
+            deps.add(self.devs_seen.get(devname, filename))
+        for helpname in ns.get('help_topics', {}):
+            deps.add(self.helptopics_seen.get(helpname, filename))
+        return deps
+
+    def _build_graph(self):
+        infodict = {}
+        for (name, filename) in self.all_setups.items():
+            ns = self.namespace.get(path.normpath(path.abspath(filename)))
+            if ns is None:
+                infodict[name] = None
+                continue
+            # wrong types are reported by the SetupChecker
+            infodict[name] = {
+                key: ns.get(key) if isinstance(ns.get(key), vtype) else vtype()
+                for (key, vtype) in [('includes', list), ('excludes', list),
+                                     ('devices', dict)]}
+        self.graph = SetupGraph(infodict)
+
 
 class SetupChecker:
 
@@ -150,6 +252,7 @@ class SetupChecker:
         self.collection = collection
         self.filename = filename
         self.setupname = setupname(filename)
+        self.used_modules = set()
         if self.filename in self.collection.exec_errors:
             (exc, msg) = self.collection.exec_errors[self.filename]
             if msg:
@@ -291,7 +394,7 @@ class SetupChecker:
             return False
         # try to import the device class
         try:
-            cls = importString(devconfig[0])
+            cls = import_class(devconfig[0])
         except (ImportError, RuntimeError) as err:
             self.log.warning(
                 'device class %r for %r not importable: %s', devconfig[0],
@@ -304,6 +407,7 @@ class SetupChecker:
                 extra=self.find_deventry(devname)
             )
             return self.log_exception(e)
+        self.used_modules.add(cls.__module__)
         config = devconfig[1].copy()
 
         # check missing attached devices
@@ -412,6 +516,8 @@ class SetupChecker:
                 # we have a duplicate: it's okay if we exclude the other setup
                 # or if we are both basic setups
                 other = self.collection.devs_seen[devname]
+                if other == self.filename:
+                    continue
                 self_group = self.ns.get('group', 'optional')
                 other_group = self.collection.namespace[other].get('group',
                                                                    'optional')
@@ -483,16 +589,38 @@ class SetupChecker:
                     extra=self.find_global(vname)
                 )
 
+        # check that all included setups exist and can be loaded together
+        graph = self.collection.graph
+        own_file = self.collection.all_setups and path.normpath(path.abspath(
+            self.collection.all_setups.get(self.setupname, '')))
+        if graph and graph.info.get(self.setupname) is not None and \
+           own_file == self.filename:
+            for missing in sorted(graph.missing([self.setupname])):
+                self.log_error(
+                    'included setup %r does not exist (included by %s)',
+                    missing, '->'.join(
+                        graph.includeChain(self.setupname, missing)[:-1]),
+                    extra=self.find_global('includes')
+                )
+            closure = graph.closure([self.setupname])
+            for (excluded, excluder) in sorted(graph.conflicts(closure)):
+                self.log_error(
+                    'setup %r is excluded by %r, but both are included',
+                    excluded, excluder, extra=self.find_global('includes')
+                )
+
         # check for importability of modules
         for module in self.ns.get('modules', []):
             # try to import the device class
             try:
-                importString(module)
+                import_class(module)
             except Exception as err:
                 self.log_error(
                     'module %r not importable: %s', module, err,
                     extra=self.find_global('modules')
                 )
+            else:
+                self.used_modules.add(module)
 
         # check for validity of alias_config
         aliascfg = self.ns.get('alias_config', {})
@@ -595,13 +723,14 @@ class SetupChecker:
                     self.check_guiconfig_panel_spec(child[1], context)
         elif isinstance(spec, guicfg.panel):
             try:
-                cls = importString(spec.clsname)
+                cls = import_class(spec.clsname)
             except Exception as err:
                 self.log_error(
                     'class %r for %s not importable: %s', spec.clsname, context,
                     err
                 )
             else:
+                self.used_modules.add(cls.__module__)
                 if qt and not issubclass(cls, Panel):
                     self.log.warning(
                         'class %r for %s is not a Panel '
@@ -630,13 +759,14 @@ class SetupChecker:
 
         if isinstance(spec, guicfg.tool):
             try:
-                cls = importString(spec.clsname)
+                cls = import_class(spec.clsname)
             except Exception as err:
                 self.log_error(
                     'class %r for tool %r not importable: %s', spec.clsname,
                     spec.name, err
                 )
             else:
+                self.used_modules.add(cls.__module__)
                 if qt and not issubclass(cls, (qt.QDialog, qt.QMainWindow)):
                     self.log.warning(
                         'class %r for tool %r is not a QDialog or'
@@ -653,6 +783,8 @@ class SetupChecker:
                     self.collection.helptopics_seen[helpname] = self.filename
                     continue
                 other = self.collection.helptopics_seen[helpname]
+                if other == self.filename:
+                    continue
                 self_group = self.ns.get('group', 'optional')
                 other_group = self.collection.namespace[other].get('group',
                                                                    'optional')
@@ -678,7 +810,125 @@ class SetupChecker:
         checkSetupSpec(setupspec, '', log=self.log)
 
 
+class RecordingHandler(logging.Handler):
+    """Records the messages of a setup check instead of emitting them."""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append({
+            'logger': getattr(record, 'setupfile', record.name),
+            'level': record.levelno,
+            'line': getattr(record, 'setupline', getattr(record, 'line', 0)),
+            'message': record.getMessage(),
+        })
+
+
+def replay(records):
+    """Emit recorded messages again."""
+    for rec in records:
+        logging.getLogger(rec['logger']).log(rec['level'], '%s',
+                                              rec['message'],
+                                              extra={'line': rec['line']})
+
+
+def run_check(collection, filename):
+    """Check a single setup file and return the result as a dict with the
+    recorded messages.
+    """
+    root_log = logging.getLogger()
+    handlers = root_log.handlers[:]
+    recorder = RecordingHandler()
+    root_log.handlers[:] = [recorder]
+    try:
+        checker = SetupChecker(collection, filename)
+        try:
+            good = bool(checker.check())
+        except Exception as err:
+            checker.log_exception(err)
+            good = False
+        stamps = module_stamps(checker.used_modules)
+    finally:
+        root_log.handlers[:] = handlers
+    return {'good': good, 'messages': recorder.records, 'modules': stamps}
+
+
+# the collection to check in worker processes, inherited from the main process
+_worker_collection = None
+
+
+def _check_in_worker(filename):
+    return run_check(_worker_collection, filename)
+
+
+class ResultCache:
+    """Stores check results of setup files, keyed by a hash of the file and
+    all files that influence its check result.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self._version = [CHECKER_VERSION, nicos_version, sys.version]
+        try:
+            with open(filename, encoding='utf-8') as fp:
+                data = json.load(fp)
+            if data.get('version') == self._version:
+                self.entries = data['entries']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def key(self, collection, filename):
+        hashes = []
+        for dep in sorted(collection.dependencies(filename)):
+            hashes.append([dep, file_hash(dep) if path.isfile(dep) else None])
+        return hashlib.sha1(json.dumps(hashes).encode()).hexdigest()
+
+    def lookup(self, filename, key):
+        entry = self.entries.get(filename)
+        if entry is None or entry['key'] != key:
+            return None
+        # changed device classes can change the result as well
+        for (modfile, stamp) in entry['result']['modules'].items():
+            try:
+                st = os.stat(modfile)
+            except OSError:
+                return None
+            if [st.st_mtime_ns, st.st_size] != stamp:
+                return None
+        return entry['result']
+
+    def store(self, filename, key, result):
+        self.entries[filename] = {'key': key, 'result': result}
+
+    def save(self):
+        os.makedirs(path.dirname(path.abspath(self.filename)), exist_ok=True)
+        tmpname = self.filename + '.%d.tmp' % os.getpid()
+        with open(tmpname, 'w', encoding='utf-8') as fp:
+            json.dump({'version': self._version, 'entries': self.entries}, fp)
+        os.replace(tmpname, self.filename)
+
+
 class SetupValidator:
+    """Checks setup files.
+
+    With *jobs* > 1, the setup files are checked by that many worker
+    processes.  If a *cachefile* is given, results are stored there and only
+    setups are checked again for which the file, one of the setups it
+    depends on, or one of the used device classes has changed.
+
+    The results of all checked files are collected in the `results` dict,
+    which can be written as a JSON report with `write_report`.
+    """
+
+    def __init__(self, jobs=1, cachefile=None):
+        self.jobs = jobs
+        self.cache = ResultCache(cachefile) if cachefile else None
+        self.results = {}
+        self.started = currenttime()
+
     def walk(self, paths, separate=False):
         good = True
         collection = SetupCollection()
@@ -690,12 +940,14 @@ class SetupValidator:
                 self.validateRecursive(collection, p)
             elif path.isfile(p):
                 collection.add(p)
-                good &= SetupChecker(collection, p).check()
+                good &= self.check_files(collection, [p])
             if not path.exists(p):
                 # Explicitly no negative return value as the rest of the paths
                 # may have been checked.
                 log = logging.getLogger(p)
                 log.error('File not found')
+        if self.cache:
+            self.cache.save()
         return good
 
     def collectRecursive(self, c, p):
@@ -705,9 +957,112 @@ class SetupValidator:
                     c.add(path.join(root, f))
 
     def validateRecursive(self, c, p):
-        good = True
+        filenames = []
         for root, _dirs, files in os.walk(p):
             for f in files:
                 if f.endswith('.py'):
-                    good &= SetupChecker(c, path.join(root, f)).check()
+                    filenames.append(path.join(root, f))
+        return self.check_files(c, filenames)
+
+    def check_files(self, collection, filenames):
+        """Check the given files of the collection and report the results
+        in the given order.
+        """
+        # the checks of duplicate devices depend on the order of checking
+        for filename in filenames:
+            collection.register(filename)
+
+        keys = {}
+        cached = {}
+        todo = []
+        for filename in filenames:
+            if self.cache:
+                absname = path.normpath(path.abspath(filename))
+                keys[filename] = self.cache.key(collection, filename)
+                result = self.cache.lookup(absname, keys[filename])
+                if result is not None:
+                    cached[filename] = result
+                    continue
+            todo.append(filename)
+
+        good = True
+        checked = self._check(collection, todo)
+        for filename in filenames:
+            absname = path.normpath(path.abspath(filename))
+            if filename in cached:
+                result = cached[filename]
+            else:
+                result = next(checked)
+                if self.cache:
+                    self.cache.store(absname, keys[filename], result)
+            replay(result['messages'])
+            self.results[absname] = dict(result, cached=filename in cached)
+            good &= result['good']
         return good
+
+    def _check(self, collection, filenames):
+        # yield the results of checking the files in the given order
+        if self.jobs <= 1 or len(filenames) <= 1:
+            for filename in filenames:
+                yield run_check(collection, filename)
+            return
+        # the worker processes are forked, so that they can use the
+        # collection and the imported classes of this process
+        self._import_shared(collection, filenames)
+        global _worker_collection  # pylint: disable=global-statement
+        _worker_collection = collection
+        try:
+            with ProcessPoolExecutor(
+                    self.jobs,
+                    mp_context=multiprocessing.get_context('fork')) as pool:
+                chunksize = max(1, len(filenames) // (4 * self.jobs))
+                yield from pool.map(_check_in_worker, filenames,
+                                    chunksize=chunksize)
+        finally:
+            _worker_collection = None
+
+    def _import_shared(self, collection, filenames):
+        # import device classes used by several setups only once, before
+        # starting the workers
+        counts = Counter()
+        for filename in filenames:
+            ns = collection.namespace.get(path.normpath(path.abspath(filename)))
+            devices = ns.get('devices') if ns else None
+            if isinstance(devices, dict):
+                counts.update({entry[0] for entry in devices.values()
+                               if isinstance(entry, tuple) and entry and
+                               isinstance(entry[0], str)})
+        for (clsname, count) in counts.items():
+            if count > 1:
+                try:
+                    import_class(clsname)
+                except Exception:
+                    pass  # reported by the check
+
+    def write_report(self, filename):
+        """Write a JSON report of all checked files."""
+        files = {}
+        counts = {'files': 0, 'cached': 0, 'errors': 0, 'warnings': 0}
+        for (setupfile, result) in sorted(self.results.items()):
+            counts['files'] += 1
+            counts['cached'] += result['cached']
+            messages = []
+            for rec in result['messages']:
+                if rec['level'] >= logging.ERROR:
+                    counts['errors'] += 1
+                elif rec['level'] >= logging.WARNING:
+                    counts['warnings'] += 1
+                messages.append({'level': logging.getLevelName(rec['level']),
+                                 'line': rec['line'] or None,
+                                 'message': rec['message']})
+            files[setupfile] = {'good': result['good'],
+                                'cached': result['cached'],
+                                'messages': messages}
+        report = {
+            'good': all(result['good'] for result in self.results.values()),
+            'duration': round(currenttime() - self.started, 3),
+            'summary': counts,
+            'files': files,
+        }
+        with open(filename, 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, indent=2)
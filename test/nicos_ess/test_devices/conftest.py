@@ -0,0 +1,48 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Test configuration file containing fixtures for the ESS device tests."""
+
+from unittest import mock
+
+import pytest
+
+
+@pytest.fixture
+def kafka_setup(session):
+    """Return a function that loads a setup without connecting to Kafka.
+
+    The devices of the setup are created while the KafkaProducer and
+    KafkaConsumer classes are mocked; `producer` is returned by
+    ``KafkaProducer.create``.  The setup is unloaded after the test.
+    """
+    def load(setupname, producer=None):
+        with mock.patch('nicos_ess.devices.kafka.consumer.KafkaConsumer'), \
+                mock.patch('nicos_ess.devices.cache_kafka_forwarder.'
+                           'KafkaProducer') as kafka_producer:
+            kafka_producer.create.return_value = producer
+            session.unloadSetup()
+            session.loadSetup(setupname, autocreate_devices=True)
+
+    yield load
+    session.unloadSetup()
@@ -0,0 +1,136 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+import pytest
+
+pytest.importorskip('streaming_data_types')
+pytest.importorskip('confluent_kafka')
+
+from streaming_data_types.alarm_al00 import Severity, deserialise_al00
+from streaming_data_types.logdata_f144 import deserialise_f144
+
+from nicos.core import status
+from nicos.protocols.cache import OP_TELL, cache_dump
+
+session_setup = None
+
+
+class StubProducer:
+    """Records the produced messages instead of sending them."""
+
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+
+    def produce_batch(self, topic_name, messages, on_delivery_callback=None):
+        messages = list(messages)
+        self.batches.append((topic_name, messages))
+        for _ in messages:
+            on_delivery_callback('delivery failed' if self.fail else None,
+                                 None)
+
+
+class TestCacheKafkaForwarder:
+
+    @pytest.fixture(autouse=True)
+    def prepare(self, session, log, kafka_setup):
+        self.log = log
+        self.producer = StubProducer()
+        kafka_setup('ess_cache_forwarder', self.producer)
+        self.forwarder = session.getDevice('CacheKafka')
+
+    def put(self, timestamp, key, value):
+        self.forwarder._putChange(timestamp, '', key, OP_TELL,
+                                  cache_dump(value))
+
+    def flush(self):
+        return self.forwarder._sendBatch(self.forwarder._nextBatch())
+
+    def sent(self):
+        return [msg for (_, messages) in self.producer.batches
+                for (_, msg) in messages]
+
+    def test_updates_are_coalesced_per_device(self):
+        self.put(1, 'dev1/value', 1.0)
+        self.put(2, 'dev2/value', 5.0)
+        self.put(3, 'dev1/value', 2.0)
+        self.put(4, 'dev1/status', (status.WARN, 'warning'))
+        self.put(5, 'ignored/value', 1.0)
+        self.put(6, 'dev1/target', 1.0)
+        self.put(7, 'dev3/value', 'strings are not sent')
+        assert self.flush() == 0
+
+        assert len(self.producer.batches) == 1
+        topic, messages = self.producer.batches[0]
+        assert topic == 'TEST_nicosDevices'
+        assert [key for (key, _) in messages] == [b'dev1', b'dev2', b'dev1']
+        value1, value2, alarm = messages[0][1], messages[1][1], messages[2][1]
+        assert deserialise_f144(value1).value == 2.0
+        assert deserialise_f144(value1).timestamp_unix_ns == 3 * 10**9
+        assert deserialise_f144(value2).value == 5.0
+        alarm = deserialise_al00(alarm)
+        assert (alarm.severity, alarm.message) == (Severity.MINOR, 'warning')
+
+    def test_delivery_failures_are_counted(self):
+        self.producer.fail = True
+        self.put(1, 'dev1/value', 1.0)
+        self.put(1, 'dev2/value', 2.0)
+        with self.log.assert_errors('Could not deliver 2 of 2 messages'):
+            assert self.flush() == 2
+
+    def test_regular_updates(self):
+        self.put(1, 'dev1/value', 1.0)
+        self.put(1, 'dev2/value', 2.0)
+        self.flush()
+        self.put(2, 'dev2/value', 3.0)
+        self.flush()
+
+        self.forwarder._send_regular_updates()
+        self.flush()
+        values = [deserialise_f144(msg).value for msg in self.sent()[3:]]
+        assert values == [1.0, 3.0]
+
+    def test_regular_updates_keep_pending_updates(self):
+        self.put(1, 'dev1/value', 1.0)
+        self.flush()
+        old = self.forwarder._latest['dev1/value']
+        self.put(2, 'dev1/value', 2.0)
+        # an older value must not replace the pending update
+        self.forwarder._latest['dev1/value'] = old
+        self.forwarder._send_regular_updates()
+        self.flush()
+        values = [deserialise_f144(msg).value for msg in self.sent()[1:]]
+        assert values == [2.0]
+
+    def test_regular_updates_only_for_stale_devices(self):
+        self.forwarder._setROParam('update_stale_only', True)
+        self.put(1, 'dev1/value', 1.0)
+        self.flush()
+        self.forwarder._last_sent['dev1/value'] -= 2
+        self.put(2, 'dev2/value', 2.0)
+        self.flush()
+
+        self.forwarder._send_regular_updates()
+        self.flush()
+        values = [deserialise_f144(msg).value for msg in self.sent()[2:]]
+        assert values == [1.0]
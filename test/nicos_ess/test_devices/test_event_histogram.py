@@ -0,0 +1,123 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+import numpy as np
+import pytest
+
+pytest.importorskip('streaming_data_types')
+pytest.importorskip('confluent_kafka')
+
+from streaming_data_types import serialise_ev44
+
+from nicos.core import status
+
+from nicos_ess.devices.datasources.event_histogram import EventHistogram
+
+session_setup = None
+
+
+def random_events(num, tof_max=1000, pixel_max=100):
+    rng = np.random.default_rng(42)
+    return (rng.integers(-10, tof_max + 10, num, dtype=np.int32),
+            rng.integers(-1, pixel_max + 2, num, dtype=np.int32))
+
+
+def ev44(tofs, pixels, source='detector'):
+    return serialise_ev44(source, 0, [0], [0], tofs, pixels)
+
+
+@pytest.mark.parametrize('num', [10, 100000])
+def test_1d_tof(num):
+    tofs, pixels = random_events(num)
+    hist = EventHistogram('1-D TOF', (0, 1000), (10, 20), 50, 0, 0)
+    hist.add_events(tofs, pixels)
+    hist.add_events(tofs, pixels)
+
+    selected = (pixels >= 10) & (pixels < 20) & (tofs < 1000)
+    expected, _ = np.histogram(tofs[selected], 50, (0, 1000))
+    assert (hist.data == 2 * expected).all()
+    assert hist.total == 2 * expected.sum()
+
+
+@pytest.mark.parametrize('num', [10, 100000])
+def test_2d_tof(num):
+    tofs, pixels = random_events(num)
+    hist = EventHistogram('2-D TOF', (0, 1000), (0, 100), 20, 0, 0)
+    hist.add_events(tofs, pixels)
+
+    selected = (pixels < 100) & (tofs < 1000)
+    expected, _, _ = np.histogram2d(tofs[selected], pixels[selected], 20,
+                                    ((0, 1000), (0, 100)))
+    assert (hist.data == expected).all()
+    assert hist.total == expected.sum()
+
+
+@pytest.mark.parametrize('num', [10, 100000])
+def test_2d_det(num):
+    tofs, pixels = random_events(num, pixel_max=12)
+    hist = EventHistogram('2-D DET', (0, 1000), (1, 13), 0, 3, 4)
+    data = hist.data
+    hist.add_events(tofs, pixels)
+
+    expected = np.bincount(pixels[(pixels >= 1) & (pixels < 13)] - 1,
+                           minlength=12).reshape(3, 4)
+    assert hist.data is data
+    assert (hist.data == expected).all()
+
+    hist.clear()
+    assert hist.data is data
+    assert not hist.data.any()
+    assert hist.total == 0
+
+
+class TestEventHistogramImage:
+
+    @pytest.fixture(autouse=True)
+    def prepare(self, session, kafka_setup):
+        kafka_setup('ess_event_histogram')
+        self.channel = session.getDevice('hist')
+
+    def test_counting(self):
+        channel = self.channel
+        messages = [(0, ev44([1, 2, 3], [1, 5, 12])),
+                    (0, ev44([1, 2], [1, 1], source='other')),
+                    (0, ev44([1], [13]))]
+        channel.new_messages_callback(messages)
+        assert channel.read(0) == [0]
+
+        channel.prepare()
+        channel.start()
+        channel.consumer.subscribe.assert_called_once_with('TEST_events')
+        assert channel.status(0)[0] == status.BUSY
+        channel.new_messages_callback(messages)
+        channel.finish()
+        assert channel.status(0)[0] == status.OK
+
+        assert channel.read(0) == [3]
+        data = channel.readArray(0)
+        assert data.shape == (3, 4)
+        assert data[0, 0] == data[1, 0] == data[2, 3] == 1
+        assert data.sum() == 3
+
+        channel.prepare()
+        assert channel.read(0) == [0]
@@ -0,0 +1,171 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+import time
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+import pytest
+
+pytest.importorskip('streaming_data_types')
+pytest.importorskip('confluent_kafka')
+
+from streaming_data_types import serialise_ADAr, serialise_ev44
+
+from nicos_ess.devices.kafka.consumer import latest_messages
+
+from test.nicos_ess.test_devices.utils import RecordedConsumer, \
+    RecordedMessage, load_messages, record_messages
+
+session_setup = None
+
+
+def image_message(number, key=b'camera'):
+    image = np.full((4, 3), number, dtype=np.uint16)
+    return RecordedMessage('TEST_images', key, number,
+                           serialise_ADAr('camera', number, datetime.now(),
+                                          image))
+
+
+def event_message(number, pixels):
+    return RecordedMessage('TEST_events', None, number,
+                           serialise_ev44('detector', number, [0], [0],
+                                          [number] * len(pixels), pixels))
+
+
+@pytest.fixture
+def recording(tmp_path):
+    messages = [event_message(i, [1, 2, 3, 4]) for i in range(250)]
+    filename = tmp_path / 'events.dat'
+    record_messages(filename, messages)
+    return filename
+
+
+def test_recording(recording):
+    messages = load_messages(recording)
+    assert len(messages) == 250
+    assert messages[7].topic() == 'TEST_events'
+    assert messages[7].key() is None
+    assert messages[7].timestamp() == (1, 7)
+    assert messages[7].value() == event_message(7, [1, 2, 3, 4]).value()
+
+
+def test_latest_messages():
+    messages = [image_message(1), event_message(2, [1]), image_message(3),
+                image_message(4, b'other'), event_message(5, [2]),
+                image_message(6)]
+    latest = latest_messages(messages)
+    assert [message.timestamp()[1] for message in latest] == [4, 5, 6]
+
+
+def test_image_view():
+    area_detector = pytest.importorskip(
+        'nicos_ess.devices.epics.area_detector')
+    message = image_message(5).value()
+    image = area_detector.get_ADAr_image(message)
+    assert image.shape == (4, 3)
+    assert (image == 5).all()
+    assert np.shares_memory(image, np.frombuffer(message, dtype=np.uint8))
+    assert not image.flags.writeable
+
+
+def test_image_skipping(monkeypatch):
+    area_detector = pytest.importorskip(
+        'nicos_ess.devices.epics.area_detector')
+    monkeypatch.setattr(area_detector.time, 'sleep', lambda secs: None)
+
+    class Consumer:
+        def __init__(self, batches):
+            self.batches = batches
+            self.calls = []
+
+        def seek_to_end(self):
+            self.calls.append('seek')
+
+        def consume(self, max_messages, timeout_ms):
+            self.calls.append('consume')
+            return self.batches.pop(0)
+
+    class Detector:
+        _get_new_messages = area_detector.AreaDetector._get_new_messages
+        batchsize = 100
+        latestonly = True
+        _stoprequest = False
+
+        def __init__(self, batches):
+            self._consumer = Consumer(batches)
+            self.log = mock.Mock()
+            self.shown = []
+
+        def new_messages_callback(self, messages):
+            self.shown.extend(timestamp for (timestamp, _) in messages)
+            self._stoprequest = not self._consumer.batches
+
+    detector = Detector([[image_message(1), image_message(2)], [],
+                         [image_message(3)]])
+    detector._get_new_messages()
+    # only the latest image is shown, and the images that arrived while it
+    # was processed are skipped
+    assert detector.shown == [2, 3]
+    assert detector._consumer.calls == ['seek', 'consume', 'seek', 'consume',
+                                        'consume', 'seek']
+
+
+class TestBatchMode:
+
+    @pytest.fixture(autouse=True)
+    def prepare(self, session, kafka_setup):
+        kafka_setup('ess_event_histogram')
+        self.channel = session.getDevice('hist')
+        self.channel._setROParam('hist_type', '1-D TOF')
+        self.channel._setROParam('tof_range', (0, 1000))
+        self.channel._setROParam('det_range', (0, 100))
+        yield
+        self.channel.finish()
+
+    def replay(self, messages):
+        channel = self.channel
+        channel._consumer = RecordedConsumer(messages)
+        channel.prepare()
+        channel.start()
+        for _ in range(100):
+            if not channel._consumer._messages:
+                break
+            time.sleep(0.05)
+        channel.finish()
+        channel._updater_thread.join()
+        return channel._consumer.batches
+
+    def test_batches(self, recording):
+        self.channel._setROParam('batchsize', 100)
+        batches = self.replay(load_messages(recording))
+        assert batches == [100, 100, 50]
+        assert self.channel.read(0) == [1000]
+
+    def test_latest_only(self, recording):
+        self.channel._setROParam('batchsize', 100)
+        self.channel._setROParam('latestonly', True)
+        self.replay(load_messages(recording))
+        # one message of each batch is left
+        assert self.channel.read(0) == [12]
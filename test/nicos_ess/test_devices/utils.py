@@ -21,6 +21,9 @@
 #
 # *****************************************************************************
 
+import struct
+import time
+from collections import deque
 from unittest.mock import patch
 
 
@@ -42,3 +45,99 @@ def return_value_wrapper(value):
     def return_value(*args, **kwargs):
         return value
     return return_value
+
+
+# timestamp in ms, lengths of topic, key (0xffff for no key) and value
+RECORD_HEADER = struct.Struct('<qHHI')
+
+
+class RecordedMessage:
+    """A Kafka message with the interface of confluent_kafka's Message."""
+
+    def __init__(self, topic, key, timestamp, value):
+        self._topic = topic
+        self._key = key
+        self._timestamp = timestamp
+        self._value = value
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return 0
+
+    def key(self):
+        return self._key
+
+    def timestamp(self):
+        # the timestamp type is the message creation time
+        return 1, self._timestamp
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return None
+
+
+def record_messages(filename, messages):
+    """Write RecordedMessages to a file."""
+    with open(filename, 'wb') as fp:
+        for message in messages:
+            topic = message.topic().encode()
+            key = message.key()
+            fp.write(RECORD_HEADER.pack(
+                message.timestamp()[1], len(topic),
+                0xffff if key is None else len(key), len(message.value())))
+            fp.write(topic + (key or b'') + message.value())
+
+
+def load_messages(filename):
+    """Read the RecordedMessages written by record_messages."""
+    messages = []
+    with open(filename, 'rb') as fp:
+        while header := fp.read(RECORD_HEADER.size):
+            timestamp, topiclen, keylen, valuelen = \
+                RECORD_HEADER.unpack(header)
+            topic = fp.read(topiclen).decode()
+            key = None if keylen == 0xffff else fp.read(keylen)
+            messages.append(RecordedMessage(topic, key, timestamp,
+                                            fp.read(valuelen)))
+    return messages
+
+
+class RecordedConsumer:
+    """Replays recorded messages in place of a KafkaConsumer.
+
+    The number of messages returned by each poll/consume call is recorded
+    in `batches`.
+    """
+
+    def __init__(self, messages):
+        self._messages = deque(messages)
+        self.batches = []
+
+    def subscribe(self, topic_name, partitions=None):
+        pass
+
+    def unsubscribe(self):
+        pass
+
+    def seek_to_end(self, timeout_s=5):
+        pass
+
+    def close(self):
+        pass
+
+    def poll(self, timeout_ms=5):
+        messages = self.consume(1, timeout_ms)
+        return messages[0] if messages else None
+
+    def consume(self, max_messages, timeout_ms=5):
+        if not self._messages:
+            time.sleep(timeout_ms / 1000)
+            return []
+        messages = [self._messages.popleft()
+                    for _ in range(min(max_messages, len(self._messages)))]
+        self.batches.append(len(messages))
+        return messages
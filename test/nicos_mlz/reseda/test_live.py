@@ -0,0 +1,97 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Tests for the data cache of the RESEDA live data panel."""
+
+import logging
+
+import numpy as np
+import pytest
+
+pytest.importorskip('nicos.clients.gui.panels.live')
+
+from nicos.clients.gui.panels.live import cachedDataSize, readDataFromFile
+from nicos.devices.datasinks.raw import RawImageFileReader
+from nicos.utils import LRUCache
+
+from nicos_mlz.reseda.gui.live import CascadeLiveDataPanel
+
+HEADER = "\n### NICOS Device snapshot V2.0\n" \
+    "ArrayDesc('data', (3, 4), dtype('uint32'), [])\n"
+
+
+class CachePanel:
+    """Stands in for the panel without widgets, to test its data cache."""
+
+    setData = CascadeLiveDataPanel.setData
+    setDataFromFile = CascadeLiveDataPanel.setDataFromFile
+
+    def __init__(self):
+        self.log = logging.getLogger('livepanel')
+        self._datacache = LRUCache(maxlen=2, maxbytes=100,
+                                   sizeof=cachedDataSize)
+
+
+@pytest.fixture
+def panel():
+    return CachePanel()
+
+
+def test_read_running_file(tmp_path):
+    arr = np.arange(12, dtype='<u4').reshape(3, 4)
+    filename = tmp_path / 'image.raw'
+    filename.write_bytes(arr.tobytes() + HEADER.encode())
+    assert RawImageFileReader.fromfile(str(filename)).shape == (3, 4)
+
+    # files of a running measurement are rewritten in place, so the data is
+    # copied unless requested otherwise
+    data = readDataFromFile(str(filename), 'singleraw')
+    assert not isinstance(data, np.memmap)
+    mapped = readDataFromFile(str(filename), 'singleraw', mapped=True)
+    assert isinstance(mapped, np.memmap)
+    filename.write_bytes((arr * 2).tobytes() + HEADER.encode())
+    assert (data == arr).all()
+
+
+def test_cache(panel, tmp_path):
+    arr = np.zeros(5, dtype='<u4')
+    panel.setData([arr], uid='a', display=False)
+    panel.setData([arr], uid='b', display=False)
+    # new data for an entry marks it as used
+    panel.setData([arr + 1], uid='a', display=False)
+    panel.setData([arr], uid='c', display=False)
+    assert list(panel._datacache) == ['a', 'c']
+    assert (panel._datacache['a']['dataarrays'][0] == 1).all()
+
+    # the memory limit applies to data updated in place as well
+    panel.setData([np.zeros(21, dtype='<u4')], uid='c', display=False)
+    assert list(panel._datacache) == ['c']
+
+    # data read from files is cached the same way
+    filename = tmp_path / 'image.raw'
+    filename.write_bytes(np.arange(12, dtype='<u4').tobytes() +
+                         HEADER.encode())
+    assert panel.setDataFromFile(str(filename), 'singleraw', uid='d',
+                                 display=False) == (3, 4)
+    assert list(panel._datacache) == ['d']
+    assert not isinstance(panel._datacache['d']['dataarrays'][0], np.memmap)
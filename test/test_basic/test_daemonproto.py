@@ -0,0 +1,104 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Tests for the daemon protocol serializers."""
+
+import numpy as np
+import pytest
+
+from nicos.protocols.daemon import ClientTransport
+from nicos.protocols.daemon.classic import SERIALIZERS
+from nicos.utils import readonlydict, readonlylist
+
+BANNER = dict(
+    daemon_version='3.0.0',
+    custom_version='1.0',
+    nicos_root='/opt/nicos',
+    custom_path='/opt/nicos/nicos_demo',
+    pw_hashing='rsa,plain',
+    rsakey=b'0123456789',
+    protocol_version=23,
+)
+
+
+@pytest.fixture(params=sorted(SERIALIZERS))
+def serializer(request):
+    return SERIALIZERS[request.param]()
+
+
+def test_determine_serializer(serializer):
+    data = serializer.serialize_ok_reply(dict(BANNER,
+                                              serializer=serializer.name))
+    found = ClientTransport().determine_serializer(data, True)
+    assert found.name == serializer.name
+    assert found.deserialize_reply(data, True) == \
+        (True, dict(BANNER, serializer=serializer.name))
+
+
+def test_roundtrip_events(serializer):
+    # typical payloads of status, message and cache events (using lists
+    # instead of tuples, since JSON cannot distinguish them)
+    status = [[0, 12], [{'reqid': 'abc', 'script': 'scan(x, 0, 1, 10)',
+                         'user': 'guest'}]]
+    message = ['nicos', 1700000000.123, 20, 'moving x to 1.0', '', 'abc']
+    cache = [1700000000.5, 'x/value', '=', '1.0']
+    for payload in (status, message, cache):
+        evt = serializer.serialize_event('status', payload)
+        assert serializer.deserialize_event(evt, 'status') == \
+            ('status', payload)
+
+
+def test_binary_types():
+    if 'binary' not in SERIALIZERS:
+        pytest.skip('msgpack not available')
+    serializer = SERIALIZERS['binary']()
+    arr = np.arange(24, dtype='<u2').reshape(2, 3, 4)
+    payload = {
+        'tuple': (1, (2.5, 'x'), None),
+        (1, 2): 'tuple key',
+        'set': {1, 2},
+        'frozenset': frozenset('ab'),
+        'rolist': readonlylist([1, 2]),
+        'rodict': readonlydict({'a': [1]}),
+        'array': arr,
+        'scalar': np.float32(1.5),
+        'bytes': b'\x00\xff',
+        'exc': ValueError('fallback'),
+    }
+    result = serializer.deserialize_cmd(
+        serializer.serialize_cmd('queue', payload), 'queue')[1]
+    assert result['tuple'] == (1, (2.5, 'x'), None)
+    assert result[(1, 2)] == 'tuple key'
+    assert result['set'] == {1, 2}
+    assert isinstance(result['frozenset'], frozenset)
+    assert isinstance(result['rolist'], readonlylist)
+    assert isinstance(result['rodict'], readonlydict)
+    assert result['array'].dtype == arr.dtype
+    assert (result['array'] == arr).all()
+    assert result['array'].flags.writeable
+    assert result['scalar'] == 1.5
+    assert result['bytes'] == b'\x00\xff'
+    assert isinstance(result['exc'], ValueError)
+    # integers beyond 64 bits cannot be represented natively
+    assert serializer.deserialize_reply(
+        serializer.serialize_ok_reply([2**70, 1]), True) == (True, [2**70, 1])
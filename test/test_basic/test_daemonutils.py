@@ -0,0 +1,179 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Tests for the daemon event queue and message log."""
+
+import queue
+from unittest import mock
+
+from nicos.services.daemon.handler import ConnectionHandler
+from nicos.services.daemon.utils import COALESCE_POLICIES, MessageLog, \
+    SizedQueue
+from nicos.utils.loggers import ACTION, INFO
+
+from test.utils import raises
+
+
+def test_event_coalescing():
+    def put(event, data):
+        key = COALESCE_POLICIES[event](data)
+        q.put((event, repr(data).encode(), [],
+               None if key is None else (event, key)))
+
+    q = SizedQueue(10000)
+    for i in range(3):
+        put('cache', (i, 'x/value', '=', str(i)))
+        put('message', ['nicos', i, ACTION, 'counting', '', None])
+        put('message', ['nicos', i, INFO, 'line %d' % i, '', None])
+    put('cache', (3, 'y/value', '=', '1'))
+    events = []
+    while True:
+        try:
+            events.append(q.get(False))
+        except queue.Empty:
+            break
+    # all normal messages, but only the latest action and cache values
+    assert [(e[0], e[1]) for e in events] == [
+        ('message', repr(['nicos', 0, INFO, 'line 0', '', None]).encode()),
+        ('message', repr(['nicos', 1, INFO, 'line 1', '', None]).encode()),
+        ('cache', repr((2, 'x/value', '=', '2')).encode()),
+        ('message', repr(['nicos', 2, ACTION, 'counting', '', None]).encode()),
+        ('message', repr(['nicos', 2, INFO, 'line 2', '', None]).encode()),
+        ('cache', repr((3, 'y/value', '=', '1')).encode()),
+    ]
+    assert q.coalesced == {'cache': 2, 'message': 2}
+    assert q.qsize() == 0
+
+
+def test_event_coalescing_memory():
+    q = SizedQueue(1000)
+    data = b'x' * 500
+    for _ in range(100000):
+        q.put(('cache', data, [], ('cache', 'x/value')), False)
+    # superseded items are removed from the queue right away
+    assert len(q.queue) == 1
+    assert q.qsize() == 501
+    assert q.coalesced == {'cache': 99999}
+    q.put(('message', data, [], None), False)
+    assert len(q.queue) == 2
+    assert raises(queue.Full, q.put, ('message', data, [], None), False)
+    assert q.get(False)[0] == 'cache'
+    assert q.get(False)[0] == 'message'
+    assert q.qsize() == 0
+
+
+def test_event_sender_statistics():
+    class Handler(ConnectionHandler):
+        max_batch = 1
+
+        def send_events(self, events):
+            if events[0][0] == 'message':
+                raise ValueError('cannot send')
+
+    handler = Handler(mock.Mock())
+    for event in ('cache', 'message', 'cache', 'status'):
+        handler.event_queue.put((event, b'', [], None))
+    handler.close()
+    handler.event_sender()
+    # events that failed to send are not counted
+    assert handler.event_stats() == {'cache': (2, 0, 0), 'status': (1, 0, 0)}
+
+
+def test_message_log(tmpdir):
+    def msg(i):
+        # the message log appends the sequence number
+        return ['nicos', float(i), INFO, 'line %d\n' % i, '',
+                'req%d' % (i // 10), i + 1]
+
+    log = MessageLog(20, str(tmpdir), segsize=10, maxsegments=3)
+    for i in range(100):
+        log.append(msg(i)[:6])
+    # 80-99 are in memory, 50-79 in three segments on disk
+    assert len(tmpdir.listdir()) == 3
+    assert len(log) == 50
+    assert log.query(5) == [msg(i) for i in range(95, 100)]
+    assert log.query(0) == []
+    # without filters, only the messages in memory
+    assert log.query() == [msg(i) for i in range(80, 100)]
+    assert log.query(30) == [msg(i) for i in range(80, 100)]
+    # paging back through the history
+    page = log.query(25, totime=95)
+    assert page == [msg(i) for i in range(70, 95)]
+    page = log.query(25, totime=page[0][1])
+    assert page == [msg(i) for i in range(50, 70)]
+    page = log.query(25, totime=[95, 96])
+    assert page == [msg(i) for i in range(70, 95)]
+    # messages from the spilled segments only
+    assert log.query(None, fromtime=53, totime=58) == \
+        [msg(i) for i in range(53, 58)]
+    assert log.query(reqid='req5') == [msg(i) for i in range(50, 60)]
+    # removed messages
+    assert log.query(reqid='req1') == []
+
+    # the segments on disk are kept across restarts
+    log = MessageLog(20, str(tmpdir), segsize=10, maxsegments=2)
+    assert len(tmpdir.listdir()) == 2
+    assert len(log) == 20
+    assert log.query() == []
+    assert log.query(30, totime=100) == [msg(i) for i in range(60, 80)]
+    for i in range(100, 130):
+        log.append(msg(i)[:6])
+    assert len(tmpdir.listdir()) == 2
+    # 60-69 have been removed to make room for 100-109
+    result = log.query(None, fromtime=50, totime=115)
+    assert [m[:6] for m in result] == \
+        [msg(i)[:6] for i in list(range(70, 80)) + list(range(100, 115))]
+    # numbering continues after the last message on disk
+    assert result[10][6] == 81
+
+    log.clear()
+    assert len(log) == 0
+    assert tmpdir.listdir() == []
+    assert log.query() == []
+
+
+def test_message_log_paging(tmpdir):
+    log = MessageLog(20, str(tmpdir), segsize=10, maxsegments=5)
+    # many messages with the same time
+    for i in range(50):
+        log.append(['nicos', float(i // 20), INFO, 'line %d\n' % i, '', ''])
+    assert [msg[6] for msg in log.query(15, totime=2)] == \
+        list(range(26, 41))
+    # paging by time and sequence number returns every message once
+    seqs = []
+    page = log.query(15)
+    while page:
+        seqs[:0] = [msg[6] for msg in page]
+        page = log.query(15, totime=[page[0][1], page[0][6]])
+    assert seqs == list(range(1, 51))
+
+    # messages in memory are kept on disk at shutdown
+    log.flush()
+    assert log.query() == []
+    log = MessageLog(20, str(tmpdir), segsize=10, maxsegments=5)
+    assert len(log) == 50
+    assert [msg[6] for msg in log.query(None, totime=[10, 0])] == \
+        list(range(1, 51))
+    # numbering continues after a restart
+    log.append(['nicos', 3.0, INFO, 'line\n', '', ''])
+    assert log.query(1)[0][6] == 51
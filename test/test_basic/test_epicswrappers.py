@@ -0,0 +1,198 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Tests for the EPICS wrappers of the PVA device classes."""
+
+import time
+
+import pytest
+
+from nicos.core import status
+from nicos.devices.epics.pva import monitorcache
+from nicos.devices.epics.pva.monitorcache import MetadataCache, MonitorCache
+
+
+def test_monitor_cache(monkeypatch):
+    now = [100.]
+    monkeypatch.setattr(monitorcache, 'monotonic', lambda: now[0])
+    cache = MonitorCache(maxage=10)
+    # not subscribed: results of gets are not kept
+    assert cache.get('PV') is None
+    assert not cache.refresh('PV', 1, now[0])
+    assert cache.get('PV') is None
+
+    cache.update('PV', 2)
+    assert cache.get('PV') == 2
+    assert cache.get('PV', count=False) == 2
+    assert (cache.hits, cache.gets) == (1, 2)
+    # a get that started before the last update doesn't replace it
+    assert not cache.refresh('PV', 1, now[0] - 1)
+    assert cache.get('PV') == 2
+
+    # too old, until refreshed by a get
+    now[0] += 11
+    assert cache.get('PV') is None
+    assert cache.refresh('PV', 3, now[0])
+    assert cache.get('PV') == 3
+
+    # writing to the PV requires the next read to get it
+    cache.invalidate('PV')
+    assert cache.get('PV') is None
+    assert cache.refresh('PV', 4, now[0])
+    assert cache.get('PV') == 4
+
+    cache.disconnected('PV')
+    assert cache.get('PV') is None
+    assert not cache.refresh('PV', 5, now[0])
+    assert (cache.hits, cache.gets) == (4, 5)
+
+
+def test_metadata_cache(monkeypatch):
+    now = [100.]
+    monkeypatch.setattr(monitorcache, 'monotonic', lambda: now[0])
+    cache = MetadataCache(maxage=60)
+    assert cache.get('PV') is None
+    cache.put('PV', 1)
+    now[0] += 60
+    assert cache.get('PV') == 1
+    # too old: units, limits etc. are fetched again
+    now[0] += 1
+    assert cache.get('PV') is None
+    cache.put('PV', 2)
+    assert cache.get('PV') == 2
+    cache.discard('PV')
+    assert cache.get('PV') is None
+
+
+@pytest.fixture
+def p4pserver(monkeypatch):
+    """Serve some PVs and let the p4p wrapper use them."""
+    pytest.importorskip('p4p')
+    from p4p.client.thread import Context
+    from p4p.nt import NTEnum, NTScalar
+    from p4p.server import Server
+    from p4p.server.thread import SharedPV
+
+    from nicos.devices.epics.pva import p4p
+
+    pvs = {
+        'TEST:value': SharedPV(nt=NTScalar('d', display=True), initial={
+            'value': 1.5, 'display.units': 'mm', 'display.limitLow': -5.,
+            'display.limitHigh': 5.}),
+        'TEST:choice': SharedPV(nt=NTEnum(), initial={
+            'index': 1, 'choices': ['in', 'out']}),
+    }
+    with Server(providers=[pvs], isolate=True) as server:
+        context = Context('pva', conf=server.conf(), useenv=False, nt=False)
+        monkeypatch.setattr(p4p, '_CONTEXT', context)
+        monkeypatch.setattr(p4p, '_METADATA', p4p.MetadataCache())
+        try:
+            yield p4p, pvs
+        finally:
+            context.close()
+
+
+def test_p4p_connect_pvs(p4pserver, monkeypatch):
+    p4p, _ = p4pserver
+    assert p4p.P4pWrapper.connect_pvs(
+        ['TEST:value', 'TEST:choice', 'TEST:missing'], 1.0) == \
+        ['TEST:missing']
+
+    # the devices use the metadata fetched by connect_pvs
+    gets = []
+    context_get = p4p._CONTEXT.get
+    monkeypatch.setattr(p4p._CONTEXT, 'get',
+                        lambda name, **kwds: gets.append(name) or
+                        context_get(name, **kwds))
+    wrapper = p4p.P4pWrapper(timeout=1.0)
+    wrapper.connect_pv('TEST:value')
+    wrapper.connect_pv('TEST:choice')
+    assert wrapper.get_pv_type('TEST:value') is float
+    assert wrapper.get_units('TEST:value') == 'mm'
+    assert wrapper.get_limits('TEST:value') == (-5, 5)
+    assert wrapper.get_pv_type('TEST:choice') is int
+    assert list(wrapper.get_value_choices('TEST:choice')) == ['in', 'out']
+    assert gets == []
+    # values are always fetched (without monitor)
+    assert wrapper.get_pv_value('TEST:choice', as_string=True) == 'out'
+    assert gets == ['TEST:choice']
+    # after the device is initialized, so is the metadata
+    wrapper.initializing = False
+    assert wrapper.get_limits('TEST:value') == (-5, 5)
+    assert gets == ['TEST:choice', 'TEST:value']
+
+
+def test_p4p_monitor_reads(p4pserver):
+    p4p, pvs = p4pserver
+    wrapper = p4p.P4pWrapper(timeout=3.0, monitormaxage=None)
+    updates = []
+    sub = wrapper.subscribe('TEST:value', 'readpv',
+                            lambda *args: updates.append(args[2]),
+                            lambda *args: None)
+    try:
+        deadline = time.monotonic() + 5
+        while not updates and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert wrapper.get_pv_value('TEST:value') == 1.5
+        assert wrapper.get_alarm_status('TEST:value')[0] == status.OK
+        assert wrapper.monitor_hit_ratio() == 1
+
+        pvs['TEST:value'].post(2.5)
+        while updates[-1] != 2.5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert wrapper.get_pv_value('TEST:value', as_string=True) == '2.5'
+        assert wrapper.monitor_hit_ratio() == 1
+    finally:
+        wrapper.close_subscription(sub)
+
+
+def test_p4p_monitor_metadata(p4pserver, monkeypatch):
+    p4p, pvs = p4pserver
+    wrapper = p4p.P4pWrapper(timeout=3.0, monitormaxage=None)
+    wrapper.initializing = False
+    updates = []
+    sub = wrapper.subscribe('TEST:value', 'readpv',
+                            lambda *args: updates.append(args[2]),
+                            lambda *args: None)
+    try:
+        deadline = time.monotonic() + 5
+        while not updates and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert wrapper.get_limits('TEST:value') == (-5, 5)
+        # with a connected monitor, the metadata is kept ...
+        gets = []
+        context_get = p4p._CONTEXT.get
+        monkeypatch.setattr(p4p._CONTEXT, 'get',
+                            lambda name, **kwds: gets.append(name) or
+                            context_get(name, **kwds))
+        assert wrapper.get_units('TEST:value') == 'mm'
+        assert gets == []
+
+        # ... until it changes
+        pvs['TEST:value'].post({'value': 2.5, 'display.limitHigh': 10.})
+        while updates[-1] != 2.5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert wrapper.get_limits('TEST:value') == (-5, 10)
+        assert gets == ['TEST:value']
+    finally:
+        wrapper.close_subscription(sub)
@@ -0,0 +1,191 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+
+"""Tests for the in-place image writing and mapped reading helpers."""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from nicos import session
+from nicos.core import FINAL, INTERMEDIATE
+from nicos.devices.datasinks.image import MappedArray, \
+    MultipleFileSinkHandler, SingleFileSinkHandler, array_fingerprint
+from nicos.devices.datasinks.raw import RawImageFileReader, RawImageSinkHandler
+
+
+class RecordingHandler(SingleFileSinkHandler):
+    """Records the written images instead of formatting them."""
+
+    filetype = 'test'
+
+    def __init__(self, files):
+        # no sink and detector needed
+        self._written = {}
+        self._file = files[0]
+        self._files = files
+        self.dataset = SimpleNamespace(uid='uid', metainfo={})
+        self.detector = SimpleNamespace(name='det')
+        self.writes = []
+        self.fail = False
+
+    def writeData(self, fp, image):
+        if self.fail:
+            raise OSError('disk full')
+        self.writes.append((self._files.index(fp), image.copy()))
+
+
+class MultipleRecordingHandler(RecordingHandler, MultipleFileSinkHandler):
+
+    def _createFile(self, **kwargs):
+        pass
+
+
+def open_files(tmp_path, n):
+    files = []
+    for i in range(n):
+        filename = str(tmp_path / ('image%d' % i))
+        fp = open(filename, 'wb')  # pylint: disable=consider-using-with
+        fp.filepath = filename
+        files.append(fp)
+    return files
+
+
+@pytest.fixture
+def notified(monkeypatch):
+    files = []
+    monkeypatch.setattr(session, 'notifyDataFile',
+                        lambda ftype, uid, det, filenames: files.append(
+                            filenames), raising=False)
+    return files
+
+
+def test_fingerprint():
+    arr = np.arange(12, dtype='<u4').reshape(3, 4)
+    fp = array_fingerprint(arr)
+    assert array_fingerprint(arr.copy()) == fp
+    assert array_fingerprint(arr.reshape(4, 3)) != fp
+    assert array_fingerprint(arr.astype('<i4')) != fp
+    arr[1, 1] += 1
+    assert array_fingerprint(arr) != fp
+    # non-contiguous arrays are supported
+    assert array_fingerprint(arr.T) == array_fingerprint(arr.T.copy())
+
+
+def test_mapped_array(tmp_path):
+    filename = tmp_path / 'image.raw'
+    filename.write_bytes(b'HEADER')
+    arr = np.arange(12, dtype='<u2').reshape(3, 4)
+    mapped = MappedArray(str(filename), arr.shape, arr.dtype, offset=6)
+    assert mapped.fits(arr)
+    assert not mapped.fits(arr.astype('<u4'))
+    # the file is enlarged, but the header kept
+    assert filename.stat().st_size == 6 + 24
+    mapped.write(arr)
+    mapped.write(arr * 2)
+    mapped.close()
+    content = filename.read_bytes()
+    assert content[:6] == b'HEADER'
+    assert (np.frombuffer(content[6:], '<u2').reshape(3, 4) == arr * 2).all()
+
+    # empty arrays do not need a file
+    mapped = MappedArray(str(filename), (0,), 'f8')
+    mapped.write(np.zeros(0))
+    mapped.close()
+
+
+def test_raw_reader(tmp_path):
+    arr = np.arange(12, dtype='<u4').reshape(3, 4)
+    header = "\n### NICOS Device snapshot V2.0\n" \
+        "ArrayDesc('data', (3, 4), dtype('uint32'), [])\n"
+    filename = tmp_path / 'single.raw'
+    filename.write_bytes(arr.tobytes() + header.encode())
+    data = RawImageFileReader.fromfile(str(filename))
+    # the data is mapped, not read
+    assert isinstance(data, np.memmap)
+    assert (data == arr).all()
+
+    filename = tmp_path / 'image.raw'
+    filename.write_bytes(arr.tobytes())
+    (tmp_path / 'image.header').write_text(header)
+    data = RawImageFileReader.fromfile(str(filename))
+    assert isinstance(data, np.memmap)
+    assert (data == arr).all()
+
+
+def test_skip_unchanged(tmp_path, notified):
+    handler = RecordingHandler(open_files(tmp_path, 1))
+    arr = np.arange(12).reshape(3, 4)
+    # a failed write is not remembered
+    handler.fail = True
+    with pytest.raises(OSError):
+        handler.putResults(INTERMEDIATE, {'det': ([], [arr])})
+    handler.fail = False
+    handler.putResults(INTERMEDIATE, {'det': ([], [arr])})
+    assert len(handler.writes) == 1
+    handler.putResults(INTERMEDIATE, {'det': ([], [arr.copy()])})
+    assert len(handler.writes) == 1
+    # the final result is always written
+    handler.putResults(FINAL, {'det': ([], [arr])})
+    assert len(handler.writes) == 2
+    assert len(notified) == 2
+    handler.end()
+
+
+def test_skip_unchanged_files(tmp_path, notified):
+    handler = MultipleRecordingHandler(open_files(tmp_path, 2))
+    arr1 = np.arange(12).reshape(3, 4)
+    arr2 = np.zeros(5)
+    handler.putResults(INTERMEDIATE, {'det': ([], [arr1, arr2])})
+    assert [i for (i, _) in handler.writes] == [0, 1]
+    # only the file of the changed array is written
+    arr2 = arr2 + 1
+    handler.putResults(INTERMEDIATE, {'det': ([], [arr1, arr2])})
+    assert [i for (i, _) in handler.writes] == [0, 1, 1]
+    assert (handler.writes[-1][1] == arr2).all()
+    handler.putResults(INTERMEDIATE, {'det': ([], [arr1, arr2])})
+    assert len(handler.writes) == 3
+    for fp in handler._files:
+        fp.close()
+
+
+def test_raw_data_resize(tmp_path):
+    handler = RawImageSinkHandler.__new__(RawImageSinkHandler)
+    handler._mapped = None
+    filename = tmp_path / 'image.raw'
+    with open(filename, 'w+b') as fp:
+        fp.filepath = str(filename)
+        arr = np.arange(12, dtype='<u4')
+        handler._writeData(fp, arr)
+        assert filename.stat().st_size == arr.nbytes
+        # the file is shrunk and enlarged in place
+        handler._writeData(fp, arr[:6].astype('<u2'))
+        assert filename.stat().st_size == 12
+        handler._mapped.close()
+        assert filename.read_bytes() == arr[:6].astype('<u2').tobytes()
+        handler._mapped = None
+        handler._writeData(fp, arr * 2)
+        handler._mapped.close()
+        assert filename.read_bytes() == (arr * 2).tobytes()
@@ -0,0 +1,71 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Tests for the import time of the NICOS core modules."""
+
+import os
+import subprocess
+import sys
+
+from test.utils import module_root
+
+# generous bound, typical import times are below 0.1 s
+MAX_IMPORT_TIME = 1.0
+
+SCRIPT = '''
+import sys, time
+started = time.perf_counter()
+import nicos.core
+print(time.perf_counter() - started)
+print(' '.join(mod for mod in ('numpy', 'scipy') if mod in sys.modules))
+'''
+
+
+def run_python(script, **env):
+    return subprocess.run([sys.executable, '-c', script], cwd=module_root,
+                          env=dict(os.environ, **env), check=True,
+                          capture_output=True, text=True).stdout
+
+
+def test_core_import_time():
+    # the first import may have to compile the modules
+    run_python(SCRIPT)
+    importtime, heavy = run_python(SCRIPT).splitlines()
+    assert float(importtime) < MAX_IMPORT_TIME
+    # these are imported only when needed
+    assert not heavy
+
+
+def test_startup_profile(tmp_path):
+    report = tmp_path / 'profile.txt'
+    run_python('import nicos.core', NICOS_STARTUP_PROFILE=str(report))
+    content = report.read_text(encoding='utf-8')
+    assert 'Module imports by own time' in content
+    assert 'nicos.core.params' in content
+
+
+def test_numpy_printoptions():
+    # the print options are set when numpy is imported after nicos
+    sign = run_python('import nicos, numpy\n'
+                      'print(repr(numpy.get_printoptions()["sign"]))')
+    assert sign.strip() == "' '"
@@ -0,0 +1,156 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Tests for the poller timing state and scheduler."""
+
+import logging
+import threading
+import time
+
+from nicos.core import status
+from nicos.services.poller import POLL_BUSY_INTERVAL, PollState
+from nicos.services.poller.scheduler import PollScheduler, ScheduledJob
+
+log = logging.getLogger('test_pollscheduler')
+
+
+class DummyDevice:
+    pollinterval = 5
+    maxage = 6
+
+    def __init__(self):
+        self.polls = 0
+        self.status = (status.OK, '')
+
+    def poll(self, n, maxage):
+        self.polls += 1
+        return self.status, 0
+
+    def __str__(self):
+        return 'dummy'
+
+
+def test_pollstate_events():
+    dev = DummyDevice()
+    state = PollState(dev, log)
+    assert state.deadline() < time.time()  # never polled
+    state.poll()
+    assert dev.polls == 1
+    assert state.deadline() == state.lastpoll + 5
+    assert not state.may_poll(state.lastpoll)
+
+    # our device going busy shortens the interval without polling
+    assert not state.handle_event('dev_busy')
+    assert state.deadline() == state.lastpoll + POLL_BUSY_INTERVAL
+    # as long as it is busy, the interval is kept
+    dev.status = (status.BUSY, '')
+    state.poll()
+    assert state.interval == POLL_BUSY_INTERVAL
+    dev.status = (status.OK, '')
+    state.poll()
+    assert state.interval == 5
+
+    # attached devices trigger a poll
+    assert state.handle_event('adev_busy')
+    assert state.interval == POLL_BUSY_INTERVAL
+    assert state.handle_event('adev_normal')
+    assert not state.handle_event('adev_target')
+    dev.pollinterval = 2
+    assert not state.handle_event('param')
+    assert state.interval == 2
+
+
+def test_pollstate_backoff():
+    dev = DummyDevice()
+    dev.parameters = {'precision': None}
+    dev.precision = 0.1
+    values = iter([0, 0.05, 0.1, 0.12, 0.3, 0.3, 0.3, 0.3, 0.3, 0.3])
+    dev.poll = lambda n, maxage: ((status.OK, ''), next(values))
+    state = PollState(dev, log, maxbackoff=3)
+    intervals = []
+    for _ in range(10):
+        state.poll()
+        intervals.append(state.interval)
+    # changes below the precision are considered stable, but not a slow
+    # drift beyond it; the interval is limited by maxbackoff
+    assert intervals == [5, 7.5, 11.25, 5, 5, 7.5, 11.25, 15, 15, 15]
+    assert state.stats[0] == 10
+    # a change of an attached device resets the interval
+    assert state.handle_event('adev_value')
+    assert state.interval == 5
+    # no backoff by default
+    values = iter([1] * 5)
+    state = PollState(dev, log)
+    for _ in range(5):
+        state.poll()
+        assert state.interval == 5
+
+
+def test_scheduler():
+    sched = PollScheduler(log, 2)
+    sched.start()
+    lock = threading.Lock()
+    running = []
+    concurrent = [0]
+    runs = {}
+    events = []
+
+    def target(job):
+        with lock:
+            running.append(job)
+            concurrent[0] = max(concurrent[0], len(running))
+        events.extend(job.events)
+        job.events.clear()
+        time.sleep(0.01)
+        with lock:
+            running.remove(job)
+            runs[job.name] = runs.get(job.name, 0) + 1
+        # run each job twice, then only on events
+        return time.time() + 0.02 if runs[job.name] < 2 else None
+
+    jobs = [ScheduledJob('job%d' % i, target, 'backend%d' % (i % 2))
+            for i in range(10)]
+    try:
+        for job in jobs:
+            sched.add(job)
+        deadline = time.time() + 5
+        while sum(runs.values()) < 20 and time.time() < deadline:
+            time.sleep(0.01)
+        assert runs == {job.name: 2 for job in jobs}
+        # at most two workers per backend
+        assert 2 <= concurrent[0] <= 4
+
+        sched.post(jobs[0], 'event')
+        while runs['job0'] < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        assert events == ['event']
+
+        stats = sched.stats()
+        assert sorted(stats) == ['backend0', 'backend1']
+        assert stats['backend0'][0] == 2
+        assert stats['backend0'][2].count == 11
+        assert stats['backend1'][2].count == 10
+        assert stats['backend0'][2].maximum >= stats['backend0'][2].mean
+    finally:
+        sched.stop()
+        sched.join()
@@ -0,0 +1,76 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Tests for the cache of setup file information."""
+
+import logging
+import os
+
+from nicos.core.sessions.setups import readSetups
+
+log = logging.getLogger('test_setupcache')
+
+
+def write(filename, content, mtime_ns=None):
+    with open(filename, 'w', encoding='utf-8') as fp:
+        fp.write(content)
+    if mtime_ns is not None:
+        os.utime(filename, ns=(mtime_ns, mtime_ns))
+
+
+def test_setup_cache(tmp_path):
+    setups = tmp_path / 'setups'
+    setups.mkdir()
+    cachefile = str(tmp_path / 'cache' / 'setups.pickle')
+    write(setups / 'cfg.py', 'value = 1\n')
+    write(setups / 'dep.py', "description = 'dep'\n"
+          "devices = dict(d = device('cls', value=configdata('cfg.value')))\n")
+    write(setups / 'plain.py', "description = 'plain'\n")
+    info = readSetups([str(setups)], log, cachefile)
+    assert info['dep']['devices']['d'][1] == {'value': 1}
+    assert os.path.isfile(cachefile)
+    assert readSetups([str(setups)], log, cachefile) == info
+
+    # unchanged stamps: the cached info is used without reading the file
+    mtime = os.stat(setups / 'plain.py').st_mtime_ns
+    write(setups / 'plain.py', "description = 'PLAIN'\n", mtime)
+    assert readSetups([str(setups)], log, cachefile)['plain'] == \
+        info['plain']
+    # changed contents are detected
+    write(setups / 'plain.py', "description = 'changed'\n", mtime)
+    assert readSetups([str(setups)], log,
+                      cachefile)['plain']['description'] == 'changed'
+
+    # only touched: still cached, but the new stamp is remembered
+    write(setups / 'cfg.py', 'value = 1\n', mtime + 10**9)
+    assert readSetups([str(setups)], log, cachefile) == dict(
+        info, plain=dict(info['plain'], description='changed'))
+
+    # setups depending on a changed file via configdata() are read again
+    write(setups / 'cfg.py', 'value = 2\n', mtime + 2 * 10**9)
+    info = readSetups([str(setups)], log, cachefile)
+    assert info['dep']['devices']['d'][1] == {'value': 2}
+
+    # without cache file, nothing is cached
+    write(setups / 'plain.py', "description = 'PLAIN!!'\n", mtime)
+    assert readSetups([str(setups)], log)['plain']['description'] == 'PLAIN!!'
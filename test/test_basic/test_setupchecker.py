@@ -0,0 +1,184 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Tests for the result cache and the report of the setup checker."""
+
+import json
+import os
+import subprocess
+import sys
+from os import path
+
+import pytest
+
+# the setup checker also checks GUI configurations
+pytest.importorskip('nicos.guisupport.qt')
+
+from nicostools import setupchecker
+from nicostools.setupchecker import SetupValidator
+
+from test.utils import module_root
+
+SETUPS = {
+    'base': """\
+description = 'base'
+group = 'lowlevel'
+
+devices = dict(
+    m = device('nicos.devices.generic.VirtualMotor',
+        description = 'motor',
+        unit = 'mm',
+        abslimits = (0, 10),
+    ),
+)
+""",
+    'top': """\
+description = 'top'
+includes = ['base']
+
+devices = dict(
+    bad = device('nicos.devices.generic.VirtualMotor',
+        unit = 'mm',
+    ),
+)
+""",
+    'other': """\
+description = 'other'
+""",
+}
+
+
+@pytest.fixture
+def setupdir(tmp_path):
+    setups = tmp_path / 'setups'
+    setups.mkdir()
+    for (name, content) in SETUPS.items():
+        (setups / ('%s.py' % name)).write_text(content, encoding='utf-8')
+    return setups
+
+
+def check(setupdir, cachefile):
+    validator = SetupValidator(1, str(cachefile))
+    validator.walk([str(setupdir)])
+    return validator, {setupchecker.setupname(filename): result['cached']
+                       for (filename, result) in validator.results.items()}
+
+
+def test_result_cache(setupdir, tmp_path, monkeypatch):
+    cachefile = tmp_path / 'cache' / 'results.json'
+    validator, cached = check(setupdir, cachefile)
+    assert cached == {'base': False, 'top': False, 'other': False}
+    assert path.isfile(cachefile)
+
+    # all results are reused, including their messages
+    validator2, cached = check(setupdir, cachefile)
+    assert cached == {'base': True, 'top': True, 'other': True}
+    for (filename, result) in validator.results.items():
+        result2 = validator2.results[filename]
+        assert result2['good'] == result['good']
+        assert result2['messages'] == result['messages']
+
+    # a changed setup invalidates the results of the setups including it
+    (setupdir / 'base.py').write_text(
+        SETUPS['base'].replace("'motor'", "'changed'"), encoding='utf-8')
+    _, cached = check(setupdir, cachefile)
+    assert cached == {'base': False, 'top': False, 'other': True}
+
+    # a new checker version invalidates all results
+    monkeypatch.setattr(setupchecker, 'CHECKER_VERSION',
+                        setupchecker.CHECKER_VERSION + 1)
+    _, cached = check(setupdir, cachefile)
+    assert cached == {'base': False, 'top': False, 'other': False}
+
+    # an unreadable cache file is ignored
+    cachefile.write_text('garbage', encoding='utf-8')
+    _, cached = check(setupdir, cachefile)
+    assert cached == {'base': False, 'top': False, 'other': False}
+
+
+def test_result_cache_modules(tmp_path):
+    cache = setupchecker.ResultCache(str(tmp_path / 'results.json'))
+    modfile = tmp_path / 'devclass.py'
+    modfile.write_text('x = 1\n', encoding='utf-8')
+    st = os.stat(modfile)
+    result = {'good': True, 'messages': [],
+              'modules': {str(modfile): [st.st_mtime_ns, st.st_size]}}
+    cache.store('setup.py', 'key', result)
+    assert cache.lookup('setup.py', 'key') == result
+    assert cache.lookup('setup.py', 'otherkey') is None
+    assert cache.lookup('unknown.py', 'key') is None
+    # a changed device class module invalidates the result
+    modfile.write_text('x = 12\n', encoding='utf-8')
+    assert cache.lookup('setup.py', 'key') is None
+    modfile.unlink()
+    assert cache.lookup('setup.py', 'key') is None
+
+
+def test_report(setupdir, tmp_path):
+    reportfile = tmp_path / 'report.json'
+    validator, _ = check(setupdir, tmp_path / 'results.json')
+    validator.write_report(str(reportfile))
+    report = json.loads(reportfile.read_text(encoding='utf-8'))
+    assert report['good'] is False
+    assert report['duration'] >= 0
+    assert report['summary'] == {'files': 3, 'cached': 0, 'errors': 1,
+                                 'warnings': 1}
+    files = {setupchecker.setupname(filename): entry
+             for (filename, entry) in report['files'].items()}
+    assert files['base'] == {'good': True, 'cached': False, 'messages': []}
+    assert files['other'] == files['base']
+    assert files['top']['good'] is False
+    assert files['top']['messages'] == [
+        {'level': 'WARNING', 'line': 5,
+         'message': 'bad: device has no description'},
+        {'level': 'ERROR', 'line': 5,
+         'message': "bad: mandatory parameter 'abslimits' missing"},
+    ]
+
+
+def test_check_setups_options(setupdir, tmp_path):
+    cachefile = tmp_path / 'results.json'
+    reportfile = tmp_path / 'report.json'
+
+    def run():
+        proc = subprocess.run(
+            [sys.executable, path.join(module_root, 'tools', 'check-setups'),
+             '-j', '2', '-c', str(cachefile), '-r', str(reportfile),
+             str(setupdir)],
+            capture_output=True, text=True, check=False, timeout=120)
+        report = json.loads(reportfile.read_text(encoding='utf-8'))
+        return proc, report
+
+    proc, report = run()
+    assert "mandatory parameter 'abslimits' missing" in proc.stdout
+    assert report['summary']['files'] == 3
+    assert report['summary']['cached'] == 0
+    assert report['summary']['errors'] == 1
+
+    # the second run uses the cached results and reports the same messages
+    proc2, report2 = run()
+    assert "mandatory parameter 'abslimits' missing" in proc2.stdout
+    assert report2['summary']['cached'] == 3
+    assert report2['files'].keys() == report['files'].keys()
+    for (filename, entry) in report['files'].items():
+        assert report2['files'][filename]['messages'] == entry['messages']
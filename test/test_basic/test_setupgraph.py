@@ -0,0 +1,78 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Tests for the setup dependency graph."""
+
+from nicos.core.sessions.setups import SetupGraph
+
+
+def info(includes=(), excludes=(), devices=()):
+    return {'includes': list(includes), 'excludes': list(excludes),
+            'devices': dict.fromkeys(devices)}
+
+
+GRAPH = SetupGraph({
+    'base': info(devices=['motor']),
+    'det': info(['base'], devices=['det', 'timer']),
+    'inst': info(['det', 'sample'], devices=['motor']),
+    'sample': info(['base', 'nope']),
+    'cycle1': info(['cycle2']),
+    'cycle2': info(['cycle1', 'base']),
+    'cryo': info(excludes=['oven'], devices=['T']),
+    'oven': info(devices=['T']),
+    'broken': None,
+})
+
+
+def test_includes():
+    assert GRAPH.includes('base') == set()
+    assert GRAPH.includes('inst') == {'det', 'sample', 'base', 'nope'}
+    assert GRAPH.includes('cycle1') == {'cycle2', 'base'}
+    assert GRAPH.includes('cycle2') == {'cycle1', 'base'}
+    assert GRAPH.includes('broken') == set()
+    assert GRAPH.closure(['det', 'cryo']) == {'det', 'base', 'cryo'}
+    assert 'broken' in GRAPH
+    assert 'nope' not in GRAPH
+
+
+def test_missing():
+    assert GRAPH.missing(['det']) == set()
+    assert GRAPH.missing(['inst']) == {'nope'}
+    assert GRAPH.includeChain('inst', 'nope') == ['inst', 'sample', 'nope']
+    assert GRAPH.includeChain('inst', 'base') == ['inst', 'det', 'base']
+    assert GRAPH.includeChain('det', 'sample') is None
+
+
+def test_conflicts():
+    assert GRAPH.excludes('cryo') == {'oven'}
+    assert GRAPH.excludedBy('oven') == {'cryo'}
+    assert GRAPH.exclusive('oven', 'cryo')
+    assert not GRAPH.exclusive('oven', 'det')
+    assert GRAPH.conflicts(['cryo', 'det']) == set()
+    assert GRAPH.conflicts(['cryo', 'oven', 'det']) == {('oven', 'cryo')}
+
+
+def test_devices():
+    assert sorted(GRAPH.deviceSetups('motor')) == ['base', 'inst']
+    assert GRAPH.deviceSetups('T') == ['cryo', 'oven']
+    assert GRAPH.deviceSetups('unknown') == []
@@ -35,13 +35,14 @@ import pytest
 
 from nicos.core.errors import NicosError
 from nicos.core.sessions.utils import SimClock
-from nicos.utils import KEYEXPR_NS, TB_CAUSE_MSG, Repeater, allDays, \
-    bitDescription, checkSetupSpec, chunks, closeSocket, comparestrings, \
-    expandTemplate, formatDuration, formatExtendedFrame, formatExtendedStack, \
-    formatExtendedTraceback, lazy_property, moveOutOfWay, num_sort, \
-    parseConnectionString, parseDuration, parseKeyExpression, \
-    readFileCounter, readonlydict, readonlylist, safeName, safeWriteFile, \
-    squeeze, tcpSocket, timedRetryOnExcept, tupelize, updateFileCounter
+from nicos.utils import KEYEXPR_NS, TB_CAUSE_MSG, LRUCache, Repeater, \
+    allDays, bitDescription, checkSetupSpec, chunks, closeSocket, \
+    comparestrings, expandTemplate, formatDuration, formatExtendedFrame, \
+    formatExtendedStack, formatExtendedTraceback, lazy_property, \
+    moveOutOfWay, num_sort, parseConnectionString, parseDuration, \
+    parseKeyExpression, readFileCounter, readonlydict, readonlylist, \
+    safeName, safeWriteFile, squeeze, tcpSocket, timedRetryOnExcept, \
+    tupelize, updateFileCounter
 from nicos.utils.timer import Timer
 
 from test.utils import raises
@@ -94,6 +95,26 @@ def test_readonlylist_hashable():
     assert dt[readonlylist([1, 2, 3])] == 'testval'
 
 
+def test_lru_cache():
+    cache = LRUCache(maxlen=3, maxbytes=100, sizeof=len)
+    cache['a'] = 'a' * 50
+    cache['b'] = 'b' * 40
+    cache.touch('a')
+    # b is the least recently used item
+    cache['c'] = 'c' * 30
+    assert list(cache) == ['a', 'c']
+    # values modified in place are only accounted for on shrink()
+    cache['d'] = ''
+    cache['d'] += 'd' * 10
+    cache.shrink()
+    assert list(cache) == ['a', 'c', 'd']
+    cache['e'] = 'e'
+    assert list(cache) == ['c', 'd', 'e']
+    # the most recent item is kept, even if too large
+    cache['f'] = 'f' * 200
+    assert list(cache) == ['f']
+
+
 def test_repeater():
     r = Repeater(1)
     it = iter(r)
@@ -23,6 +23,9 @@
 
 """NICOS tests for the watchdog condition primitives."""
 
+from nicos import session
+from nicos.protocols.cache import OP_ASK, OP_WILDCARD
+from nicos.services.watchdog import Watchdog
 from nicos.services.watchdog.conditions import DelayedTrigger, Expression, \
     ConditionWithPrecondition
 
@@ -68,6 +71,35 @@ def test_expression():
     assert expr.log.warnings
 
 
+def test_expression_skip_unchanged():
+    expr = Expression(DummyLog(), 'A > limit', '')
+    assert expr.interesting_keys() == set(['a', 'limit'])
+    expr.update(0, {'a': 5, 'limit': 3, 'other': 1})
+    assert expr.triggered
+    # inputs did not change: no evaluation
+    expr.update(1, {'a': 5, 'limit': 3, 'other': 2})
+    assert expr.eval_stats()[:2] == (1, 1)
+    expr.update(2, {'a': 2, 'limit': 3})
+    assert not expr.triggered
+    # enabling and setups cause an evaluation even with the same inputs
+    expr.enabled = False
+    expr.update(3, {'a': 5, 'limit': 3})
+    assert not expr.triggered
+    expr.enabled = True
+    expr.update(4, {'a': 5, 'limit': 3})
+    assert expr.triggered
+    expr.new_setups([])
+    expr.update(5, {'a': 5, 'limit': 3})
+    count, skipped, evaltime = expr.eval_stats()
+    assert (count, skipped) == (5, 1)
+    assert evaltime > 0
+
+    delayed = DelayedTrigger(DummyLog(), expr, 5)
+    assert delayed.eval_stats() == expr.eval_stats()
+    combined = ConditionWithPrecondition(DummyLog(), expr, delayed, 0)
+    assert combined.eval_stats()[:2] == (10, 2)
+
+
 def test_expired():
     expr = Expression(DummyLog(), 'a and b', '')
 
@@ -181,3 +213,37 @@ def test_pre_with_cooldown():
     combined.update(126, {'pre': 0, 'cond': 1})
     assert not combined.pre.triggered
     assert not combined.triggered
+
+
+def test_cache_keys(monkeypatch):
+    monkeypatch.setattr(session, '_setup_info', {
+        'ccr': {'devices': {'T_ccr': None, 'T': None, 'ccr_valve': None}},
+        'broken': None,
+    }, raising=False)
+    watchdog = Watchdog.__new__(Watchdog)
+    watchdog._prefix = 'nicos/'
+    watchdog._devnames = None
+    watchdog._constants = {'warn', 'abs'}
+    watchdog._wildcard_keys = set()
+    log = DummyLog()
+    object.__setattr__(watchdog, 'log', log)
+    keys = watchdog._cache_keys([
+        't_value', 't_ccr_value', 't_ccr_user_limits', 'ccr_valve_status',
+        'other_dev_target', 'session_mastersetup', 'limit', 'warn', 'abs',
+    ])
+    assert keys == [
+        'nicos/ccr_valve/status',
+        'nicos/limit',
+        'nicos/other',
+        'nicos/session',
+        'nicos/t/value',
+        'nicos/t_ccr/user_limits',
+        'nicos/t_ccr/value',
+    ]
+    # unknown devices are requested with a wildcard, and reported once
+    assert watchdog._wildcard_keys == {'nicos/other', 'nicos/session'}
+    assert len(log.warnings) == 2
+    assert watchdog._request_op('nicos/other') == OP_WILDCARD
+    assert watchdog._request_op('nicos/t/value') == OP_ASK
+    watchdog._cache_keys(['other_dev_target'])
+    assert len(log.warnings) == 2
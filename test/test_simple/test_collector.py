@@ -0,0 +1,75 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Tests for the cache collector and its forwarders."""
+
+import time
+
+session_setup = 'collector'
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def test_cache_forwarder(session):
+    coll = session.getDevice('Collector')
+    fwd = session.getDevice('Forwarder')
+    coll.start()
+    assert coll._startup_done.wait(5)
+    assert wait_for(lambda: fwd._connected)
+
+    # quick updates are coalesced, only the latest value is forwarded
+    for i in range(20):
+        session.cache.put('colltest', 'value', i)
+    session.cache.put('other', 'value', 1)
+    assert wait_for(lambda: session.cache.get('fwd', 'colltest/value') == 19)
+    assert session.cache.get('fwd', 'other/value') is None
+
+    stats = fwd._forwardStats()
+    assert stats['queued'] == 0
+    assert stats['dropped'] == 0
+    assert stats['coalesced'] > 0
+    assert stats['sent'] + stats['coalesced'] == 20
+
+    # the statistics are published in the source cache
+    assert wait_for(lambda: session.cache.get_raw('collector/forwarder/sent')
+                    == stats['sent'])
+
+
+def test_pending_limit(session):
+    fwd = session.getDevice('Forwarder')
+    fwd._setROParam('maxpending', 3)
+    try:
+        with fwd._pendcond:
+            for i in range(5):
+                fwd._putChange(time.time(), '', 'colltest/key%d' % i, '=',
+                               '1')
+            assert list(fwd._pending) == ['colltest/key%d' % i
+                                          for i in range(2, 5)]
+            assert fwd._dropped == 2
+    finally:
+        fwd._setROParam('maxpending', 10000)
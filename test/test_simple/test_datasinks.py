@@ -34,6 +34,7 @@ import shutil
 from nicos import config
 from nicos.commands.scan import scan
 from nicos.core import ScanDataset
+from nicos.devices.datasinks.raw import RawImageFileReader
 from nicos.devices.datasinks.scan import AsciiScanfileReader
 from nicos.utils import readFile, updateFileCounter
 
@@ -208,6 +209,11 @@ class TestSinks:
         rawfile = path.join(session.experiment.datapath, 'single', '43_172.raw')
         assert path.isfile(rawfile)
         assert path.getsize(rawfile) > 128 * 128 * 4  # data plus header
+        # the data, written through a memory map, is followed by the header
+        assert RawImageFileReader.fromfile(rawfile).shape == (128, 128)
+        with open(rawfile, 'rb') as fp:
+            fp.seek(128 * 128 * 4)
+            assert fp.read(26) == b'\n### NICOS Device snapshot'
 
         if hasattr(os, 'link'):
             # this entry in filenametemplate is absolute, which means relative to
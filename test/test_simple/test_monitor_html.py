@@ -48,3 +48,27 @@ def test_monitor(session):
 
     assert 'Current status' in mon._rendered_content
     assert '<img src="/some/pic.png"' in mon._rendered_content
+
+    # only displayed keys are requested from the cache
+    keys = mon._subscription_keys()
+    assert 'nicos/exp/proposal' in keys
+    assert 'nicos/t_mtt/value' in keys
+    assert 'nicos/session/mastersetup' in keys
+    assert 'nicos/' not in keys
+
+    # rendering is incremental, and unchanged pages are not rewritten
+    mon._startup_done.wait(5)
+    assert mon._render()
+    assert not mon._render()
+    field = mon._keymap['nicos/exp/proposal'][0]
+    gen = mon.getDelta(0)['gen']
+    mon.signalKeyChange(field, field.key, 'p1234', 0, False)
+    delta = mon.getDelta(gen)
+    assert delta['labels'][field._valuelabel.id] == \
+        ['p1234', 'white', 'black']
+    assert not delta['reload']
+    assert mon._render()
+    assert 'p1234' in mon._content_html
+    # only the time changed
+    mon.updateTitle('new time')
+    assert not mon._render()
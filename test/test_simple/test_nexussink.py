@@ -37,6 +37,8 @@ from nicos import config
 from nicos.commands.device import maw
 from nicos.commands.measure import count
 from nicos.commands.scan import scan
+from nicos.core import ConfigurationError
+from nicos.nexus import elements
 from nicos.nexus.elements import ConstDataset, DetectorDataset, \
     DeviceAttribute, DeviceDataset, ImageDataset, NXAttribute, NXLink, \
     NXScanLink, NXTime
@@ -267,3 +269,101 @@ class TestNexusSink:
             assert p.match(ts)  # check format
             assert datetime.datetime.strptime(
                 ts, '%Y-%m-%d %H:%M:%S').timetuple()  # check value
+
+    def test_swmr(self, session):
+        template = {
+            'entry:NXentry': {
+                'time': DetectorDataset('timer', 'float32'),
+                'sry': DeviceDataset('sry'),
+                'srlink': NXLink('/entry/sry'),
+            },
+            'data:NXdata': {'None': NXScanLink(), }
+        }
+
+        setTemplate(template)
+        self.setScanCounter(session, 52)
+        session.experiment.setDetectors(['det', ])
+        sink = session.getDevice('nexussink')
+        sink._setROParam('swmr', True)
+        try:
+            scan(session.getDevice('sry'), 0, 1, 150, t=0.001)
+        finally:
+            sink._setROParam('swmr', False)
+
+        fin = h5py.File(path.join(session.experiment.datapath,
+                                  'test%sn000053.hdf' % year), 'r',
+                        libver='latest', swmr=True)
+        # datasets are grown in steps, but trimmed at the end
+        ds = fin['entry/sry']
+        assert ds.maxshape == (None,)
+        assert list(ds) == list(range(150))
+        assert len(fin['entry/time']) == 150
+        assert len(fin['entry/srlink']) == 150
+        assert fin['data/sry'].attrs['target'] == b'/entry/sry'
+        fin.close()
+
+    def test_asyncwrite(self, session):
+        template = {
+            'entry:NXentry': {
+                'mon': DetectorDataset('mon1', 'uint32'),
+                'counts': ImageDataset(0, 0, compression='lzf'),
+                'shuffled': ImageDataset(0, 0, compression='bitshuffle'),
+                'sry': DeviceDataset('sry'),
+            },
+            'data:NXdata': {'None': NXScanLink(), }
+        }
+        with pytest.raises(ConfigurationError):
+            ImageDataset(0, 0, compression='zip')
+
+        setTemplate(template)
+        self.setScanCounter(session, 53)
+        session.experiment.setDetectors(['det', ])
+        sink = session.getDevice('nexussink')
+        sink._setROParam('asyncwrite', True)
+        try:
+            scan(session.getDevice('sry'), 0, 1, 5, t=0.001)
+        finally:
+            sink._setROParam('asyncwrite', False)
+
+        fin = h5py.File(path.join(session.experiment.datapath,
+                                  'test%sn000054.hdf' % year), 'r')
+        assert list(fin['entry/sry']) == [0, 1, 2, 3, 4]
+        assert list(fin['data/sry']) == [0, 1, 2, 3, 4]
+        assert len(fin['entry/mon']) == 5
+        ds = fin['entry/counts']
+        assert ds.compression == 'lzf'
+        assert ds.chunks == (1,) + ds.shape[1:]
+        assert len(ds) == 5
+        assert (fin['entry/shuffled'][...] == ds[...]).all()
+        if elements.hdf5plugin is None:
+            assert fin['entry/shuffled'].compression == 'gzip'
+        fin.close()
+
+    def test_growstep(self, session):
+        lengths = []
+
+        class RecordingDataset(DeviceDataset):
+            def update(self, name, h5parent, sinkhandler, values):
+                DeviceDataset.update(self, name, h5parent, sinkhandler,
+                                     values)
+                lengths.append(len(h5parent[name]))
+
+        template = {
+            'entry:NXentry': {
+                'sry': RecordingDataset('sry'),
+            },
+        }
+
+        setTemplate(template)
+        self.setScanCounter(session, 54)
+        session.experiment.setDetectors(['det', ])
+        scan(session.getDevice('sry'), 0, 1, 5, t=0.001)
+
+        # without SWMR, the file is valid after every update, so that
+        # datasets are not enlarged in advance
+        assert lengths
+        assert max(lengths) == 5
+        fin = h5py.File(path.join(session.experiment.datapath,
+                                  'test%sn000055.hdf' % year), 'r')
+        assert list(fin['entry/sry']) == [0, 1, 2, 3, 4]
+        fin.close()
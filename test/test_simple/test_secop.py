@@ -23,16 +23,23 @@
 
 """SECoP client test suite."""
 
+import threading
+import time
+
 import pytest
 
 session_setup = 'secop'
 
 pytest.importorskip('frappy')
 
+from frappy.client import CacheItem
 from frappy.datatypes import get_datatype
 
+from nicos.core import Device, status
 from nicos.core.params import anytype, dictwith, floatrange, intrange, \
     listof, nonemptystring, oneofdict, string, tupleof
+from nicos.devices.secop.devices import SecNodeDevice, SecopDevice, \
+    SecopMoveable, SecopReadable
 from nicos.devices.secop.validators import get_validator
 from nicos.protocols.cache import cache_dump
 
@@ -220,3 +227,140 @@ class TestPickleNotNeeded:
     def test_datatype_needs_pickle(self):
         # test above test: this was one of the bad contents of setup_info
         assert 'cache_unpickle("' in cache_dump(desc('double'))
+
+
+class FakeClient:
+    """Stands in for the SECoP client of a SEC node with one sensor."""
+
+    nodename = 'fakenode'
+    online = True
+    modules = {
+        'sensor': {
+            'properties': {'interface_classes': ['Readable'],
+                           'description': 'a sensor'},
+            'parameters': {
+                'value': desc('double', unit='K'),
+                'status': desc('tuple', members=[
+                    {'type': 'enum', 'members': {'IDLE': 100}},
+                    {'type': 'string'}]),
+            },
+            'commands': {},
+        },
+    }
+
+    def __init__(self):
+        self.callbacks = {}
+        self.reads = []
+        self.cache = {
+            ('sensor', 'value'): CacheItem(1.5, time.time()),
+            ('sensor', 'status'): CacheItem((100, ''), time.time()),
+        }
+
+    def register_callback(self, key, *args, updateItem=None):
+        if updateItem is not None:
+            self.callbacks.setdefault(key, []).append(updateItem)
+
+    def unregister_callback(self, key, *args, updateItem=None):
+        self.callbacks[key].remove(updateItem)
+
+    def update(self, module, parameter, value):
+        """Simulate an update received from the SEC node."""
+        item = self.cache[module, parameter] = CacheItem(value, time.time())
+        for callback in self.callbacks.get((module, parameter), []):
+            callback(module, parameter, item)
+
+    def getParameter(self, module, parameter, trycache=False):
+        self.reads.append((module, parameter))
+        return self.cache[module, parameter]
+
+    def disconnect(self):
+        pass
+
+
+class UpdatedDevice:
+    """Records the updates handed to a device by the SEC node device."""
+
+    name = 'updated'
+    secop_module = 'sensor'
+
+    def __init__(self):
+        self.updates = []
+        self.threads = set()
+        self.release = threading.Event()
+        self.done = threading.Event()
+
+    def _update(self, module, parameter, item):
+        self.release.wait(5)
+        self.threads.add(threading.current_thread())
+        self.updates.append((parameter, item.value))
+        if item.value == 'last':
+            self.done.set()
+
+
+@pytest.fixture
+def secnode(session):
+    secnode = session.getDevice('secnode')
+    client = secnode._secnode = FakeClient()
+    yield secnode, client
+    secnode.removeDevices()
+    secnode._secnode = None
+    secnode._setROParam('auto_create', False)
+    secnode._setROParam('async_only', False)
+
+
+def test_needs_polling():
+    assert Device.needs_polling
+    for cls in (SecNodeDevice, SecopDevice, SecopReadable, SecopMoveable):
+        assert not cls.needs_polling
+
+
+def test_update_thread(secnode):
+    secnode, client = secnode
+    device = UpdatedDevice()
+    device.release.set()
+    secnode.registerDevice(device)
+    try:
+        # the current values are handed over directly
+        assert device.updates == [('value', 1.5), ('status', (100, ''))]
+        device.updates.clear()
+        device.threads.clear()
+        device.release.clear()
+        # the client is not held up while the devices handle updates
+        for i in range(5):
+            client.update('sensor', 'value', i)
+        client.update('sensor', 'status', 'last')
+        assert device.updates == []
+        device.release.set()
+        assert device.done.wait(5)
+        # all updates are kept, in the order they were received
+        assert device.updates == [('value', 0), ('value', 1), ('value', 2),
+                                  ('value', 3), ('value', 4),
+                                  ('status', 'last')]
+        assert device.threads == {secnode._update_thread}
+    finally:
+        secnode.unregisterDevice(device)
+    assert client.callbacks == {('sensor', 'value'): [],
+                                ('sensor', 'status'): []}
+
+
+def test_async_only(session, secnode):
+    secnode, client = secnode
+    assert not secnode.async_only
+    secnode._setROParam('auto_create', True)
+    secnode.createDevices()
+    sensor = session.getDevice('fakenode_sensor')
+    assert isinstance(sensor, SecopReadable)
+    assert sensor.read(0) == 1.5
+    assert sensor.status(0) == (status.OK, '')
+    assert client.reads == [('sensor', 'value'), ('sensor', 'status')]
+
+    # updates from the node are used instead of reading
+    secnode._setROParam('async_only', True)
+    client.reads.clear()
+    client.update('sensor', 'value', 2.5)
+    assert sensor.read(0) == 2.5
+    assert sensor.status(0) == (status.OK, '')
+    assert client.reads == []
+    # ... unless explicitly reading from the hardware
+    assert sensor.hwread() == 2.5
+    assert client.reads == [('sensor', 'value')]
@@ -23,9 +23,11 @@
 
 """NICOS axis test suite."""
 
+import threading
 from os import path
 
-from nicos.core import ConfigurationError
+from nicos import config, session as nicos_session
+from nicos.core import Attach, ConfigurationError, Device, NicosError, Param
 from nicos.core.sessions.setups import readSetups
 
 from test.utils import ErrorLogged, module_root, raises
@@ -33,6 +35,39 @@ from test.utils import ErrorLogged, module_root, raises
 session_setup = 'empty'
 
 
+class SlowDevice(Device):
+    attached_devices = {
+        'attached': Attach('Devices to create first', Device, multiple=True,
+                           optional=True),
+    }
+
+    parameters = {
+        'fail': Param('Whether to fail initialization', type=bool),
+    }
+
+    # names of the devices that were initialized before each device
+    created = {}
+    preconnected = []
+    # the independent devices can only pass this if created concurrently
+    barrier = None
+
+    @classmethod
+    def preconnectDevices(cls, devices):
+        cls.preconnected.append(len(devices))
+
+    def doInit(self, mode):
+        before = {name for (name, done) in list(self.created.items())
+                  if done is not None}
+        self.created[self._name] = None
+        # while initialized, the device is already found by its own thread
+        assert nicos_session.getDevice(self._name) is self
+        if self._name in ('slow1', 'slow2', 'slow3'):
+            self.barrier.wait()
+        if self.fail:
+            raise NicosError(self, 'initialization failed')
+        self.created[self._name] = before
+
+
 def test_raisers(session):
     assert raises(ConfigurationError,
                   getattr, session.experiment, 'envlist')
@@ -59,7 +94,94 @@ def test_sysconfig(session):
     assert 'datasinks' not in session.current_sysconfig
 
 
+def test_setup_compatibility(session):
+    graph = session.getSetupGraph()
+    assert graph is session.getSetupGraph()
+    assert graph.includes('sysconfig2') == {'sysconfig3'}
+    session.checkSetupCompatibility(['sysconfig2'], set())
+    assert raises(ConfigurationError, session.checkSetupCompatibility,
+                  ['idontexist'], set())
+    # the graph is recomputed for new setup info
+    session._setup_info = dict(session._setup_info)
+    assert session.getSetupGraph() is not graph
+
+
 def test_device_names(session):
     assert raises(ErrorLogged, readSetups,
                   [path.join(module_root, 'test', 'faulty_setups')],
                   session.log)
+
+
+def test_parallel_creation(session, log, monkeypatch):
+    monkeypatch.setattr(config, 'device_create_threads', 4)
+    created = SlowDevice.created
+    created.clear()
+    SlowDevice.preconnected.clear()
+    SlowDevice.barrier = threading.Barrier(3, timeout=10)
+    imported = []
+    nicos_import = session._nicos_import
+    monkeypatch.setattr(session, '_nicos_import',
+                        lambda modname, member='*': imported.append(member)
+                        or nicos_import(modname, member))
+    with log.assert_errors('failed to create'):
+        session.loadSetup('parallel', autocreate_devices=True)
+    try:
+        # all devices are preconnected together
+        assert SlowDevice.preconnected == [8]
+        # the classes resolved for that are reused to create the devices
+        assert imported.count('SlowDevice') == 8
+        assert not session._device_classes
+        assert sorted(name for name in created if created[name] is not None) \
+            == ['combined', 'slow1', 'slow2', 'slow3', 'slow4', 'toplevel']
+        # attached devices are completely initialized first
+        assert {'slow1', 'slow2'} <= created['combined']
+        assert {'combined', 'slow3'} <= created['toplevel']
+        # independent devices are created concurrently (else the barrier
+        # would have been broken)
+        assert not SlowDevice.barrier.broken
+        # failures are reported as usual, also for dependent devices
+        assert 'initialization failed' in session.device_failures['failing']
+        assert 'dependent' in session.device_failures
+        assert 'dependent' not in session.devices
+        assert session.namespace['toplevel'] is session.devices['toplevel']
+    finally:
+        session.unloadSetup()
+
+
+def test_serial_creation(session, log, monkeypatch):
+    monkeypatch.setattr(config, 'device_create_threads', 0)
+    created = SlowDevice.created
+    created.clear()
+    SlowDevice.barrier = threading.Barrier(1)
+    with log.assert_errors('failed to create'):
+        session.loadSetup('parallel', autocreate_devices=True)
+    try:
+        assert session._creating is None
+        assert sorted(name for name in created if created[name] is not None) \
+            == ['combined', 'slow1', 'slow2', 'slow3', 'slow4', 'toplevel']
+        assert {'combined', 'slow1', 'slow2', 'slow3'} <= created['toplevel']
+    finally:
+        session.unloadSetup()
+
+
+def test_wait_created(session, monkeypatch):
+    # a device being created by another thread
+    event = threading.Event()
+    monkeypatch.setattr(session, '_creating', {'other': (None, event)})
+    assert raises(NicosError, session._waitCreated, 'other', 0.01)
+
+    # other threads get a device being created only when it is initialized
+    dev = SlowDevice('waited')
+    session._creating['waited'] = (None, event)
+    found = []
+    thread = threading.Thread(
+        target=lambda: found.append(session.getDevice('waited')))
+    thread.start()
+    try:
+        thread.join(0.1)
+        assert found == []
+        event.set()
+        thread.join(5)
+        assert found == [dev]
+    finally:
+        dev.shutdown()
@@ -0,0 +1,217 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Tests for the poll reads and request limits of Tango devices."""
+
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('tango')
+
+import tango
+
+from nicos.core import status
+from nicos.devices import tango as nicostango
+from nicos.devices.entangle import AnalogInput
+
+# polling with prefetched attributes needs a cache
+session_setup = 'cachetests'
+
+ADDRESS = 'tango://tangohost:10000/test/ai/1'
+
+
+def attribute(name, value, failed=False):
+    return SimpleNamespace(name=name, value=value, has_failed=failed)
+
+
+class FakeProxy:
+    """Records the requests done through a DeviceProxy."""
+
+    def __init__(self, address):
+        self.address = address
+        self.timeout = 3000
+        self.requests = []
+        self.values = {'State': tango.DevState.ON, 'Status': 'all fine',
+                       'value': 1.5}
+        self.failed = set()
+        self.errors = 0
+        self.probe = lambda: None
+
+    def set_timeout_millis(self, timeout):
+        self.timeout = timeout
+
+    def get_timeout_millis(self):
+        return self.timeout
+
+    def _attributes(self, names):
+        return [attribute(name, self.values[name], name in self.failed)
+                for name in names]
+
+    def command_inout(self, name, *args):
+        self.requests.append(('cmd', name))
+        return self.values[name]
+
+    def read_attribute(self, name):
+        self.requests.append(('read', name))
+        self.probe()
+        if self.errors:
+            self.errors -= 1
+            raise tango.CommunicationFailed()
+        return attribute(name, self.values[name])
+
+    def write_attribute(self, name, value):
+        self.requests.append(('write', name))
+        self.values[name] = value
+
+    def read_attributes(self, names):
+        self.requests.append(('read', tuple(names)))
+        return self._attributes(names)
+
+    def attribute_query(self, name):
+        return SimpleNamespace(unit='mm')
+
+    def State(self):
+        return self.command_inout('State')
+
+    def Status(self):
+        return self.command_inout('Status')
+
+    @property
+    def value(self):
+        return self.read_attribute('value').value
+
+
+@pytest.fixture
+def proxy(monkeypatch):
+    proxies = []
+
+    def create(address):
+        proxies.append(FakeProxy(address))
+        return proxies[-1]
+
+    monkeypatch.setattr(nicostango.tango, 'DeviceProxy', create)
+    monkeypatch.setattr(nicostango, 'check_tango_host_connection',
+                        lambda address, timeout: None)
+    monkeypatch.setattr(nicostango.PyTangoDevice, 'proxy_cache', {})
+    monkeypatch.setattr(nicostango, '_host_limiters', {})
+    return proxies
+
+
+@pytest.fixture
+def create_input(session, proxy):
+    devices = []
+
+    def create(**config):
+        dev = AnalogInput('tango_input', tangodevice=ADDRESS, unit='mm',
+                          **config)
+        devices.append(dev)
+        dev._dev.requests.clear()
+        return dev
+
+    yield create
+    for dev in devices:
+        dev.shutdown()
+
+
+def test_host_limiter(monkeypatch):
+    monkeypatch.setattr(nicostango, '_host_limiters', {})
+    monkeypatch.setenv('TANGO_HOST', 'dbhost:10000')
+    assert isinstance(nicostango.host_limiter(ADDRESS, 0), nullcontext)
+    limiter = nicostango.host_limiter(ADDRESS, 2)
+    # devices of the same host and limit share the limiter
+    assert nicostango.host_limiter('tango://tangohost:10000/test/ai/2',
+                                   2) is limiter
+    assert nicostango.host_limiter(ADDRESS, 3) is not limiter
+    assert nicostango.host_limiter('tango://other:10000/test/ai/1',
+                                   2) is not limiter
+    # without host in the address, the TANGO_HOST is used
+    assert nicostango.host_limiter('test/ai/1', 2) is \
+        nicostango.host_limiter('tango://dbhost:10000/test/ai/2', 2)
+    with limiter:
+        with limiter:
+            assert not limiter.acquire(blocking=False)
+
+
+def test_attribute_prefetch(session):
+    names = ['State', 'Status', 'value']
+    proxy = FakeProxy(ADDRESS)
+    proxy.failed.add('Status')
+    prefetch = nicostango.AttributePrefetch(proxy, names, nullcontext(),
+                                            session.log)
+    assert proxy.requests == [('read', tuple(names))]
+    assert prefetch.get('VALUE').value == 1.5
+    assert prefetch.get('state').value == tango.DevState.ON
+    # failed attributes are left to be read normally
+    assert prefetch.get('Status') is None
+    assert len(proxy.requests) == 1
+
+    # a failed request leaves all attributes to be read normally
+    proxy = FakeProxy(ADDRESS)
+    proxy.read_attributes = None
+    prefetch = nicostango.AttributePrefetch(proxy, names, nullcontext(),
+                                            session.log)
+    assert prefetch.get('value') is None
+
+
+@pytest.mark.parametrize('pollreads, requests', [
+    ('single', [('cmd', 'State'), ('cmd', 'Status'), ('read', 'value')]),
+    ('batched', [('read', ('State', 'Status', 'value'))]),
+])
+def test_pollreads(create_input, pollreads, requests):
+    dev = create_input(pollreads=pollreads)
+    assert dev.poll() == ((status.OK, 'all fine'), 1.5)
+    assert dev._dev.requests == requests
+    # outside of polling, the device is accessed as usual
+    dev._dev.requests.clear()
+    assert dev.read(0) == 1.5
+    assert dev._dev.requests == [('read', 'value')]
+
+
+def test_pollreads_failed_attribute(create_input):
+    dev = create_input(pollreads='batched')
+    dev._dev.failed.add('value')
+    assert dev.poll() == ((status.OK, 'all fine'), 1.5)
+    assert dev._dev.requests == [('read', ('State', 'Status', 'value')),
+                                 ('read', 'value')]
+
+
+def test_maxhostrequests(session, create_input, monkeypatch):
+    dev = create_input(maxhostrequests=1, comtries=2)
+    limiter = nicostango.host_limiter(ADDRESS, 1)
+    held = []
+
+    def free():
+        if limiter.acquire(blocking=False):
+            limiter.release()
+            return True
+        return False
+
+    # the limit is kept during each try, but not while waiting for the next
+    dev._dev.probe = lambda: held.append(not free())
+    monkeypatch.setattr(session, 'delay', lambda secs: held.append(free()))
+    dev._dev.errors = 1
+    assert dev.read(0) == 1.5
+    assert held == [True, True, True]
+    assert free()
@@ -0,0 +1,60 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Benchmark of the local event histogramming."""
+
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip('streaming_data_types')
+pytest.importorskip('confluent_kafka')
+
+from nicos_ess.devices.datasources.event_histogram import EventHistogram
+
+session_setup = None
+
+NEVENTS = 10**6
+NBATCHES = 20
+
+
+@pytest.mark.parametrize('hist_type, num_bins, size', [
+    ('1-D TOF', 1000, (0, 0)),
+    ('2-D TOF', 500, (0, 0)),
+    ('2-D DET', 0, (1000, 1000)),
+])
+def test_event_rate(session, hist_type, num_bins, size):
+    rng = np.random.default_rng()
+    tofs = rng.integers(0, 71_000_000, NEVENTS, dtype=np.int32)
+    pixels = rng.integers(1, 1_000_001, NEVENTS, dtype=np.int32)
+    hist = EventHistogram(hist_type, (0, 71_000_000), (1, 1_000_001),
+                          num_bins, *size)
+    started = time.perf_counter()
+    for _ in range(NBATCHES):
+        hist.add_events(tofs, pixels)
+    rate = NEVENTS * NBATCHES / (time.perf_counter() - started)
+    session.log.info('%s histogram: %.1f M events/s', hist_type, rate / 1e6)
+    assert hist.total == NEVENTS * NBATCHES
+    # all types reach several 10 M events/s on current hardware
+    assert rate > 10e6
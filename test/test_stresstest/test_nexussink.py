@@ -0,0 +1,117 @@
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""Benchmark of the NeXus sink for long scans."""
+
+import os
+import time
+from os import path
+
+import pytest
+
+pytest.importorskip('h5py')
+
+import h5py
+
+from nicos import config
+from nicos.commands.scan import scan
+from nicos.nexus.elements import DetectorDataset, DeviceDataset, NXScanLink
+from nicos.nexus.nexussink import NexusSinkHandler
+
+from test.nexus.TestTemplateProvider import setTemplate
+
+session_setup = 'nexussink'
+
+NPOINTS = 1000
+
+
+@pytest.fixture
+def sinktimer(monkeypatch):
+    """Measure the time spent in the sink handler while writing points."""
+    timing = [0.]
+
+    def timed(method):
+        def wrapper(*args):
+            started = time.perf_counter()
+            try:
+                return method(*args)
+            finally:
+                timing[0] += time.perf_counter() - started
+        return wrapper
+
+    for name in ('putValues', 'putResults', 'addSubset'):
+        monkeypatch.setattr(NexusSinkHandler, name,
+                            timed(getattr(NexusSinkHandler, name)))
+    return timing
+
+
+class TestLongScan:
+
+    @pytest.fixture(scope='class', autouse=True)
+    def init_system(self, session):
+        exp = session.experiment
+        dataroot = path.join(config.nicos_root, 'testdata3')
+        if not os.path.isdir(dataroot):
+            os.makedirs(dataroot)
+        exp._setROParam('dataroot', dataroot)
+        exp._setROParam('forcescandata', True)
+        exp.new(1234, user='testuser', localcontact=exp.localcontact)
+        exp.setEnvironment([])
+        exp.setDetectors(['det'])
+
+    @pytest.mark.parametrize('params', [
+        {}, {'swmr': True}, {'asyncwrite': True},
+        {'swmr': True, 'asyncwrite': True},
+    ])
+    def test_long_scan(self, session, sinktimer, params):
+        setTemplate({
+            'entry:NXentry': {
+                'time': DetectorDataset('timer', 'float32'),
+                'mon': DetectorDataset('mon1', 'uint32'),
+                'sry': DeviceDataset('sry'),
+                'instrument:NXinstrument': {
+                    'sample:NXsample': {
+                        'name': DeviceDataset('Sample', 'samplename'),
+                    },
+                },
+            },
+            'data:NXdata': {'None': NXScanLink()},
+        })
+        exp = session.experiment
+        sink = session.getDevice('nexussink')
+        for (param, value) in params.items():
+            sink._setROParam(param, value)
+        try:
+            scan(session.getDevice('sry'), 0, 0.01, NPOINTS, t=0)
+        finally:
+            for param in params:
+                sink._setROParam(param, False)
+        # with asyncwrite, this is the time the measurement is held up
+        session.log.info('NeXus sink %s: %.3f ms per point', params,
+                         sinktimer[0] / NPOINTS * 1000)
+
+        with h5py.File(path.join(exp.datapath, 'test%sn%06d.hdf' % (
+                time.strftime('%Y'), exp.lastscan)), 'r') as fin:
+            assert len(fin['entry/sry']) == NPOINTS
+            assert len(fin['data/sry']) == NPOINTS
+            assert len(fin['entry/mon']) == NPOINTS
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# *****************************************************************************
+# NICOS, the Networked Instrument Control System of the MLZ
+# Copyright (c) 2009-2024 by the NICOS contributors (see AUTHORS)
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Module authors:
+#   Georg Brandl <g.brandl@fz-juelich.de>
+#
+# *****************************************************************************
+
+"""
+A benchmarking tool for the NICOS daemon protocol serializers.
+
+Encodes and decodes typical daemon event payloads with all available
+serializers and reports the time per event and the encoded size.
+"""
+
+import argparse
+import sys
+import time
+from os import path
+
+import numpy as np
+
+sys.path.insert(0, path.dirname(path.dirname(path.realpath(__file__))))
+
+# pylint: disable=wrong-import-position
+from nicos.protocols.daemon.classic import SERIALIZERS
+from nicos.utils import readonlydict, readonlylist
+
+
+def make_events(npoints):
+    t = time.time()
+    message = ['nicos', t, 20, 'x: moving to 1.234 mm', '', 'd3a4f0c2']
+    cache = (t, 'tas/value', '=', '[1.0, 0.0, 0.0, 5.0]')
+    datapoint = ('0f3e', [1.25, 0.5, 3.75], [t, 1.0, 1234, 567, 89.5])
+    status = ((0, 42), [
+        {'reqid': '%08x' % i, 'user': 'guest', 'name': 'scan%d.py' % i,
+         'script': 'scan(x, 0, 0.1, 51, t=1)\n' * 10}
+        for i in range(20)])
+    dataset = {
+        'uid': '0f3e', 'number': 1234, 'started': t, 'settype': 'scan',
+        'scaninfo': 'scan x 0 0.1 51',
+        'xvalueinfo': readonlylist([('x', 'mm', '%.3f', 'other')] * 3),
+        'yvalueinfo': readonlylist([('det', 'cts', '%d', 'counter')] * 5),
+        'xresults': [[0.1 * i, 0.2 * i, 0.3 * i] for i in range(npoints)],
+        'yresults': [[1.0, 1.0 * i, 1000 + i, 20 + i, 3.5]
+                     for i in range(npoints)],
+        'metainfo': readonlydict({('dev%d' % i, 'value'):
+                                  (1.5 * i, '%.3f' % (1.5 * i), 'mm', 'gen')
+                                  for i in range(200)}),
+    }
+    image = [{'uid': '0f3e', 'frame': np.random.randint(
+        0, 1000, (256, 256)).astype('<u4')}]
+    return {
+        'message': message,
+        'cache': cache,
+        'datapoint': datapoint,
+        'status': status,
+        'dataset': dataset,
+        'image': image,
+    }
+
+
+def bench(serializer, payload, count):
+    t1 = time.perf_counter()
+    for _ in range(count):
+        data = serializer.serialize_event('event', payload)
+    t2 = time.perf_counter()
+    for _ in range(count):
+        serializer.deserialize_event(data, 'event')
+    t3 = time.perf_counter()
+    return (t2 - t1) / count, (t3 - t2) / count, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the NICOS daemon protocol serializers.'
+    )
+    parser.add_argument('-n', action='store', type=int, default=1000,
+                        metavar='COUNT', help='repetitions per event')
+    parser.add_argument('-p', action='store', type=int, default=500,
+                        metavar='POINTS', help='number of points in dataset')
+    parser.add_argument('events', nargs='*', metavar='EVENT',
+                        help='events to benchmark (default all)')
+    opts = parser.parse_args()
+
+    events = make_events(opts.p)
+    names = opts.events or list(events)
+    print(f'{"event":10} {"serializer":10} {"encode [us]":>12} '
+          f'{"decode [us]":>12} {"size [B]":>10}')
+    for name in names:
+        for sername, sercls in SERIALIZERS.items():
+            try:
+                enc, dec, size = bench(sercls(), events[name], opts.n)
+            except Exception as err:
+                print(f'{name:10} {sername:10} not supported: {err}')
+                continue
+            print(f'{name:10} {sername:10} {enc * 1e6:12.1f} '
+                  f'{dec * 1e6:12.1f} {size:10d}')
+
+
+if __name__ == '__main__':
+    main()